@@ -0,0 +1,128 @@
+#!/bin/env python3
+
+# This script benchmarks the asyncio interface of the substratestack module
+# (substratestack.aio) with a local client. Export requests for a few large
+# stacks arrive at a fixed rate; as the same stack is often requested while it
+# is still being rendered, many of the requests are coalesced.
+#
+# The throughput and the latency percentiles are reported, along with the
+# largest delay of a timer running on the event loop (showing whether the
+# event loop was stalled). Latencies are measured from the moment a request
+# was due to arrive, so time spent waiting for a stalled event loop counts.
+# For comparison, the same load is also handled by calling the blocking
+# exporters directly from the coroutines.
+#
+# usage: benchmark_aio.py [requests per second] [requests] [layers]
+
+import asyncio
+import random
+import sys
+
+from substratestack import um, Ohm_cm
+from substratestack import SubstrateStack
+from substratestack import BulkLayer, OxideLayer, MetalLayer, Via, UP, DOWN
+from substratestack.aio import ExportService, render
+
+
+RATE = 40
+REQUESTS = 200
+LAYERS = 200
+STACKS = 4
+FORMATS = ['slm', 'son', 'svg']
+
+
+def build_stack(layers, epsilon_rel):
+    """Build a stack with the given number of oxide layers and a metal
+    every ten layers"""
+    stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+    for i in range(layers):
+        stack.add_oxide_layer_on_top(OxideLayer((0.1 + 0.01 * (i % 7)) * um,
+                                                epsilon_rel + 0.1 * (i % 3)))
+    for i in range(layers // 10):
+        direction = UP if i % 2 else DOWN
+        stack.add_metal_layer(MetalLayer('M%d' % i, 0.05 * um, 0.02,
+                                         direction), 10 * i + 5)
+    for i in range(layers // 10 - 1):
+        stack.add_via(Via('V%d' % i, 1.0, 0.2 * um, 0.2 * um),
+                      'M%d' % i, 'M%d' % (i + 1))
+    return stack
+
+
+async def blocking_export(stack, formats):
+    """Export without the asyncio interface, blocking the event loop"""
+    frozen = stack.freeze()
+    return dict((format, render(frozen, format, {})) for format in formats)
+
+
+async def monitor_loop(lags, interval=0.01):
+    """Record how late a timer on the event loop fires"""
+    loop = asyncio.get_running_loop()
+    while True:
+        lags.append(loop.time())
+        await asyncio.sleep(interval)
+        lags[-1] = loop.time() - lags[-1] - interval
+
+
+async def request(export, stack, arrival, latencies):
+    targets = await export(stack, FORMATS)
+    assert all(targets[format] for format in FORMATS)
+    latencies.append(asyncio.get_running_loop().time() - arrival)
+
+
+async def run(export, stacks, rate, count):
+    """Issue count requests at the given rate (per second). Returns the
+    latencies, the total time and the largest event loop delay."""
+    loop = asyncio.get_running_loop()
+    latencies = []
+    lags = []
+    monitor = asyncio.ensure_future(monitor_loop(lags))
+    start = loop.time()
+    requests = []
+    for i in range(count):
+        arrival = start + i / rate
+        if arrival > loop.time():
+            await asyncio.sleep(arrival - loop.time())
+        requests.append(asyncio.ensure_future(
+            request(export, random.choice(stacks), arrival, latencies)))
+    await asyncio.gather(*requests)
+    total = loop.time() - start
+    monitor.cancel()
+    # the last entry is the start time of a timer that did not fire yet
+    lags[-1] = loop.time() - lags[-1]
+    return latencies, total, max(lags)
+
+
+def get_percentile(values, percentile):
+    values = sorted(values)
+    index = int(round(percentile / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def report(name, latencies, total, lag):
+    print('%-9s %6.1f req/s  p50 %7.1f ms  p99 %7.1f ms  max loop lag '
+          '%7.1f ms' % (name, len(latencies) / total,
+                        get_percentile(latencies, 50) * 1000,
+                        get_percentile(latencies, 99) * 1000, lag * 1000))
+
+
+def main(rate=RATE, requests=REQUESTS, layers=LAYERS):
+    random.seed(0)
+    # a service keeps frozen stacks, which export() does not need to copy
+    stacks = [build_stack(layers, 3.7 + 0.05 * i).freeze()
+              for i in range(STACKS)]
+    print('%d requests at %d per second, %d stacks of %d layers, formats %s'
+          % (requests, rate, STACKS, layers, ', '.join(FORMATS)))
+    service = ExportService()
+    try:
+        report('aio', *asyncio.run(run(service.export, stacks, rate,
+                                       requests)))
+        print('          %d targets requested, %d rendered'
+              % (service.requests, service.renders))
+    finally:
+        service.close()
+    report('blocking', *asyncio.run(run(blocking_export, stacks, rate,
+                                        requests)))
+
+
+if __name__ == '__main__':
+    main(*[int(argument) for argument in sys.argv[1:]])
@@ -82,6 +82,7 @@ if __name__ == '__main__':
     # interfaces between oxide layers.
     # draw arguments: filename (without extension), number of pages to stretch 
     #   the substrate across, create one tall page instead of splitting the stack
+    #   and optionally the thickness scale ('linear', 'log' or 'clamped')
     stack.draw('example_nometals', pages=3, single_page=True)
 
 # Add metal layers
@@ -31,6 +31,7 @@ setup(
     name='substratestack',
     version=version,
     packages=['substratestack'],
+    scripts=['scripts/substratestack'],
     requires=['reportlab'],
     provides=['substratestack'],
     
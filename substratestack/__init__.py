@@ -20,11 +20,9 @@ export them for use in Momentum and Sonnet.
 
 from __future__ import division
 
-from reportlab.pdfgen import canvas
-from reportlab.lib import units
-
-import re
-from copy import copy
+import os
+import sys
+from bisect import bisect_left
 
 
 ## TODO: does the (Momentum) expansion of the metals (up or down) correspond to
@@ -88,6 +86,8 @@ class OxideLayer(SubstrateLayer):
         
         """
         SubstrateLayer.__init__(self, thickness, epsilon_rel, loss_tangent)
+        # the original oxide layers this layer is the merger of
+        self.merged_layers = None
 
 
 class Interface:
@@ -176,49 +176,113 @@ DOWN = -1
 UP = +1
 
 
-class SubstrateStack:
-    """Class representing a substrate stack made up of a bulk layer,
-    oxide layers, metal layers and via's.
-    
-    """
-    def __init__(self, bulk_layer):
-        """Create a new substrate with bulk_layer as the base"""
-        print("WARNING: this software comes without any warranty. ")
-        print("Any output this application generates may or may not be \n" +
-           "correct. Be sure to always verify it manually.")
-        assert isinstance(bulk_layer, BulkLayer)
-        self.oxide_layers = []
-        self.interfaces = []
-        self.metal_layers = []
-        self.vias = []
-        self.bulk_layer = bulk_layer
-        first_interface = Interface(self.bulk_layer)
-        first_interface.bottom_layer = self.bulk_layer
-        self.bulk_layer.top_interface = first_interface        
-        self.interfaces.append(first_interface)
-
-    def add_oxide_layer_on_top(self, oxide_layer):
-        """Add oxide_layer to the top of the substrate stack"""
-        assert isinstance(oxide_layer, OxideLayer)
-        bottom_interface = self.interfaces[-1]
-        bottom_interface.top_layer = oxide_layer
-        oxide_layer.bottom_interface = bottom_interface
-        top_interface = Interface(oxide_layer)
-        self.interfaces.append(top_interface)
-        oxide_layer.top_interface = top_interface
-        self.oxide_layers.append(oxide_layer)
+# number of significant digits of the numbers in deterministic exports
+DEFAULT_PRECISION = 12
+
+
+def format_float(value, precision=DEFAULT_PRECISION):
+    """Format a number canonically: rounded to precision significant digits,
+    without trailing zeros and without a negative zero. Numbers that differ
+    only by rounding errors (for example after splitting an oxide layer) are
+    formatted identically."""
+    text = '%.*g' % (precision, value)
+    if text == '-0':
+        text = '0'
+    return text
+
+
+def get_timestamp(deterministic=False):
+    """Return the date and time to record in exported files. In
+    deterministic mode, this is the time given by the SOURCE_DATE_EPOCH
+    environment variable (in seconds since the epoch), or the epoch itself
+    if it is not set."""
+    from datetime import datetime
+    if deterministic:
+        seconds = int(os.environ.get('SOURCE_DATE_EPOCH') or 0)
+        try:
+            from datetime import timezone
+        except ImportError:     # Python 2
+            return datetime.utcfromtimestamp(seconds)
+        return datetime.fromtimestamp(seconds, timezone.utc)
+    return datetime.now()
+
+
+class StackValidationError(Exception):
+    """Raised by SubstrateStackBase.validate when a stack is corrupted. The
+    problems found are listed in the problems attribute."""
+    def __init__(self, problems):
+        Exception.__init__(self, problems)
+        self.problems = problems
+
+    def __str__(self):
+        return '; '.join(self.problems)
+
+
+class ChangeSet:
+    """Class recording the changes made to a substrate stack, so that they
+    can be rolled back. A change set is created by
+    SubstrateStack.begin_changes(). All changes made through the stack's
+    methods (and set_layer_parameters) are recorded until the change set is
+    committed or rolled back. Rolling back undoes the recorded changes in
+    reverse order, so its cost is proportional to the number of changes, not
+    to the size of the stack.
+
+    A change set can be used as a context manager. Unless it was committed,
+    the changes are rolled back when leaving the with-block.
 
-    def add_metal_layer(self, metal_layer, interface_number):
-        """Add metal_layer at the interface specified by interface_number"""
-        assert isinstance(metal_layer, MetalLayer)
-        self.metal_layers.append(metal_layer)
-        interface = self.interfaces[interface_number]
-        interface.metal = metal_layer
-        if metal_layer.extend_direction == DOWN:
-            metal_layer.top_interface = interface
-        else:
-            metal_layer.bottom_interface = interface
+    """
+    def __init__(self, stack, parent=None):
+        """Start recording changes to stack. parent is the change set this
+        change set is nested in."""
+        self.stack = stack
+        self.parent = parent
+        self.undo_functions = []
+        self.active = True
+
+    def __len__(self):
+        """Return the number of recorded changes"""
+        return len(self.undo_functions)
+
+    def _close(self):
+        assert self.active, 'this change set was already closed'
+        assert self.stack._change_set is self, \
+           'a nested change set is still active'
+        self.active = False
+        self.stack._change_set = self.parent
+
+    def commit(self):
+        """Keep the recorded changes. If this change set is nested, its
+        changes become part of the enclosing change set."""
+        self._close()
+        if self.parent is not None:
+            self.parent.undo_functions.extend(self.undo_functions)
+        self.undo_functions = []
+
+    def rollback(self):
+        """Undo the recorded changes, restoring the stack to the state it was
+        in when this change set was started"""
+        self._close()
+        while self.undo_functions:
+            undo = self.undo_functions.pop()
+            undo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            self.rollback()
+        return False
+
+
+class SubstrateStackBase:
+    """Base class for substrate stacks, providing the queries and exporters
+    that do not modify the stack. It is shared by SubstrateStack and its
+    immutable snapshot, FrozenStack. Subclasses implement
+    get_standard_stack(), which returns a version of the stack in the
+    standard format (see SubstrateStack.standardize) for the exporters.
 
+    """
     def get_metal_layer_by_name(self, name):
         """Return the metal layer based on its name"""
         for metal_layer in self.metal_layers:
@@ -227,28 +291,6 @@ class SubstrateStack:
             
         return None
 
-    def add_via(self, via, metal1_name, metal2_name):
-        """Add a via between two metals, specified by their name"""
-        assert isinstance(via, Via)
-        metal1 = self.get_metal_layer_by_name(metal1_name)
-        metal2 = self.get_metal_layer_by_name(metal2_name)
-        assert metal1 and metal2
-        self.vias.append(via)
-        metal1_interface = metal1.bottom_interface or metal1.top_interface
-        metal2_interface = metal2.bottom_interface or metal2.top_interface
-        if self.get_interface_position(metal1_interface) > \
-           self.get_interface_position(metal2_interface):
-            via.top_metal = metal1
-            metal1.bottom_via = via
-            via.bottom_metal = metal2
-            metal2.top_via = via
-        else:
-            via.top_metal = metal2
-            metal2.bottom_via = via
-            via.bottom_metal = metal1
-            metal2.top_via = via
-        via._stack = self
-
     def get_via_by_top_metal(self, top_metal):
         """Return top_metal's lower via"""
         for via in self.vias:
@@ -277,7 +319,18 @@ class SubstrateStack:
             position += itf.bottom_layer.thickness
             if interface == itf:
                 return position
-        
+
+    def get_interface_positions(self):
+        """Return a list of the absolute positions (in meters) of all
+        interfaces, ordered like self.interfaces. This computes all positions
+        in a single pass over the stack."""
+        positions = []
+        position = - self.bulk_layer.thickness        # exclude bulk thickness
+        for itf in self.interfaces:
+            position += itf.bottom_layer.thickness
+            positions.append(position)
+        return positions
+
     def get_via_height(self, via):
         """Return via's height in meters"""
         if via.bottom_metal.extend_direction == UP:
@@ -306,39 +359,164 @@ class SubstrateStack:
             
         return height
     
-    def split_oxide_layer(self, position):
-        """Split the stack's oxide layers at the given absolute position"""
-        new_interface = None
-        for i, oxide_layer in enumerate(self.oxide_layers):
-            oxide_top = self.get_interface_position(oxide_layer.top_interface)
-            oxide_bottom = self.get_interface_position(
-               oxide_layer.bottom_interface)
-            if oxide_top > position and position > oxide_bottom:
-                oxide_layer.thickness = position - oxide_bottom
-                new_oxide_layer = OxideLayer(oxide_top - position,
-                                             oxide_layer.epsilon_rel,
-                                             oxide_layer.loss_tangent)
-                new_interface = Interface(oxide_layer, new_oxide_layer)
-                self.interfaces.insert(
-                   self.get_interface_number(oxide_layer.top_interface),
-                   new_interface)
-                new_oxide_layer.bottom_interface = new_interface
-                new_oxide_layer.top_interface = oxide_layer.top_interface
-                oxide_layer.top_interface.bottom_layer = new_oxide_layer
-                oxide_layer.top_interface = new_interface
-                self.oxide_layers.insert(i + 1, new_oxide_layer)
 
-        return new_interface
+    def _get_interface_index_by_position(self, position, positions):
+        """Return the index of the interface at the given absolute position,
+        looking it up in the sorted list of interface positions"""
+        float_threshold = 1e-15
+        index = bisect_left(positions, position - float_threshold)
+        if index < len(positions) and \
+           abs(positions[index] - position) < float_threshold:
+            return index
+        return None
 
     def get_interface_by_position(self, position):
         """Return the interface at the given absolute position"""
-        float_threshold = 1e-15
-        for interface in self.interfaces:
-            if abs(self.get_interface_position(interface) - position) < \
-               float_threshold:
-                return interface
+        index = self._get_interface_index_by_position(
+           position, self.get_interface_positions())
+        if index is not None:
+            return self.interfaces[index]
         return None
 
+    def get_index(self):
+        """Return a StackIndex for spatial queries on the current state of
+        the stack"""
+        from substratestack.index import StackIndex
+        return StackIndex(self)
+
+    def validate(self):
+        """Check the integrity of the stack: the links between its layers,
+        interfaces, metals and vias and their back-links, the ordering of the
+        interfaces and metals, that all thicknesses are positive and that
+        all vias have a positive height. Raises a StackValidationError
+        listing the problems found.
+
+        The components are looked up by index, so this takes a single pass
+        over the stack and is cheap enough to run before every export.
+
+        """
+        float_threshold = 1e-15
+        problems = []
+        error = problems.append
+        bulk_layer = self.bulk_layer
+        interfaces = self.interfaces
+        if len(interfaces) != len(self.oxide_layers) + 1:
+            raise StackValidationError(['%d interfaces bound %d oxide layers'
+                                        % (len(interfaces),
+                                           len(self.oxide_layers))])
+        numbers = {}
+        for number, interface in enumerate(interfaces):
+            if id(interface) in numbers:
+                error('interface %d occurs more than once' % number)
+            numbers[id(interface)] = number
+
+        if not bulk_layer.thickness > 0:
+            error('the bulk layer thickness is not positive')
+        if bulk_layer.top_interface is not interfaces[0] or \
+           interfaces[0].bottom_layer is not bulk_layer:
+            error('the bulk layer is not linked to interface 0')
+        # positions relative to the top of the bulk layer
+        positions = [0.0]
+        for i, oxide_layer in enumerate(self.oxide_layers):
+            bottom_interface = interfaces[i]
+            top_interface = interfaces[i + 1]
+            if not oxide_layer.thickness > 0:
+                error('oxide layer %d has a non-positive thickness (%g)'
+                      % (i, oxide_layer.thickness))
+            if oxide_layer.bottom_interface is not bottom_interface or \
+               bottom_interface.top_layer is not oxide_layer or \
+               oxide_layer.top_interface is not top_interface or \
+               top_interface.bottom_layer is not oxide_layer:
+                error('oxide layer %d is not linked to interfaces %d and %d'
+                      % (i, i, i + 1))
+            positions.append(positions[-1] + oxide_layer.thickness)
+        if interfaces[-1].top_layer is not None:
+            error('the top interface has a layer on top of it')
+
+        via_ids = set(id(via) for via in self.vias)
+        attached = {}       # metal -> number of the interface it is attached to
+        extents = {}        # metal -> (bottom, top) position
+        names = set()
+        for metal_layer in self.metal_layers:
+            name = metal_layer.name
+            if name in names:
+                error("metal name '%s' is used more than once" % name)
+            names.add(name)
+            if not metal_layer.thickness > 0:
+                error('metal %s has a non-positive thickness (%g)'
+                      % (name, metal_layer.thickness))
+            for via_name in ('top_via', 'bottom_via'):
+                via = getattr(metal_layer, via_name, None)
+                if via is not None and id(via) not in via_ids:
+                    error('metal %s links to via %s, which is not part of the '
+                          'stack' % (name, via.name))
+            if metal_layer.extend_direction == UP:
+                interface = metal_layer.bottom_interface
+                other_interface = metal_layer.top_interface
+            else:
+                interface = metal_layer.top_interface
+                other_interface = metal_layer.bottom_interface
+            number = numbers.get(id(interface))
+            if interface is None or number is None:
+                error('metal %s is not attached to an interface of the stack'
+                      % name)
+                continue
+            if interface.metal is not metal_layer:
+                error('interface %d does not link back to metal %s'
+                      % (number, name))
+            attached[id(metal_layer)] = number
+            thickness = metal_layer.thickness * metal_layer.extend_direction
+            bottom = min(positions[number], positions[number] + thickness)
+            top = max(positions[number], positions[number] + thickness)
+            extents[id(metal_layer)] = bottom, top
+            if bottom < - float_threshold or \
+               top > positions[-1] + float_threshold:
+                error('metal %s extends beyond the oxide layers' % name)
+            # in a simplified stack, the other boundary of a metal can be an
+            # interface that is no longer part of the stack
+            other_number = numbers.get(id(other_interface))
+            if other_interface is not None and other_number is not None and \
+               abs(positions[other_number] - positions[number] - thickness) \
+               > float_threshold:
+                error('interface %d is not a boundary of metal %s'
+                      % (other_number, name))
+        for number, interface in enumerate(interfaces):
+            metal_layer = interface.metal
+            if metal_layer is not None and \
+               attached.get(id(metal_layer)) != number:
+                error('interface %d links to metal %s, which is not attached '
+                      'to it' % (number, metal_layer.name))
+
+        for via in self.vias:
+            bottom_metal = via.bottom_metal
+            top_metal = via.top_metal
+            if id(bottom_metal) not in extents or \
+               id(top_metal) not in extents:
+                error('via %s does not connect two metals of the stack'
+                      % via.name)
+                continue
+            if getattr(bottom_metal, 'top_via', None) is not via or \
+               getattr(top_metal, 'bottom_via', None) is not via:
+                error('metals %s and %s do not link back to via %s'
+                      % (bottom_metal.name, top_metal.name, via.name))
+            if via._stack is not self:
+                error('via %s belongs to another stack' % via.name)
+            # metal boundaries closer than float_threshold coincide (like in
+            # the checks above and in standardize)
+            height = extents[id(top_metal)][0] - extents[id(bottom_metal)][1]
+            if not height > float_threshold:
+                error('via %s has a non-positive height (%g um)'
+                      % (via.name, height / um))
+        if problems:
+            raise StackValidationError(problems)
+
+    def diff(self, other, **kwargs):
+        """Return the structural differences (a StackDiff) between this stack
+        and another stack or a Momentum substrate file (given by its
+        filename). See substratestack.diff for the keyword arguments."""
+        from substratestack.diff import diff
+        return diff(self, other, **kwargs)
+
     def is_standard(self):
         """Check whether the stack is in standard format"""
         for metal_layer in self.metal_layers:
@@ -349,167 +527,49 @@ class SubstrateStack:
         
         return True
 
-    def standardize(self):
-        """Transform this substrate stack such that:
-        * there are oxide interfaces at both boundaries of all metals
-        * all metals extend up
-        
-        """
-        # create interfaces at boundaries of the metals
-        for metal_layer in self.metal_layers:
-            # metal extends down
-            if metal_layer.top_interface and not metal_layer.bottom_interface:
-                top_position = \
-                   self.get_interface_position(metal_layer.top_interface)
-                bottom_position = top_position - metal_layer.thickness
-                bottom_interface = \
-                   self.get_interface_by_position(bottom_position)
-                if bottom_interface:
-                    metal_layer.bottom_interface = bottom_interface
-                else:
-                    metal_layer.bottom_interface = \
-                       self.split_oxide_layer(bottom_position)
-            # metal extends up
-            elif metal_layer.bottom_interface and \
-               not metal_layer.top_interface:
-                bottom_position = \
-                   self.get_interface_position(metal_layer.bottom_interface)
-                top_position = bottom_position + metal_layer.thickness
-                top_interface = self.get_interface_by_position(top_position)
-                if top_interface:
-                    metal_layer.top_interface = top_interface
-                else:
-                    metal_layer.top_interface = \
-                       self.split_oxide_layer(top_position)
-                    
-        # make all metals extend up
-        for metal_layer in self.metal_layers:
-            if metal_layer.extend_direction == DOWN:
-                metal_layer.top_interface.metal = None
-                metal_layer.bottom_interface.metal = metal_layer
-                metal_layer.extend_direction = UP
-
-    def merge_oxide_layers(self, oxide_layers):
-        """Merge the given oxide layers into one equivalent layer. oxide layers
-        is a list sorted from bottom to top.
-        
-        """
-        assert len(oxide_layers) > 1
-        top_interface = oxide_layers[-1].top_interface
-        oxide_layer = oxide_layers[0]
-        bottom_interface = oxide_layer.bottom_interface
-        total_thickness = oxide_layer.thickness
-        total_epsilon_rel = oxide_layer.thickness / oxide_layer.epsilon_rel
-        total_loss_tangent = oxide_layer.thickness * oxide_layer.loss_tangent
-        insert_position = self.oxide_layers.index(oxide_layer)
-        for i, oxide_layer in enumerate(oxide_layers[1:]):
-            # the given oxide layer list should be sorted from bottom to top
-            assert oxide_layer.bottom_interface == \
-               oxide_layers[i].top_interface
-            # there should be no metal attached to the interfaces to be removed
-            assert oxide_layer.bottom_interface.metal == None
-            
-            total_thickness += oxide_layer.thickness
-            total_epsilon_rel += (oxide_layer.thickness /
-                                  oxide_layer.epsilon_rel)
-            total_loss_tangent += (oxide_layer.thickness *
-                                   oxide_layer.loss_tangent)
-            
-            self.interfaces.remove(oxide_layer.bottom_interface)
-            self.oxide_layers.remove(oxide_layer)
-        
-        self.oxide_layers.remove(oxide_layers[0])        
-        merged_oxide_layer = OxideLayer(total_thickness,
-                                        total_thickness / total_epsilon_rel,
-                                        total_loss_tangent / total_thickness)
-        merged_oxide_layer.top_interface = top_interface
-        merged_oxide_layer.bottom_interface = bottom_interface
-        top_interface.bottom_layer = merged_oxide_layer
-        bottom_interface.top_layer = merged_oxide_layer
-        self.oxide_layers.insert(insert_position, merged_oxide_layer)
-    
-    def remove_metal_layer_by_name(self, metal_layer_name):
-        """Remove the metal as specified by metal_layer_name from the stack"""
-        metal_layer = self.get_metal_layer_by_name(metal_layer_name)
-        if  metal_layer.top_interface:
-            metal_layer.top_interface.metal = None
-        if metal_layer.bottom_interface:
-            metal_layer.bottom_interface.metal = None
-        if self.get_via_by_top_metal(metal_layer):
-            via = self.get_via_by_top_metal(metal_layer)
-            self.vias.remove(via)
-        if self.get_via_by_bottom_metal(metal_layer):
-            via = self.get_via_by_bottom_metal(metal_layer)
-            self.vias.remove(via)
-        self.metal_layers.remove(metal_layer)
-
-    def simplify(self):
-        """Simplify the oxide stack such that there are no more interfaces than
-        necessary (for attaching metal layers to).
-        
-        """
-        if not self.is_standard():
-            self.standardize()
-        bottom_oxide_layer_index = \
-           self.oxide_layers.index(self.bulk_layer.top_interface.top_layer)
-        for metal_layer in self.metal_layers:
-            if isinstance(metal_layer.bottom_interface.bottom_layer,
-                          BulkLayer):
-                continue
-            top_oxide_layer_index = self.oxide_layers.index(
-               metal_layer.bottom_interface.bottom_layer)
-            self.merge_oxide_layers(self.oxide_layers
-               [bottom_oxide_layer_index:top_oxide_layer_index + 1])
-            bottom_oxide_layer_index = \
-               self.oxide_layers.index(metal_layer.bottom_interface.top_layer)
-            
-        top_oxide_layer_index = \
-           self.oxide_layers.index(self.interfaces[-1].bottom_layer)
-        self.merge_oxide_layers(self.oxide_layers
-           [bottom_oxide_layer_index:top_oxide_layer_index + 1])
-
-    def simplify2(self):
-        if not self.is_standard():
-            self.standardize()
-        bottom_oxide_layer_index = \
-           self.oxide_layers.index(self.bulk_layer.top_interface.top_layer)
-        for metal_layer in self.metal_layers:
-            top_oxide_layer_index = self.oxide_layers.index(
-               metal_layer.bottom_interface.bottom_layer)
-            print metal_layer.name, '**', \
-               self.interfaces.index(metal_layer.bottom_interface), \
-               '<<', self.interfaces.index(metal_layer.top_interface)
-            print bottom_oxide_layer_index, '<', top_oxide_layer_index
-            self.merge_oxide_layers(self.oxide_layers
-               [bottom_oxide_layer_index:top_oxide_layer_index + 1])
-            bottom_oxide_layer_index = \
-               self.oxide_layers.index(metal_layer.bottom_interface.top_layer)
-            top_oxide_layer_index = \
-               self.oxide_layers.index(metal_layer.top_interface.bottom_layer)
-            print bottom_oxide_layer_index, '<', top_oxide_layer_index
-            self.merge_oxide_layers(self.oxide_layers
-               [bottom_oxide_layer_index:top_oxide_layer_index + 1])
-            bottom_oxide_layer_index = \
-               self.oxide_layers.index(metal_layer.top_interface.top_layer)
-            
-        top_oxide_layer_index = \
-           self.oxide_layers.index(self.interfaces[-1].bottom_layer)
-        self.merge_oxide_layers(self.oxide_layers
-           [bottom_oxide_layer_index:top_oxide_layer_index + 1])
-
-    def write_momentum_substrate(self, filename, infinite_ground_plane=False):
+    def write_momentum_substrate(self, filename, infinite_ground_plane=False,
+                                 deterministic=False,
+                                 precision=DEFAULT_PRECISION):
         """Write out the substrate definition as an ADS Momentum substrate
         file
         
+        deterministic: format all numbers canonically (see format_float), so
+                       that identical stacks produce identical files
+        precision:     number of significant digits in deterministic mode
+        
         """
+        text = self.get_momentum_substrate(infinite_ground_plane,
+                                           deterministic, precision)
+        if deterministic:
+            # binary mode, so that the line endings are the same everywhere
+            f = open(filename + '.slm', 'wb')
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8')
+        else:
+            f = open(filename + '.slm', 'w')
+        assert f
+        f.write(text)
+        f.close()
+
+    def get_momentum_substrate(self, infinite_ground_plane=False,
+                               deterministic=False,
+                               precision=DEFAULT_PRECISION):
+        """Return the contents of the ADS Momentum substrate file for the
+        stack (see write_momentum_substrate)"""
+        if deterministic:
+            def g(value):
+                return format_float(value, precision)
+            s = g
+        else:
+            def g(value):
+                return '%g' % value
+            s = str
         last_metal_above = 1
         last_via_inside = 0
-        f = open(filename + '.slm', 'w')
-        assert f
-        if not self.is_standard():
-            self.standardize()
-        y = self.bulk_layer.thickness + self.get_stack_height()
-        for met in self.metal_layers:
+        self.validate()
+        stack = self.get_standard_stack()
+        y = stack.bulk_layer.thickness + stack.get_stack_height()
+        for met in stack.metal_layers:
             y -= met.thickness
         text = []
         text.append("VERSION 100")
@@ -520,25 +580,25 @@ class SubstrateStack:
             text.append("BOTTOM 1 1 0 0")
         else:
             text.append("BOTTOM 1 0 0 0")
-        text.append("SUB0 TOP 1 1 0 0 1 0 -1 %g %g 1 0 3" % (y, y))
-        self.oxide_layers.reverse()
+        text.append("SUB0 TOP 1 1 0 0 1 0 -1 %s %s 1 0 3" % (g(y), g(y)))
+        oxide_layers = stack.oxide_layers[::-1]
         metal_text = []
         metal_number = 1
-        for i, oxide_layer in enumerate(self.oxide_layers):
+        for i, oxide_layer in enumerate(oxide_layers):
             metal = oxide_layer.bottom_interface.metal
             if metal:
                 assert metal.extend_direction == UP
                 thickness = - metal.thickness
                 metal_above = 2
-                via = self.get_via_by_top_metal(metal)
+                via = stack.get_via_by_top_metal(metal)
                 sigma = metal.get_conductivity()
                 metal_text.append(
                    "MET%s %s %s 1 2 3 %s 0 Siemens/m Siemens/m 1 %s um" %
                    (str(metal_number).ljust(3), metal.name.ljust(10),
-                    str(y - (oxide_layer.thickness -
-                             metal.thickness)).ljust(12),
-                    str(sigma).ljust(16),
-                    str(metal.thickness / um).ljust(6)))
+                    s(y - (oxide_layer.thickness -
+                           metal.thickness)).ljust(12),
+                    s(sigma).ljust(16),
+                    s(metal.thickness / um).ljust(6)))
                 metal_number += 1
                 if via:
                     via_inside = 1
@@ -546,9 +606,9 @@ class SubstrateStack:
                     metal_text.append(
                        "MET%s %s %s 0 4 3 %s 0 Siemens/m Siemens/m 0 %s um" %
                        (str(metal_number).ljust(3), via.name.ljust(10),
-                        str(y - (oxide_layer.thickness -
-                                 metal.thickness)).ljust(12),
-                        str(sigma).ljust(16),
+                        s(y - (oxide_layer.thickness -
+                               metal.thickness)).ljust(12),
+                        s(sigma).ljust(16),
                         str(0).ljust(6)))
                     metal_number += 1
                 else:
@@ -559,37 +619,85 @@ class SubstrateStack:
                 via_inside = 0
 
             thickness += oxide_layer.thickness
-            text.append("SUB%d ox%d 1 %g %g 0 1 0 %g %g %g %d %d 3" % 
-               (i + 1, len(self.oxide_layers) - i, oxide_layer.epsilon_rel,
-                oxide_layer.loss_tangent, thickness / um, y - thickness, y,
-                last_metal_above, last_via_inside))
+            if deterministic and \
+               abs(thickness) < oxide_layer.thickness * 10 ** - precision:
+                # a metal as thick as the layer; drop the rounding error
+                thickness = 0.0
+            text.append("SUB%d ox%d 1 %s %s 0 1 0 %s %s %s %d %d 3" % 
+               (i + 1, len(oxide_layers) - i, g(oxide_layer.epsilon_rel),
+                g(oxide_layer.loss_tangent), g(thickness / um),
+                g(y - thickness), g(y), last_metal_above, last_via_inside))
             y -= thickness
 
             last_metal_above = metal_above
             last_via_inside = via_inside
 
-        text.append("SUB%d bulk 2 %g %g 0 1 0 %g %g %g %d 0 3" %
-           (len(self.oxide_layers) + 1, self.bulk_layer.epsilon_rel,
-            1/self.bulk_layer.resistivity, self.bulk_layer.thickness / um, 0,
-            y, last_metal_above))
+        text.append("SUB%d bulk 2 %s %s 0 1 0 %s %s %s %d 0 3" %
+           (len(oxide_layers) + 1, g(stack.bulk_layer.epsilon_rel),
+            g(1/stack.bulk_layer.resistivity),
+            g(stack.bulk_layer.thickness / um), g(0), g(y), last_metal_above))
         if not infinite_ground_plane:
             text.append("SUB%d AIR 1 1 0 0 1 0 -1 0 0 1 0 3" % 
-                        (len(self.oxide_layers) + 2))
+                        (len(oxide_layers) + 2))
         
         text += metal_text
 
-        f.write('\n'.join(text))
-        f.close()
-        self.oxide_layers.reverse()  # restore the order of oxide layers
+        return '\n'.join(text)
 
-    def write_sonnet_technology(self, filename):
-        """Write out the substrate definition as a Sonnet technology file"""
-        from datetime import datetime
-        now = datetime.now()
-        f = open(filename + '.son', 'w')
+    def write_sonnet_technology(self, filename, deterministic=False,
+                                precision=DEFAULT_PRECISION):
+        """Write out the substrate definition as a Sonnet technology file
+        
+        deterministic: format all numbers canonically (see format_float),
+                       order the metals and vias from bottom to top and use
+                       a fixed date in the header (see get_timestamp), so
+                       that identical stacks produce identical files
+        precision:     number of significant digits in deterministic mode
+        
+        """
+        text = self.get_sonnet_technology(deterministic, precision)
+        if deterministic:
+            # binary mode, so that the line endings are the same everywhere
+            f = open(filename + '.son', 'wb')
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8')
+        else:
+            f = open(filename + '.son', 'w')
         assert f
-        if not self.is_standard():
-            self.standardize()
+        f.write(text)
+        f.close()
+
+    def get_sonnet_technology(self, deterministic=False,
+                              precision=DEFAULT_PRECISION):
+        """Return the contents of the Sonnet technology file for the stack
+        (see write_sonnet_technology)"""
+        if deterministic:
+            def g(value):
+                return format_float(value, precision)
+
+            def d(value):
+                return '%d' % float(format_float(value, precision))
+        else:
+            def g(value):
+                return '%g' % value
+
+            def d(value):
+                return '%d' % value
+        now = get_timestamp(deterministic)
+        self.validate()
+        stack = self.get_standard_stack()
+        metal_layers = stack.metal_layers
+        vias = stack.vias
+        if deterministic:
+            numbers = dict((id(interface), number) for number, interface
+                           in enumerate(stack.interfaces))
+
+            def get_metal_key(metal):
+                return numbers[id(metal.bottom_interface)], metal.name
+
+            metal_layers = sorted(metal_layers, key=get_metal_key)
+            vias = sorted(vias, key=lambda via: (get_metal_key(via.top_metal),
+                                                 via.name))
         text = []
         text.append("FTYP SONPROJ 3 ! Sonnet Project File")
         text.append("VER 11.56")
@@ -614,221 +722,837 @@ class SubstrateStack:
         text.append('TMET "Lossless" 0 SUP 0 0 0 0')
         text.append('BMET "Lossless" 0 SUP 0 0 0 0')
 
-        self.oxide_layers.reverse()
+        oxide_layers = stack.oxide_layers[::-1]
         metal_index = 0  # TODO: this is more than just an index
-        for metal in self.metal_layers:
+        for metal in metal_layers:
             metal_index += 1
             sigma = metal.get_conductivity()
-            text.append('MET "%s" %d TMM %d 0 %g' % (metal.name, metal_index,
-                                                     sigma,
-                                                     metal.thickness / um))
+            text.append('MET "%s" %d TMM %s 0 %s' % (metal.name, metal_index,
+                                                     d(sigma),
+                                                     g(metal.thickness / um)))
 
-        for via in self.vias:
+        for via in vias:
             metal_index += 1
             sigma = via.get_conductivity()
-            height = self.get_via_height(via)
-            text.append('MET "%s" %d NOR %d 0 %g' % (via.name, metal_index,
-                                                     sigma, height / um))
+            height = stack.get_via_height(via)
+            text.append('MET "%s" %d NOR %s 0 %s' % (via.name, metal_index,
+                                                     d(sigma), g(height / um)))
 
-        text.append("BOX %d 4064 4064 32 32 20 0" % (len(self.oxide_layers) +
-                                                     1))
+        text.append("BOX %d 4064 4064 32 32 20 0" % (len(oxide_layers) + 1))
         # air layer
-        text.append('      %g %g 1 %g 0 %g 0 "%s"' %
-           (500, 1.0, 0.0, 0.0, "air"))
-        for i, oxide_layer in enumerate(self.oxide_layers):
+        text.append('      %s %s 1 %s 0 %s 0 "%s"' %
+           (g(500), g(1.0), g(0.0), g(0.0), "air"))
+        for i, oxide_layer in enumerate(oxide_layers):
             thickness = oxide_layer.thickness / um
             if thickness == 0:
                 thickness = 1e-9
-            text.append('      %g %g 1 %g 0 0 0 "%s"' % (thickness,
-               oxide_layer.epsilon_rel, oxide_layer.loss_tangent, "oxide"))
-
-        bulk = self.bulk_layer
-        text.append('      %g %g 1 %g 0 %g 0 "%s"' % (bulk.thickness / um,
-                                                      bulk.epsilon_rel,
-                                                      bulk.loss_tangent,
-                                                      1.0 / bulk.resistivity,
+            text.append('      %s %s 1 %s 0 0 0 "%s"' % (g(thickness),
+               g(oxide_layer.epsilon_rel), g(oxide_layer.loss_tangent),
+               "oxide"))
+
+        bulk = stack.bulk_layer
+        text.append('      %s %s 1 %s 0 %s 0 "%s"' % (g(bulk.thickness / um),
+                                                      g(bulk.epsilon_rel),
+                                                      g(bulk.loss_tangent),
+                                                      g(1.0 / bulk.resistivity),
                                                       "bulk"))
         
         text.append("NUM 0")
         text.append("END GEO")
 
-        f.write('\n'.join(text))
-        f.close()
-        self.oxide_layers.reverse()
+        return '\n'.join(text)
 
-    def draw(self, filename, pages=3, single_page=True):
+    def draw(self, filename, pages=3, single_page=True, scale='linear',
+             min_height=4.0, deterministic=False):
         """Render a representation of the stack to a PDF file.
         
         filename:    should not include the pdf extension
         pages:       indicates the number of pages the stack should be tall
-        single_page: render a single tall page or split up the stack
+        single_page: render a single tall page or split up the stack over
+                     A4 pages, starting with the top of the stack. On the
+                     'clamped' scale, more pages are added when needed to
+                     draw every layer min_height high.
+        scale:       'linear' draws layers proportional to their thickness,
+                     'log' on a logarithmic scale and 'clamped' linearly
+                     but no thinner than min_height (mm), so that thin layers
+                     remain legible
+        deterministic: omit the creation date and the random document ID,
+                     so that identical stacks produce identical files
         
         """
-        if not single_page:
-            from warnings import warn
-            warn('The single_page option is ignored for the time being.')
+        from substratestack.pdf import write_pdf
+        self.validate()
+        write_pdf(self, filename + '.pdf', pages, single_page, scale,
+                  min_height, deterministic)
+
+    def draw_svg(self, file, height=267, scale='linear', min_height=4.0):
+        """Render a representation of the stack to an SVG image, written to
+        the file-like object file. Unlike draw, this does not require
+        reportlab.
         
-        # positions for labels and boxes
-        x1 = 0
-        x2 = 160
-        x_space = 2
-        x_thickness = 95
-        x_eps = 135
-        x_interface_number = 7
-        x_interface_number2 = 15
-        x_metal_offset = 15
-        x_metal_width = 60
-        x_via_width = 40
+        height:      height of the stack in the image (in mm)
+        scale:       the thickness scale, see draw
         
-        from reportlab.lib.pagesizes import letter, A4
-        paper = A4
-        fontsize = 10
-        font = 'Times'
-        regular_font = font + '-Roman'
-        bold_font = font + '-Bold'
+        """
+        from substratestack.render import write_svg
+        self.validate()
+        write_svg(self, file, height, scale, min_height)
+
+    def draw_text(self, file, width=30):
+        """Write a plain text representation of the stack to the file-like
+        object file"""
+        from substratestack.render import write_text
+        self.validate()
+        write_text(self, file, width)
+
+
+# the warning is only printed for the first stack created by the process
+_warning_shown = False
+
+
+class SubstrateStack(SubstrateStackBase):
+    """Class representing a substrate stack made up of a bulk layer,
+    oxide layers, metal layers and via's.
+    
+    """
+    def __init__(self, bulk_layer):
+        """Create a new substrate with bulk_layer as the base"""
+        global _warning_shown
+        if not _warning_shown:
+            sys.stderr.write("WARNING: this software comes without any "
+                             "warranty.\nAny output this application "
+                             "generates may or may not be correct. Be sure "
+                             "to always verify it manually.\n")
+            _warning_shown = True
+        assert isinstance(bulk_layer, BulkLayer)
+        self.oxide_layers = []
+        self.interfaces = []
+        self.metal_layers = []
+        self.vias = []
+        self.bulk_layer = bulk_layer
+        first_interface = Interface(self.bulk_layer)
+        first_interface.bottom_layer = self.bulk_layer
+        self.bulk_layer.top_interface = first_interface        
+        self.interfaces.append(first_interface)
+        self._change_set = None
+        self._simplified = False
+
+    def begin_changes(self):
+        """Start recording the changes made to the stack in a new ChangeSet.
+        The changes can then be committed or rolled back. Change sets can be
+        nested.
+
+        """
+        self._change_set = ChangeSet(self, self._change_set)
+        return self._change_set
+
+    def _record(self, undo):
+        """Record the function that undoes a change in the active change
+        set"""
+        if self._change_set is not None:
+            self._change_set.undo_functions.append(undo)
+
+    def _set(self, obj, name, value):
+        """Set an attribute of one of the stack's components"""
+        if self._change_set is not None:
+            if hasattr(obj, name):
+                old_value = getattr(obj, name)
+                self._record(lambda: setattr(obj, name, old_value))
+            else:
+                self._record(lambda: delattr(obj, name))
+        setattr(obj, name, value)
+
+    def _append(self, items, item):
+        """Append item to one of the stack's lists"""
+        items.append(item)
+        self._record(items.pop)
+
+    def _insert(self, items, index, item):
+        """Insert item into one of the stack's lists"""
+        items.insert(index, item)
+        self._record(lambda: items.pop(index))
+
+    def _remove(self, items, item):
+        """Remove item from one of the stack's lists"""
+        index = items.index(item)
+        del items[index]
+        self._record(lambda: items.insert(index, item))
+
+    def _replace(self, items, start, end, new_items):
+        """Replace a slice of one of the stack's lists by new_items"""
+        old_items = items[start:end]
+        items[start:end] = new_items
+        stop = start + len(new_items)
+        def undo():
+            items[start:stop] = old_items
+        self._record(undo)
+
+    def set_layer_parameters(self, layer, **parameters):
+        """Change parameters (such as thickness or epsilon_rel) of one of
+        the stack's oxide layers, metal layers or vias. Unlike assigning the
+        attributes directly, this records the change in the active change
+        set.
+
+        """
+        for name, value in parameters.items():
+            self._set(layer, name, value)
+            if name in ('thickness', 'epsilon_rel', 'loss_tangent') and \
+                    getattr(layer, 'merged_layers', None):
+                # the original layers no longer add up to this layer
+                self._set(layer, 'merged_layers', None)
+
+    def freeze(self):
+        """Return an immutable snapshot of the stack's current state (see
+        FrozenStack)"""
+        return FrozenStack(self)
+
+    def add_oxide_layer_on_top(self, oxide_layer):
+        """Add oxide_layer to the top of the substrate stack"""
+        assert isinstance(oxide_layer, OxideLayer)
+        bottom_interface = self.interfaces[-1]
+        self._set(bottom_interface, 'top_layer', oxide_layer)
+        self._set(oxide_layer, 'bottom_interface', bottom_interface)
+        top_interface = Interface(oxide_layer)
+        self._append(self.interfaces, top_interface)
+        self._set(oxide_layer, 'top_interface', top_interface)
+        self._append(self.oxide_layers, oxide_layer)
+        if self._simplified:
+            self._resimplify(bottom_interface)
+
+    def add_metal_layer(self, metal_layer, interface_number):
+        """Add metal_layer at the interface specified by interface_number. If
+        the stack was simplified, interface_number refers to the interfaces of
+        the simplified stack.
+
+        """
+        assert isinstance(metal_layer, MetalLayer)
+        self._append(self.metal_layers, metal_layer)
+        interface = self.interfaces[interface_number]
+        self._set(interface, 'metal', metal_layer)
+        if metal_layer.extend_direction == DOWN:
+            self._set(metal_layer, 'top_interface', interface)
+        else:
+            self._set(metal_layer, 'bottom_interface', interface)
+        if self._simplified:
+            self._resimplify(interface, metal_layer)
+
+    def add_via(self, via, metal1_name, metal2_name):
+        """Add a via between two metals, specified by their name"""
+        assert isinstance(via, Via)
+        metal1 = self.get_metal_layer_by_name(metal1_name)
+        metal2 = self.get_metal_layer_by_name(metal2_name)
+        assert metal1 and metal2
+        self._append(self.vias, via)
+        metal1_interface = metal1.bottom_interface or metal1.top_interface
+        metal2_interface = metal2.bottom_interface or metal2.top_interface
+        if self.get_interface_position(metal1_interface) > \
+           self.get_interface_position(metal2_interface):
+            self._set(via, 'top_metal', metal1)
+            self._set(metal1, 'bottom_via', via)
+            self._set(via, 'bottom_metal', metal2)
+            self._set(metal2, 'top_via', via)
+        else:
+            self._set(via, 'top_metal', metal2)
+            self._set(metal2, 'bottom_via', via)
+            self._set(via, 'bottom_metal', metal1)
+            self._set(metal1, 'top_via', via)
+        self._set(via, '_stack', self)
+
+    def split_oxide_layer(self, position):
+        """Split the stack's oxide layers at the given absolute position"""
+        positions = self.get_interface_positions()
+        index = bisect_left(positions, position)
+        if 0 < index < len(positions) and position < positions[index]:
+            return self._split_oxide_layer(index - 1, position, positions)
+        return None
+
+    def _split_oxide_layer(self, index, position, positions, first=0):
+        """Split the oxide layer at index in self.oxide_layers at the given
+        position. positions holds the positions of the interfaces, starting
+        from the interface numbered first, and is updated to include the new
+        interface.
+
+        """
+        oxide_layer = self.oxide_layers[index]
+        oxide_bottom = positions[index - first]
+        oxide_top = positions[index - first + 1]
+        self._set(oxide_layer, 'thickness', position - oxide_bottom)
+        if oxide_layer.merged_layers:
+            # the original layers no longer add up to this layer
+            self._set(oxide_layer, 'merged_layers', None)
+        new_oxide_layer = OxideLayer(oxide_top - position,
+                                     oxide_layer.epsilon_rel,
+                                     oxide_layer.loss_tangent)
+        new_interface = Interface(oxide_layer, new_oxide_layer)
+        self._insert(self.interfaces, index + 1, new_interface)
+        positions.insert(index - first + 1, position)
+        new_oxide_layer.bottom_interface = new_interface
+        new_oxide_layer.top_interface = oxide_layer.top_interface
+        self._set(oxide_layer.top_interface, 'bottom_layer', new_oxide_layer)
+        self._set(oxide_layer, 'top_interface', new_interface)
+        self._insert(self.oxide_layers, index + 1, new_oxide_layer)
+        return new_interface
+
+    def _get_or_create_interface(self, position, positions, first=0):
+        """Return the interface at position, splitting an oxide layer if there
+        is no interface at this position yet. positions holds the positions
+        of the interfaces, starting from the interface numbered first."""
+        index = self._get_interface_index_by_position(position, positions)
+        if index is not None:
+            return self.interfaces[first + index]
+        index = bisect_left(positions, position)
+        if 0 < index < len(positions):
+            return self._split_oxide_layer(first + index - 1, position,
+                                           positions, first)
+        return None
+
+    def standardize(self):
+        """Transform this substrate stack such that:
+        * there are oxide interfaces at both boundaries of all metals
+        * all metals extend up
         
-        stack_height = self.get_stack_height()
-        top_interface = self.oxide_layers[-1].top_interface
-        total_interfaces = self.get_interface_number(top_interface)
-        page_height = pages * paper[1]
-        height_padding = 30 * units.mm
-        canvas_height = page_height - height_padding
-        factor = canvas_height / units.mm / stack_height
-        escape = ('_', )
-        #canvas_pages = []
+        """
+        # the interfaces are sorted on their position, so interfaces and the
+        # oxide layers they bound can be looked up by bisecting the positions
+        positions = self.get_interface_positions()
+        interface_positions = dict((id(interface), position)
+                                   for interface, position
+                                   in zip(self.interfaces, positions))
+        for metal_layer in self.metal_layers:
+            interface = metal_layer.bottom_interface or \
+                        metal_layer.top_interface
+            self._standardize_metal_layer(metal_layer,
+                                          interface_positions[id(interface)],
+                                          positions)
+
+    def _standardize_metal_layer(self, metal_layer, position, positions,
+                                 first=0):
+        """Create the missing interface at the boundary of metal_layer and
+        make it extend up. position is the position of the interface the
+        metal is attached to, positions those of the interfaces starting from
+        the interface numbered first.
+
+        """
+        # metal extends down
+        if metal_layer.top_interface and not metal_layer.bottom_interface:
+            bottom_position = position - metal_layer.thickness
+            self._set(metal_layer, 'bottom_interface',
+                      self._get_or_create_interface(bottom_position,
+                                                    positions, first))
+        # metal extends up
+        elif metal_layer.bottom_interface and not metal_layer.top_interface:
+            top_position = position + metal_layer.thickness
+            self._set(metal_layer, 'top_interface',
+                      self._get_or_create_interface(top_position,
+                                                    positions, first))
+
+        if metal_layer.extend_direction == DOWN:
+            self._set(metal_layer.top_interface, 'metal', None)
+            self._set(metal_layer.bottom_interface, 'metal', metal_layer)
+            self._set(metal_layer, 'extend_direction', UP)
+
+    def get_standard_stack(self):
+        """Standardize this stack if it is not in the standard format yet and
+        return it"""
+        if not self.is_standard():
+            self.standardize()
+        return self
+
+    def merge_oxide_layers(self, oxide_layers, index=None):
+        """Merge the given oxide layers into one equivalent layer. oxide layers
+        is a list sorted from bottom to top. index is the position of the
+        first of these in self.oxide_layers; it is looked up if not given.
         
-        file = open(filename + '.pdf', 'w')
-        c = canvas.Canvas(file, (paper[0], page_height))
-        c.translate(25 * units.mm, height_padding / 2)
-        c.setFont(regular_font, fontsize)
-        c.setStrokeGray(0.0)
-        c.setLineWidth(0.3 * units.mm)
-        y = 0
-
-        def draw_oxide(oxide_layer, y):
-            oxide_thickness = oxide_layer.thickness * factor
-            fill_color = 1.0 - oxide_layer.epsilon_rel/20.0
-            c.setFillGray(fill_color)
-            c.rect(x1 * units.mm, y * units.mm,
-                   (x2 - x1) * units.mm,  oxide_thickness * units.mm,
-                   stroke=1, fill=1)
-            c.setFillGray(0.0)
-            c.drawString(x_thickness * units.mm,
-                         (y + oxide_thickness / 2) * units.mm - fontsize / 2,
-                         u'd = %g \u03bcm (%g kA)' % (oxide_layer.thickness / um,
-                                                oxide_layer.thickness / kA))
-            c.drawString(x_eps * units.mm,
-                         (y + oxide_thickness / 2) * units.mm - fontsize / 2,
-                         u'\u03b5r = %g' % (oxide_layer.epsilon_rel, ))
+        """
+        assert len(oxide_layers) > 1
+        top_interface = oxide_layers[-1].top_interface
+        oxide_layer = oxide_layers[0]
+        bottom_interface = oxide_layer.bottom_interface
+        total_thickness = oxide_layer.thickness
+        total_epsilon_rel = oxide_layer.thickness / oxide_layer.epsilon_rel
+        total_loss_tangent = oxide_layer.thickness * oxide_layer.loss_tangent
+        if index is None:
+            index = self.oxide_layers.index(oxide_layer)
+        assert self.oxide_layers[index] is oxide_layer
+        insert_position = index
+        for i, oxide_layer in enumerate(oxide_layers[1:]):
+            # the given oxide layer list should be sorted from bottom to top
+            assert oxide_layer.bottom_interface == \
+               oxide_layers[i].top_interface
+            # there should be no metal attached to the interfaces to be removed
+            assert oxide_layer.bottom_interface.metal == None
             
-            return oxide_thickness
+            total_thickness += oxide_layer.thickness
+            total_epsilon_rel += (oxide_layer.thickness /
+                                  oxide_layer.epsilon_rel)
+            total_loss_tangent += (oxide_layer.thickness *
+                                   oxide_layer.loss_tangent)
+
+        # the oxide layers (and the interfaces between them) are consecutive
+        end_position = insert_position + len(oxide_layers)
+        assert self.oxide_layers[end_position - 1] is oxide_layers[-1]
+        merged_oxide_layer = OxideLayer(total_thickness,
+                                        total_thickness / total_epsilon_rel,
+                                        total_loss_tangent / total_thickness)
+        merged_oxide_layer.top_interface = top_interface
+        merged_oxide_layer.bottom_interface = bottom_interface
+        merged_oxide_layer.merged_layers = []
+        for oxide_layer in oxide_layers:
+            merged_oxide_layer.merged_layers.extend(oxide_layer.merged_layers
+                                                    or [oxide_layer])
+        self._replace(self.interfaces, insert_position + 1, end_position, [])
+        self._replace(self.oxide_layers, insert_position, end_position,
+                      [merged_oxide_layer])
+        self._set(top_interface, 'bottom_layer', merged_oxide_layer)
+        self._set(bottom_interface, 'top_layer', merged_oxide_layer)
+
+    def _unmerge_oxide_layer(self, index):
+        """Replace the merged oxide layer at index in self.oxide_layers by
+        the original oxide layers it was merged from. Returns the number of
+        oxide layers that were added to the stack."""
+        merged_oxide_layer = self.oxide_layers[index]
+        oxide_layers = merged_oxide_layer.merged_layers
+        if not oxide_layers:
+            return 0
+        interfaces = [oxide_layer.top_interface
+                      for oxide_layer in oxide_layers[:-1]]
+        self._replace(self.oxide_layers, index, index + 1, oxide_layers)
+        self._replace(self.interfaces, index + 1, index + 1, interfaces)
+        self._set(merged_oxide_layer.bottom_interface, 'top_layer',
+                  oxide_layers[0])
+        self._set(merged_oxide_layer.top_interface, 'bottom_layer',
+                  oxide_layers[-1])
+        return len(oxide_layers) - 1
+
+    def _merge_oxide_groups(self, first, last):
+        """Merge the oxide layers between the interfaces numbered first and
+        last, such that only the interfaces with a metal attached remain"""
+        groups = []
+        start = first
+        for number in range(first + 1, last + 1):
+            if number == last or self.interfaces[number].metal:
+                groups.append((start, number))
+                start = number
+        for start, end in reversed(groups):
+            if end - start > 1:
+                self.merge_oxide_layers(self.oxide_layers[start:end], start)
+
+    def _resimplify(self, interface, metal_layer=None):
+        """Restore the simplified form of the stack after an edit at
+        interface. Only the merged layers between the nearest interfaces
+        below and above the edit that keep a metal attached are affected.
+        metal_layer is the metal that was just added at interface, if any.
+
+        """
+        float_threshold = 1e-15
+        below = above = 0
+        moving = None       # the interface a down-extending metal leaves
+        if metal_layer:
+            if metal_layer.extend_direction == DOWN:
+                below = metal_layer.thickness
+                moving = interface
+            else:
+                above = metal_layer.thickness
+
+        def is_boundary(interface):
+            return interface.metal and interface is not moving
+
+        number = self.get_interface_number(interface)
+        first = number
+        offset = 0
+        while first > 0:
+            if is_boundary(self.interfaces[first]) and \
+               offset <= float_threshold - below:
+                break
+            first -= 1
+            offset -= self.oxide_layers[first].thickness
+        last = number
+        offset = 0
+        while last < len(self.interfaces) - 1:
+            if is_boundary(self.interfaces[last]) and \
+               offset >= above - float_threshold:
+                break
+            offset += self.oxide_layers[last].thickness
+            last += 1
+
+        for index in range(last - 1, first - 1, -1):
+            last += self._unmerge_oxide_layer(index)
+        if metal_layer:
+            positions = [0.0]
+            for oxide_layer in self.oxide_layers[first:last]:
+                positions.append(positions[-1] + oxide_layer.thickness)
+            position = positions[self.get_interface_number(interface) - first]
+            self._standardize_metal_layer(metal_layer, position, positions,
+                                          first)
+            last = first + len(positions) - 1
+        self._merge_oxide_groups(first, last)
+
+    def remove_metal_layer_by_name(self, metal_layer_name):
+        """Remove the metal as specified by metal_layer_name from the stack"""
+        metal_layer = self.get_metal_layer_by_name(metal_layer_name)
+        # an interface bounding this metal can have another metal attached
+        for interface in (metal_layer.top_interface,
+                          metal_layer.bottom_interface):
+            if interface and interface.metal is metal_layer:
+                self._set(interface, 'metal', None)
+        if self.get_via_by_top_metal(metal_layer):
+            via = self.get_via_by_top_metal(metal_layer)
+            self._set(via.bottom_metal, 'top_via', None)
+            self._remove(self.vias, via)
+        if self.get_via_by_bottom_metal(metal_layer):
+            via = self.get_via_by_bottom_metal(metal_layer)
+            self._set(via.top_metal, 'bottom_via', None)
+            self._remove(self.vias, via)
+        self._remove(self.metal_layers, metal_layer)
+        if self._simplified:
+            self._resimplify(metal_layer.bottom_interface)
+
+    def simplify(self):
+        """Simplify the oxide stack such that there are no more interfaces than
+        necessary (for attaching metal layers to).
+
+        The stack remains simplified when it is edited afterwards: adding
+        oxide layers, metals or vias and removing metals only re-merges the
+        oxide layers between the metals surrounding the edit.
         
-        def draw_interface(interface, y):
-            # interface numbers
-            number = self.get_interface_number(interface)
-            c.drawRightString((x1 - x_interface_number - x_space) * units.mm,
-                              y * units.mm - fontsize / 2,
-                              '%d' % (number, ))
-            c.drawRightString((x1 - x_interface_number2 - x_space) * units.mm,
-                              y * units.mm - fontsize / 2,
-                              '%d' % (total_interfaces - number, ))
-            c.line((x1 - x_interface_number) * units.mm, y * units.mm,
-                   x1 * units.mm, y * units.mm)
-
-            # interface position
-            c.line(x2 * units.mm, y * units.mm,
-                   (x2 + x_interface_number / 2) * units.mm, y * units.mm)
-            c.drawString((x2 + x_interface_number / 2 + x_space) * units.mm,
-                         y * units.mm - fontsize / 2,
-                         u'%g \u03bcm' % (self.get_interface_position(interface) / um, ))
+        """
+        if not self.is_standard():
+            self.standardize()
+        self._merge_oxide_groups(0, len(self.interfaces) - 1)
+        self._set(self, '_simplified', True)
+
+    def simplify2(self):
+        if not self.is_standard():
+            self.standardize()
+        bottom_oxide_layer_index = \
+           self.oxide_layers.index(self.bulk_layer.top_interface.top_layer)
+        for metal_layer in self.metal_layers:
+            top_oxide_layer_index = self.oxide_layers.index(
+               metal_layer.bottom_interface.bottom_layer)
+            print('%s ** %d << %d'
+                  % (metal_layer.name,
+                     self.interfaces.index(metal_layer.bottom_interface),
+                     self.interfaces.index(metal_layer.top_interface)))
+            print('%d < %d' % (bottom_oxide_layer_index,
+                               top_oxide_layer_index))
+            self.merge_oxide_layers(self.oxide_layers
+               [bottom_oxide_layer_index:top_oxide_layer_index + 1])
+            bottom_oxide_layer_index = \
+               self.oxide_layers.index(metal_layer.bottom_interface.top_layer)
+            top_oxide_layer_index = \
+               self.oxide_layers.index(metal_layer.top_interface.bottom_layer)
+            print('%d < %d' % (bottom_oxide_layer_index,
+                               top_oxide_layer_index))
+            self.merge_oxide_layers(self.oxide_layers
+               [bottom_oxide_layer_index:top_oxide_layer_index + 1])
+            bottom_oxide_layer_index = \
+               self.oxide_layers.index(metal_layer.top_interface.top_layer)
+            
+        top_oxide_layer_index = \
+           self.oxide_layers.index(self.interfaces[-1].bottom_layer)
+        self.merge_oxide_layers(self.oxide_layers
+           [bottom_oxide_layer_index:top_oxide_layer_index + 1])
+
+
+class Frozen:
+    """Mixin class for the components of a FrozenStack. Once sealed, their
+    attributes can no longer be assigned or deleted.
+
+    """
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_sealed'):
+            raise AttributeError("'%s' object is frozen" %
+                                 self.__class__.__name__)
+        self.__dict__[name] = value
+
+    def __delattr__(self, name):
+        if self.__dict__.get('_sealed'):
+            raise AttributeError("'%s' object is frozen" %
+                                 self.__class__.__name__)
+        del self.__dict__[name]
+
+    def _seal(self):
+        """Make this object immutable"""
+        self.__dict__['_sealed'] = True
+
+
+class FrozenBulkLayer(Frozen, BulkLayer):
+    """Immutable copy of a bulk layer"""
+    thawed_class = BulkLayer
 
-        for oxide_layer in self.oxide_layers:
-            bottom_interface = oxide_layer.bottom_interface
-            oxide_thickness = oxide_layer.thickness * factor
-            draw_oxide(oxide_layer, y)
-            draw_interface(bottom_interface, y)
-            y += oxide_thickness
-
-        top_interface = oxide_layer.top_interface
-        draw_interface(top_interface, y)
-
-#        canvas_pages.append(c)
-
-        def draw_metal(metal_layer):
-            extend_direction = metal_layer.extend_direction
-            metal_thickness = metal_layer.thickness * factor
-            c.setFillColorRGB(*metal_color)
-            c.rect((x1 + x_metal_offset) * units.mm,y * units.mm,
-                   x_metal_width * units.mm,
-                   (extend_direction * metal_thickness) * units.mm,
-                   stroke=1, fill=1)
-            center = (x1 + x_metal_offset + x_metal_width / 2.0,
-                      y + extend_direction * metal_thickness / 2.0)
-            text = (metal_layer.name,
-                    u'd = %g \u03bcm (%g kA)' % (metal_layer.thickness / um,
-                                           metal_layer.thickness / kA),
-                    u'\u03c3 = %.3g S/m' % metal_layer.get_conductivity(),
-                    u'Rsheet = %g m\u2126/\u25a1' %
-                    (metal_layer.sheet_resistance / mOhm_sq))
-            c.setFillGray(0.0)
-            current_y = center[1] * units.mm + (len(text) / 2 - 0.5) * fontsize
-            for i, line in enumerate(text):
-                if i == 0:
-                    c.saveState()
-                    c.setFont(bold_font, fontsize)
-                c.drawCentredString(center[0] * units.mm, current_y, line)
-                if i == 0:
-                    c.restoreState()
-                current_y -= fontsize
-                       
-        def draw_via(via, metal, y):
-            extend_direction = metal.extend_direction
-            metal_thickness = metal.thickness * factor
-            via_height = self.get_via_height(via) * factor
-            y_top_of_metal = max(y, y + extend_direction * metal_thickness)
-            #print y + extend_direction * metal_thickness, y_top_of_metal
-            x = x1 + x_metal_offset + (x_metal_width - x_via_width) / 2
-            c.setFillColorRGB(*via_color)
-            c.rect(x * units.mm, y_top_of_metal * units.mm,
-                   x_via_width * units.mm, via_height * units.mm,
-                   stroke=1, fill=1)
-            center = (x1 + x_metal_offset + x_metal_width / 2.0,
-                      y + via_height / 2.0)
-            if extend_direction == UP:
-                center = (center[0], center[1] + metal_thickness)
-            text = (via.name,
-                    u'h = %g \u03bcm (%g kA)' % (via.get_height() / um,
-                                           via.get_height() / kA),
-                    u'\u03c3eq = %.3g S/m' % via.get_conductivity(),
-                    u'R = %g \u2126' % (via.resistance),
-                    'via fill = %.4g %%' % (via.fill * 100))
-            c.setFillGray(0.0)
-            current_y = center[1] * units.mm + (len(text) / 2 - 0.5) * fontsize
-            for i, line in enumerate(text):
-                if i == 0:
-                    c.saveState()
-                    c.setFont(bold_font, fontsize)
-                c.drawCentredString(center[0] * units.mm, current_y, line)
-                if i == 0:
-                    c.restoreState()
-                current_y -= fontsize
-
-        # draw metals
-        y = 0
-        metal_color = (0.5, 0.8, 1.0)
-        via_color = (0.8, 0.8, 1.0)
-        for oxide_layer in self.oxide_layers:
-            metal = oxide_layer.bottom_interface.metal
-            oxide_thickness = oxide_layer.thickness * factor
-            if metal:
-                draw_metal(metal)
-                via = self.get_via_by_bottom_metal(metal)
-                if via:
-                    draw_via(via, metal, y)
 
-            y += oxide_thickness
+class FrozenOxideLayer(Frozen, OxideLayer):
+    """Immutable copy of an oxide layer"""
+    thawed_class = OxideLayer
 
-        c.showPage()
-        c.save()
-        file.close()
-        return
+
+class FrozenInterface(Frozen, Interface):
+    """Immutable copy of an interface"""
+    thawed_class = Interface
+
+
+class FrozenMetalLayer(Frozen, MetalLayer):
+    """Immutable copy of a metal layer"""
+    thawed_class = MetalLayer
+
+
+class FrozenVia(Frozen, Via):
+    """Immutable copy of a via"""
+    thawed_class = Via
+
+
+FROZEN_CLASSES = ((BulkLayer, FrozenBulkLayer),
+                  (OxideLayer, FrozenOxideLayer),
+                  (Interface, FrozenInterface),
+                  (MetalLayer, FrozenMetalLayer),
+                  (Via, FrozenVia))
+
+# attributes that link the components of a stack to each other
+LINK_ATTRIBUTES = ('top_interface', 'bottom_interface', 'bottom_layer',
+                   'top_layer', 'metal', 'top_metal', 'bottom_metal',
+                   'top_via', 'bottom_via', '_stack')
+
+
+class _Empty:
+    pass
+
+
+def _create_instance(cls):
+    """Create an instance of cls without calling its constructor"""
+    instance = _Empty()
+    instance.__class__ = cls
+    return instance
+
+
+def _copy_components(source, target, freeze):
+    """Copy the components of the stack source for use in the stack target.
+    If freeze is true, the copies are frozen components, else regular ones.
+    Returns the bulk layer, the lists of oxide layers, interfaces, metal
+    layers and vias, and a list of all copies.
+
+    """
+    copies = {id(source): target}
+    components = []
+
+    def copy_component(component):
+        if freeze:
+            for cls, frozen_class in FROZEN_CLASSES:
+                if isinstance(component, cls):
+                    break
+        else:
+            frozen_class = getattr(component, 'thawed_class',
+                                   component.__class__)
+        duplicate = _create_instance(frozen_class)
+        duplicate.__dict__.update(component.__dict__)
+        duplicate.__dict__.pop('_sealed', None)
+        copies[id(component)] = duplicate
+        components.append(duplicate)
+        return duplicate
+
+    def get_copy(component):
+        if component is None or id(component) in copies:
+            return copies.get(id(component))
+        if isinstance(component, Interface):
+            # an interface that is no longer part of the stack, such as the
+            # top interface of a metal in a simplified stack
+            duplicate = copy_component(component)
+            for name in ('bottom_layer', 'top_layer', 'metal'):
+                duplicate.__dict__[name] = None
+            return duplicate
+        return None
+
+    bulk_layer = copy_component(source.bulk_layer)
+    oxide_layers = [copy_component(layer) for layer in source.oxide_layers]
+    interfaces = [copy_component(interface)
+                  for interface in source.interfaces]
+    metal_layers = [copy_component(metal) for metal in source.metal_layers]
+    vias = [copy_component(via) for via in source.vias]
+    for duplicate in list(components):
+        attributes = duplicate.__dict__
+        for name in LINK_ATTRIBUTES:
+            if name in attributes:
+                attributes[name] = get_copy(attributes[name])
+        if 'merged_layers' in attributes:
+            attributes['merged_layers'] = None
+    return bulk_layer, oxide_layers, interfaces, metal_layers, vias, components
+
+
+def _build_stack(key):
+    """Build the components of a stack from the key of a FrozenStack (see
+    FrozenStack._get_key). Returns a stack object to be frozen."""
+    (bulk_parameters, oxide_parameters, metal_parameters, via_parameters,
+     interface_metals) = key
+    stack = _create_instance(SubstrateStack)
+    stack.bulk_layer = BulkLayer(*bulk_parameters)
+    stack.interfaces = [Interface(stack.bulk_layer)]
+    stack.bulk_layer.top_interface = stack.interfaces[0]
+    stack.oxide_layers = []
+    for parameters in oxide_parameters:
+        oxide_layer = OxideLayer(*parameters)
+        oxide_layer.bottom_interface = stack.interfaces[-1]
+        stack.interfaces[-1].top_layer = oxide_layer
+        oxide_layer.top_interface = Interface(oxide_layer)
+        stack.interfaces.append(oxide_layer.top_interface)
+        stack.oxide_layers.append(oxide_layer)
+
+    def get_interface(number):
+        if number is None:
+            return None
+        elif number < 0:
+            # an interface that is no longer part of the stack
+            interface = _create_instance(Interface)
+            interface.bottom_layer = interface.top_layer = None
+            interface.metal = None
+            return interface
+        return stack.interfaces[number]
+
+    stack.metal_layers = []
+    for (name, thickness, sheet_resistance, extend_direction, bottom_number,
+         top_number) in metal_parameters:
+        metal_layer = MetalLayer(name, thickness, sheet_resistance,
+                                 extend_direction)
+        metal_layer.bottom_interface = get_interface(bottom_number)
+        metal_layer.top_interface = get_interface(top_number)
+        stack.metal_layers.append(metal_layer)
+    for interface, number in zip(stack.interfaces, interface_metals):
+        if number is not None:
+            interface.metal = stack.metal_layers[number]
+    stack.vias = []
+    for (name, resistance, width, spacing, bottom_number,
+         top_number) in via_parameters:
+        via = Via(name, resistance, width, spacing)
+        if bottom_number is not None:
+            via.bottom_metal = stack.metal_layers[bottom_number]
+            via.bottom_metal.top_via = via
+        if top_number is not None:
+            via.top_metal = stack.metal_layers[top_number]
+            via.top_metal.bottom_via = via
+        via._stack = stack
+        stack.vias.append(via)
+    stack._change_set = None
+    stack._simplified = False
+    return stack
+
+
+class FrozenStack(Frozen, SubstrateStackBase):
+    """Immutable snapshot of a substrate stack, created by
+    SubstrateStack.freeze()
+
+    The snapshot owns frozen copies of the stack's layers, interfaces, metals
+    and vias, so later changes to the stack do not affect it. Since nothing
+    in it can be modified, a snapshot can be shared between threads without
+    copying or locking. It supports all queries, exporters and draw. When
+    exported, a snapshot that is not in the standard format is standardized
+    once, and the standardized snapshot is cached.
+
+    Snapshots are hashable; two snapshots are equal if their layers, metals
+    and vias have the same parameters and are laid out the same way.
+
+    """
+    def __init__(self, stack):
+        """Create a snapshot of stack"""
+        (self.bulk_layer, oxide_layers, interfaces, metal_layers, vias,
+         components) = _copy_components(stack, self, True)
+        self.oxide_layers = tuple(oxide_layers)
+        self.interfaces = tuple(interfaces)
+        self.metal_layers = tuple(metal_layers)
+        self.vias = tuple(vias)
+        self._key = self._get_key()
+        self._hash = hash(self._key)
+        self._digest = None
+        self._standard_stack = None
+        self._valid = False
+        for component in components:
+            component._seal()
+        self._seal()
+
+    def _get_key(self):
+        """Return a tuple describing the parameters and the layout of the
+        stack's components"""
+        interface_numbers = dict((id(interface), i)
+                                 for i, interface in enumerate(self.interfaces))
+        metal_numbers = dict((id(metal), i)
+                             for i, metal in enumerate(self.metal_layers))
+
+        def get_interface_number(interface):
+            if interface is None:
+                return None
+            return interface_numbers.get(id(interface), -1)
+
+        bulk = self.bulk_layer
+        return ((bulk.thickness, bulk.epsilon_rel, bulk.resistivity,
+                 bulk.loss_tangent),
+                tuple((layer.thickness, layer.epsilon_rel, layer.loss_tangent)
+                      for layer in self.oxide_layers),
+                tuple((metal.name, metal.thickness, metal.sheet_resistance,
+                       metal.extend_direction,
+                       get_interface_number(metal.bottom_interface),
+                       get_interface_number(metal.top_interface))
+                      for metal in self.metal_layers),
+                tuple((via.name, via.resistance, via.width, via.spacing,
+                       metal_numbers.get(id(via.bottom_metal)),
+                       metal_numbers.get(id(via.top_metal)))
+                      for via in self.vias),
+                tuple(metal_numbers.get(id(interface.metal))
+                      for interface in self.interfaces))
+
+    def __getstate__(self):
+        """Pickle the snapshot as its key, which is flat (unlike the linked
+        components, which can exceed the recursion limit of pickle)"""
+        return self._key
+
+    def __setstate__(self, key):
+        """Rebuild the snapshot from its key"""
+        FrozenStack.__init__(self, _build_stack(key))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenStack) and self._key == other._key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def digest(self):
+        """Return a hexadecimal digest of the snapshot's contents that is
+        stable across processes (unlike its hash). As a snapshot cannot
+        change, it is only computed once."""
+        if self._digest is None:
+            import hashlib
+            self.__dict__['_digest'] = \
+               hashlib.sha1(repr(self._key).encode('utf-8')).hexdigest()
+        return self._digest
+
+    def freeze(self):
+        """Return this snapshot"""
+        return self
+
+    def validate(self):
+        """Check the integrity of the snapshot (see
+        SubstrateStackBase.validate). As a snapshot cannot change, it is
+        only checked once."""
+        if not self._valid:
+            SubstrateStackBase.validate(self)
+            self.__dict__['_valid'] = True
+
+    def thaw(self):
+        """Return a new SubstrateStack with the same contents as this
+        snapshot, which can be modified"""
+        stack = _create_instance(SubstrateStack)
+        (stack.bulk_layer, stack.oxide_layers, stack.interfaces,
+         stack.metal_layers, stack.vias, components) = \
+           _copy_components(self, stack, False)
+        stack._change_set = None
+        stack._simplified = False
+        return stack
+
+    def get_standard_stack(self):
+        """Return a version of this snapshot in the standard format"""
+        if self.is_standard():
+            return self
+        if self._standard_stack is None:
+            stack = self.thaw()
+            stack.standardize()
+            self.__dict__['_standard_stack'] = stack.freeze()
+        return self._standard_stack
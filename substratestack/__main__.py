@@ -0,0 +1,6 @@
+import sys
+
+from substratestack.cli import main
+
+
+sys.exit(main())
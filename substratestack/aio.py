@@ -0,0 +1,257 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""asyncio interface to the exporters (requires Python 3.7)
+
+The exporters standardize the stack and render it, which can take a long time
+for large stacks and would stall the event loop. Here, the work is done by a
+bounded pool of worker processes instead. The stacks are frozen (see
+SubstrateStack.freeze) before they are handed to the workers, so they can be
+modified again as soon as export() or stream() is called. Services that
+export the same stacks repeatedly should keep them frozen, as freezing copies
+the stack on the event loop. The frozen stacks are pickled for the workers,
+which keep the stacks they unpickled (with their standardized versions) for
+later requests.
+
+Concurrent requests for the same stack (the same frozen contents, see
+FrozenStack.digest), format and options are coalesced: the target is
+rendered once, and all requests receive the result. Nothing is cached once
+the rendering has finished. stream() yields a target in chunks once it has
+been rendered completely, as the exporters do not produce their output
+incrementally.
+
+    service = ExportService(max_workers=4)
+    targets = await service.export(stack, ['slm', 'son'])
+    async for chunk in service.stream(stack, 'svg'):
+        response.write(chunk)
+"""
+
+import asyncio
+import os
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+
+FORMATS = ('slm', 'son', 'pdf', 'svg', 'txt')
+CHUNK_SIZE = 64 * 1024
+STACK_CACHE_SIZE = 16
+
+# the keyword arguments accepted by the exporter of each format
+EXPORT_OPTIONS = {'slm': ('infinite_ground_plane', 'deterministic',
+                          'precision'),
+                  'son': ('deterministic', 'precision'),
+                  'pdf': ('pages', 'single_page', 'scale', 'min_height',
+                          'deterministic'),
+                  'svg': ('height', 'scale', 'min_height'),
+                  'txt': ('width', )}
+
+
+def get_export_options(format, options):
+    """Return the items of options that apply to format, sorted by name"""
+    return tuple(sorted((name, value) for name, value in options.items()
+                        if name in EXPORT_OPTIONS[format]))
+
+
+# the stacks rendered recently in this (worker) process, by digest
+_stacks = OrderedDict()
+
+
+def get_cached_stack(digest, data):
+    """Return the frozen stack with the given digest. If it was not rendered
+    recently by this process, it is unpickled from data."""
+    stack = _stacks.pop(digest, None)
+    if stack is None:
+        stack = pickle.loads(data)
+    _stacks[digest] = stack
+    while len(_stacks) > STACK_CACHE_SIZE:
+        _stacks.popitem(last=False)
+    return stack
+
+
+def render(stack, format, options):
+    """Render the frozen stack to format and return the contents as bytes.
+    options is a dictionary of keyword arguments for the exporter."""
+    if format == 'slm':
+        text = stack.get_momentum_substrate(**options)
+    elif format == 'son':
+        text = stack.get_sonnet_technology(**options)
+    else:
+        file = BytesIO()
+        if format == 'pdf':
+            from substratestack.pdf import write_pdf
+            stack.validate()
+            write_pdf(stack, file, **options)
+        elif format == 'svg':
+            stack.draw_svg(file, **options)
+        else:
+            stack.draw_text(file, **options)
+        return file.getvalue()
+    return text.encode('utf-8')
+
+
+def render_targets(digest, data, targets):
+    """Render the frozen stack with the given digest (pickled to data) to a
+    list of (format, options) tuples and return the list of contents. This
+    runs in a worker process."""
+    stack = get_cached_stack(digest, data)
+    return [render(stack, format, options) for format, options in targets]
+
+
+class ExportService:
+    """Renders stacks in a bounded pool of worker processes. A service should
+    only be used from a single event loop."""
+    def __init__(self, max_workers=None, executor=None,
+                 chunk_size=CHUNK_SIZE):
+        """Create a service that renders at most max_workers targets at the
+        same time (by default, as many as there are CPUs). Requests beyond
+        that wait in the event loop (where they can be cancelled) rather than
+        in the executor's queue.
+
+        executor:    the concurrent.futures executor to render in; by default
+                     a ProcessPoolExecutor with max_workers processes is
+                     created
+        chunk_size:  size of the chunks stream() yields (in bytes)
+
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers)
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self._slots = None
+        self._pending = {}      # key -> future for the target's contents
+        self.renders = 0        # number of targets rendered
+        self.requests = 0       # number of targets requested
+
+    def _get_slots(self):
+        # created on first use, so that it belongs to the running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    async def _render(self, frozen, digest, targets):
+        async with self._get_slots():
+            loop = asyncio.get_running_loop()
+            self.renders += len(targets)
+            data = pickle.dumps(frozen, pickle.HIGHEST_PROTOCOL)
+            return await loop.run_in_executor(self.executor, render_targets,
+                                              digest, data, targets)
+
+    def _get_targets(self, frozen, formats, options):
+        """Return futures for the contents of the frozen stack in each of
+        formats. Targets that are being rendered for concurrent requests are
+        shared with these; the others are rendered by a single job."""
+        for format in formats:
+            if format not in FORMATS:
+                raise ValueError("unknown format '%s'" % format)
+        for name in options:
+            if not any(name in names for names in EXPORT_OPTIONS.values()):
+                raise TypeError("unknown export option '%s'" % name)
+        digest = frozen.digest()
+        loop = asyncio.get_running_loop()
+        futures = []
+        targets = []
+        keys = []
+        for format in formats:
+            self.requests += 1
+            export_options = get_export_options(format, options)
+            key = (digest, format, export_options)
+            future = self._pending.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._pending[key] = future
+                targets.append((format, dict(export_options)))
+                keys.append(key)
+            # a cancelled request should not cancel the other requests
+            futures.append(asyncio.shield(future))
+        if targets:
+            job = asyncio.ensure_future(self._render(frozen, digest, targets))
+            job.add_done_callback(lambda job: self._finish(job, keys))
+        return futures
+
+    def _finish(self, job, keys):
+        """Pass the outcome of a rendering job on to the futures of its
+        targets"""
+        futures = [self._pending.pop(key) for key in keys]
+        if job.cancelled():
+            for future in futures:
+                future.cancel()
+        elif job.exception() is not None:
+            for future in futures:
+                future.set_exception(job.exception())
+        else:
+            for future, contents in zip(futures, job.result()):
+                future.set_result(contents)
+
+    async def export(self, stack, formats, **options):
+        """Render stack to each of the formats ('slm', 'son', 'pdf', 'svg'
+        or 'txt') and return a dictionary mapping the formats to the
+        contents (bytes). The keyword arguments are passed on to the
+        exporters that accept them (get_momentum_substrate,
+        get_sonnet_technology, substratestack.pdf.write_pdf, draw_svg and
+        draw_text; see EXPORT_OPTIONS).
+
+        """
+        futures = self._get_targets(stack.freeze(), formats, options)
+        contents = await asyncio.gather(*futures)
+        return dict(zip(formats, contents))
+
+    async def stream(self, stack, format, **options):
+        """Render stack to format and yield the contents in chunks of
+        chunk_size bytes. See export for the keyword arguments.
+
+        The exporters do not produce their output incrementally, so the
+        target is rendered completely (in a worker process) before the first
+        chunk is yielded. Streaming avoids writing out a large target at once,
+        but does not reduce the time to the first chunk.
+
+        """
+        future, = self._get_targets(stack.freeze(), [format], options)
+        contents = await future
+        for start in range(0, len(contents), self.chunk_size):
+            yield contents[start:start + self.chunk_size]
+
+    def close(self):
+        """Shut down the executor, if it was created by the service"""
+        if self._own_executor:
+            self.executor.shutdown()
+
+
+_service = None
+
+
+def get_service():
+    """Return the service used by export() and stream()"""
+    global _service
+    if _service is None:
+        _service = ExportService()
+    return _service
+
+
+async def export(stack, formats, **options):
+    """Render stack to a number of formats using the default service. See
+    ExportService.export."""
+    return await get_service().export(stack, formats, **options)
+
+
+def stream(stack, format, **options):
+    """Render stack to format using the default service and return an
+    asynchronous iterator over the chunks of the contents. See
+    ExportService.stream."""
+    return get_service().stream(stack, format, **options)
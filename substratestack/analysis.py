@@ -0,0 +1,484 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Vectorized analysis of substrate stacks
+
+The functions in this module evaluate closed-form properties of a substrate
+stack for all of its layers at once. They require NumPy.
+"""
+
+from __future__ import division
+
+import numpy
+
+from substratestack import UP, DOWN
+
+
+epsilon_0 = 8.854187817e-12 # F/m       vacuum permittivity
+
+
+def get_interface_numbers(stack):
+    """Return a dictionary mapping the id of each of stack's interfaces to
+    its index"""
+    return dict((id(interface), i)
+                for i, interface in enumerate(stack.interfaces))
+
+
+def get_merge_groups(stack):
+    """Return a list with, for each oxide layer of stack, the index of the
+    merged layer it would end up in when simplifying the stack. Oxide layers
+    are grouped between the interfaces metals are attached to.
+
+    """
+    groups = []
+    group = -1
+    for oxide_layer in stack.oxide_layers:
+        if group < 0 or oxide_layer.bottom_interface.metal:
+            group += 1
+        groups.append(group)
+    return groups
+
+
+def get_via_interfaces(stack, via, interface_numbers=None):
+    """Return the numbers of the interfaces the height of via is measured
+    from and to, and the metals whose thickness is subtracted from the
+    distance between these interfaces. interface_numbers is the (optional)
+    result of get_interface_numbers.
+
+    """
+    if interface_numbers is None:
+        interface_numbers = get_interface_numbers(stack)
+    bottom_metal = via.bottom_metal
+    top_metal = via.top_metal
+    subtracted = []
+    if bottom_metal.extend_direction == UP:
+        bottom_interface = bottom_metal.bottom_interface
+        subtracted.append(bottom_metal)
+    else:
+        bottom_interface = bottom_metal.top_interface
+    if top_metal.extend_direction == DOWN:
+        top_interface = top_metal.top_interface
+        subtracted.append(top_metal)
+    else:
+        top_interface = top_metal.bottom_interface
+    return (interface_numbers[id(bottom_interface)],
+            interface_numbers[id(top_interface)], subtracted)
+
+
+def get_via_heights(stack):
+    """Return an array holding the heights of all vias in stack"""
+    positions = stack.get_interface_positions()
+    interface_numbers = get_interface_numbers(stack)
+    heights = numpy.zeros(len(stack.vias))
+    for i, via in enumerate(stack.vias):
+        bottom, top, subtracted = get_via_interfaces(stack, via,
+                                                     interface_numbers)
+        heights[i] = positions[top] - positions[bottom]
+        for metal in subtracted:
+            heights[i] -= metal.thickness
+    return heights
+
+
+def get_standard_layers(stack):
+    """Standardize a snapshot of stack, leaving stack itself untouched.
+
+    Returns the standardized snapshot, an array holding for each of its oxide
+    layers the index of the oxide layer of stack it is part of, and an array
+    holding for each of its interfaces the number of the interface of stack
+    it moves along with. The interfaces standardizing creates at the
+    boundaries of the metals move along with the interface the metal is
+    attached to.
+
+    """
+    standard = stack.freeze().get_standard_stack()
+    float_threshold = 1e-15
+    interface_numbers = get_interface_numbers(stack)
+    anchors = {}
+    for metal, standard_metal in zip(stack.metal_layers,
+                                     standard.metal_layers):
+        if metal.extend_direction == UP:
+            anchor = metal.bottom_interface
+            boundary = standard_metal.top_interface
+        else:
+            anchor = metal.top_interface
+            boundary = standard_metal.bottom_interface
+        anchors.setdefault(id(boundary), interface_numbers[id(anchor)])
+
+    positions = stack.get_interface_positions()
+    layers = numpy.zeros(len(standard.oxide_layers), dtype=int)
+    interfaces = numpy.zeros(len(standard.interfaces), dtype=int)
+    number = 0          # the next interface of stack
+    for i, (interface, position) in enumerate(
+            zip(standard.interfaces, standard.get_interface_positions())):
+        if number < len(positions) and \
+           abs(positions[number] - position) < float_threshold:
+            interfaces[i] = number
+            number += 1
+        else:
+            interfaces[i] = anchors[id(interface)]
+        if i < len(layers):
+            layers[i] = number - 1
+    return standard, layers, interfaces
+
+
+class Sensitivities:
+    """The parameters of a simplified substrate stack and their derivatives
+    with respect to the parameters of the layers of the original stack.
+
+    Merged layer parameters are arrays indexed by merged layer (m), derivatives
+    are (m x n) matrices where n indexes oxide_layers. Via conductivities are
+    indexed by via (v) and their derivatives are (v x n) and (v x k) matrices,
+    where k indexes metal_layers.
+
+    Standardizing the stack splits oxide layers at the metal boundaries.
+    split_layers holds, for each layer of the standardized stack, the index of
+    the oxide layer it was split from and groups the merged layer it ends up
+    in.
+
+    """
+    def __init__(self, stack):
+        """Compute the parameters and derivatives for stack. The derivatives
+        are taken with respect to the parameters of stack's own layers; a
+        standardized snapshot of the stack is used for the merge, and stack
+        itself is not modified.
+
+        """
+        self.oxide_layers = list(stack.oxide_layers)
+        self.metal_layers = list(stack.metal_layers)
+        self.vias = list(stack.vias)
+        standard, self.split_layers, interfaces = get_standard_layers(stack)
+        self._compute_oxide_sensitivities(standard, interfaces)
+        self._compute_via_sensitivities(stack)
+
+    def _compute_oxide_sensitivities(self, stack, interfaces):
+        layers = stack.oxide_layers
+        t = numpy.array([layer.thickness for layer in layers], dtype=float)
+        eps = numpy.array([layer.epsilon_rel for layer in layers], dtype=float)
+        tand = numpy.array([layer.loss_tangent for layer in layers],
+                           dtype=float)
+        groups = numpy.array(get_merge_groups(stack), dtype=int)
+        self.groups = groups
+
+        # series capacitance merge, see SubstrateStack.merge_oxide_layers
+        total_thickness = numpy.bincount(groups, weights=t)
+        total_inv_eps = numpy.bincount(groups, weights=t / eps)
+        total_loss = numpy.bincount(groups, weights=t * tand)
+        self.thickness = total_thickness
+        self.epsilon_rel = total_thickness / total_inv_eps
+        self.loss_tangent = total_loss / total_thickness
+
+        # every oxide layer only affects the merged layer it belongs to
+        T = total_thickness[groups]
+        S = total_inv_eps[groups]
+        merged_eps = self.epsilon_rel[groups]
+        merged_tand = self.loss_tangent[groups]
+        m, n = len(total_thickness), len(self.oxide_layers)
+        ones = numpy.ones(len(t))
+
+        def accumulate(values, columns, width):
+            # sum the derivatives of the layers of each merge group into the
+            # (m x width) matrix, at the given column for each layer
+            return numpy.bincount(groups * width + columns,
+                                  weights=values * ones,
+                                  minlength=m * width).reshape(m, width)
+
+        # chain rule to the original layers: the split layers share their
+        # original layer's permittivity and loss tangent
+        def d_property(values):
+            return accumulate(values, self.split_layers, n)
+
+        # the position of an interface attached to interface a of the
+        # original stack depends on the thicknesses of the oxide layers below
+        # a, so a split layer depends on the oxide layers between the
+        # interfaces its own interfaces are attached to: step up at the
+        # bottom interface, down at the top one and sum along each row
+        def d_thickness(values):
+            steps = accumulate(values, interfaces[:-1], n + 1) - \
+                    accumulate(values, interfaces[1:], n + 1)
+            return steps.cumsum(axis=1)[:, :n]
+
+        self.d_thickness_d_thickness = d_thickness(1.0)
+        self.d_epsilon_rel_d_thickness = \
+           d_thickness((1 - merged_eps / eps) / S)
+        self.d_epsilon_rel_d_epsilon_rel = d_property(T * t / (S * eps)**2)
+        self.d_loss_tangent_d_thickness = \
+           d_thickness((tand - merged_tand) / T)
+        self.d_loss_tangent_d_loss_tangent = d_property(t / T)
+
+    def _compute_via_sensitivities(self, stack):
+        n_vias = len(self.vias)
+        positions = numpy.array(stack.get_interface_positions())
+        metal_numbers = dict((id(metal), i)
+                             for i, metal in enumerate(self.metal_layers))
+        bottom = numpy.zeros(n_vias, dtype=int)
+        top = numpy.zeros(n_vias, dtype=int)
+        self.d_height_d_metal_thickness = numpy.zeros((n_vias,
+                                                       len(self.metal_layers)))
+        subtracted_thickness = numpy.zeros(n_vias)
+        interface_numbers = get_interface_numbers(stack)
+        for i, via in enumerate(self.vias):
+            bottom[i], top[i], subtracted = get_via_interfaces(
+               stack, via, interface_numbers)
+            for metal in subtracted:
+                self.d_height_d_metal_thickness[i, metal_numbers[id(metal)]] \
+                   = -1.0
+                subtracted_thickness[i] += metal.thickness
+
+        resistance = numpy.array([via.resistance for via in self.vias],
+                                 dtype=float)
+        width = numpy.array([via.width for via in self.vias], dtype=float)
+        spacing = numpy.array([via.spacing for via in self.vias], dtype=float)
+        fill = width**2 / (width + spacing)**2
+        height = positions[top] - positions[bottom] - subtracted_thickness
+        self.via_height = height
+        self.via_conductivity = height * fill / (resistance * width**2)
+
+        # interface j sits on top of oxide layer j - 1
+        columns = numpy.arange(len(self.oxide_layers))
+        self.d_height_d_thickness = ((columns >= bottom[:, None]) &
+                                     (columns < top[:, None])).astype(float)
+        d_conductivity_d_height = (fill / (resistance * width**2))[:, None]
+        self.d_conductivity_d_thickness = (d_conductivity_d_height *
+                                           self.d_height_d_thickness)
+        self.d_conductivity_d_metal_thickness = (d_conductivity_d_height *
+            self.d_height_d_metal_thickness)
+
+
+def get_sensitivities(stack):
+    """Return the Sensitivities of the simplified version of stack. The stack
+    itself is not modified.
+
+    """
+    return Sensitivities(stack)
+
+
+class ViaFarmModel:
+    """Batched via model that evaluates the equivalent conductivity of all
+    vias in a substrate stack over grids of via width, spacing and resistance.
+    The via heights are determined once, when the model is created.
+
+    """
+    def __init__(self, stack):
+        """Create a via farm model for the vias in stack"""
+        self.vias = list(stack.vias)
+        self.heights = get_via_heights(stack)
+
+    def get_conductivity(self, widths, spacings, resistances):
+        """Return the equivalent conductivity of each via for each
+        combination of the given widths, spacings and resistances (per via)
+        as a (vias x widths x spacings x resistances) array.
+
+        """
+        widths = numpy.asarray(widths, dtype=float)
+        spacings = numpy.asarray(spacings, dtype=float)
+        resistances = numpy.asarray(resistances, dtype=float)
+        # the fill factor cancels the via area: see Via.get_resistivity
+        pitch = (widths[:, None] + spacings[None, :])**2
+        grid = 1.0 / (pitch[:, :, None] * resistances[None, None, :])
+        return self.heights[:, None, None, None] * grid[None, :, :, :]
+
+    def find_closest(self, target, widths, spacings, resistances, count=1):
+        """Evaluate the conductivity grid and look up the via configurations
+        whose equivalent conductivity lies closest to target. target is
+        either a single conductivity or one conductivity per via. Closeness is
+        measured on a logarithmic scale.
+
+        Returns the conductivity grid and, for each via, a list of the count
+        closest (width, spacing, resistance, conductivity) tuples, the closest
+        first.
+
+        """
+        widths = numpy.asarray(widths, dtype=float)
+        spacings = numpy.asarray(spacings, dtype=float)
+        resistances = numpy.asarray(resistances, dtype=float)
+        grid = self.get_conductivity(widths, spacings, resistances)
+        target = numpy.resize(numpy.asarray(target, dtype=float),
+                              len(self.vias))
+        flat = grid.reshape(len(self.vias), -1)
+        distance = numpy.abs(numpy.log(flat / target[:, None]))
+        count = min(count, flat.shape[1])
+        if count < flat.shape[1]:
+            candidates = numpy.argpartition(distance, count - 1,
+                                            axis=1)[:, :count]
+        else:
+            candidates = numpy.tile(numpy.arange(flat.shape[1]),
+                                    (len(self.vias), 1))
+        rows = numpy.arange(len(self.vias))[:, None]
+        order = numpy.argsort(distance[rows, candidates], axis=1)
+        closest = candidates[rows, order]
+        w, s, r = numpy.unravel_index(closest, grid.shape[1:])
+        configurations = []
+        for i in range(len(self.vias)):
+            configurations.append(list(zip(widths[w[i]], spacings[s[i]],
+                                           resistances[r[i]],
+                                           flat[i, closest[i]])))
+        return grid, configurations
+
+
+def get_metal_extents(stack, interface_numbers=None):
+    """Return two arrays holding the absolute positions of the bottom and top
+    of each of stack's metal layers"""
+    if interface_numbers is None:
+        interface_numbers = get_interface_numbers(stack)
+    positions = stack.get_interface_positions()
+    bottom = numpy.zeros(len(stack.metal_layers))
+    top = numpy.zeros(len(stack.metal_layers))
+    for i, metal in enumerate(stack.metal_layers):
+        if metal.extend_direction == UP:
+            bottom[i] = positions[interface_numbers[id(metal.bottom_interface)]]
+            top[i] = bottom[i] + metal.thickness
+        else:
+            top[i] = positions[interface_numbers[id(metal.top_interface)]]
+            bottom[i] = top[i] - metal.thickness
+    return bottom, top
+
+
+def get_extraction_table(stack):
+    """Return a table of per-unit-area capacitances and series resistances
+    for the metals in stack, sorted from bottom to top. The table is a
+    dictionary mapping column names to arrays with one entry per metal:
+
+    metal:                       metal layer names
+    bottom, top:                 positions of the metal's surfaces (m)
+    capacitance_to_bulk:         capacitance to the top of the bulk (F/m^2)
+    capacitance_to_metal_below:  capacitance to the next lower metal (F/m^2)
+    sheet_resistance:            metal sheet resistance (Ohm/sq)
+    via_below:                   name of the via to the next lower metal
+    via_resistance:              resistance of a single via (Ohm)
+    via_area_resistance:         resistance of a via farm of unit area
+                                 (Ohm*m^2)
+
+    The oxide between two positions is treated as a series connection of
+    parallel-plate capacitors. All metals are handled in a single pass over
+    the prefix sums of the oxide layers' thickness to permittivity ratios.
+    Entries that do not apply are NaN (or None for via_below).
+
+    """
+    positions = numpy.array(stack.get_interface_positions())
+    thickness = numpy.array([layer.thickness for layer in stack.oxide_layers],
+                            dtype=float)
+    epsilon_rel = numpy.array([layer.epsilon_rel
+                               for layer in stack.oxide_layers], dtype=float)
+    # elastance of the oxide between the bulk and each of the interfaces
+    elastance = numpy.concatenate(([0.0],
+                                   numpy.cumsum(thickness / epsilon_rel)))
+
+    def get_elastance(z):
+        layer = numpy.searchsorted(positions, z, side='right') - 1
+        layer = numpy.clip(layer, 0, len(thickness) - 1)
+        return elastance[layer] + (z - positions[layer]) / epsilon_rel[layer]
+
+    bottom, top = get_metal_extents(stack)
+    order = numpy.argsort(bottom, kind='mergesort')
+    metals = [stack.metal_layers[i] for i in order]
+    bottom = bottom[order]
+    top = top[order]
+    bottom_elastance = get_elastance(bottom)
+    top_elastance = get_elastance(top)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        capacitance_to_bulk = numpy.where(bottom_elastance > 0,
+                                          epsilon_0 / bottom_elastance,
+                                          numpy.nan)
+        gap = bottom_elastance[1:] - top_elastance[:-1]
+        capacitance_to_metal_below = numpy.concatenate(
+           ([numpy.nan], numpy.where(gap > 0, epsilon_0 / gap, numpy.nan)))
+
+    vias_by_top_metal = dict((id(via.top_metal), via) for via in stack.vias)
+    via_below = [None] * len(metals)
+    via_resistance = numpy.empty(len(metals))
+    via_resistance.fill(numpy.nan)
+    via_area_resistance = via_resistance.copy()
+    for i in range(1, len(metals)):
+        via = vias_by_top_metal.get(id(metals[i]))
+        if via and via.bottom_metal is metals[i - 1]:
+            via_below[i] = via.name
+            via_resistance[i] = via.resistance
+            via_area_resistance[i] = via.resistance * (via.width +
+                                                       via.spacing)**2
+
+    return {'metal': [metal.name for metal in metals],
+            'bottom': bottom,
+            'top': top,
+            'capacitance_to_bulk': capacitance_to_bulk,
+            'capacitance_to_metal_below': capacitance_to_metal_below,
+            'sheet_resistance': numpy.array([metal.sheet_resistance
+                                             for metal in metals],
+                                            dtype=float),
+            'via_below': via_below,
+            'via_resistance': via_resistance,
+            'via_area_resistance': via_area_resistance}
+
+
+class PermittivitySweep:
+    """The complex relative permittivity of the layers of a substrate stack
+    and of the merged layers of its simplified version over a frequency
+    sweep.
+
+    The rows of epsilon hold the bulk followed by the oxide layers, the rows
+    of merged_epsilon hold the bulk followed by the merged oxide layers, both
+    from bottom to top. The columns correspond to the frequencies.
+
+    The merge is performed on a standardized snapshot of the stack;
+    split_layers and groups are as in Sensitivities.
+
+    """
+    def __init__(self, stack, frequencies, bulk_loss_tangent=True):
+        """Evaluate the permittivities of stack at the given frequencies (in
+        Hz). The conductivity of the bulk is always taken into account; its
+        dielectric loss tangent only if bulk_loss_tangent is true (Sonnet
+        uses both, Momentum only the bulk resistivity). The stack itself is
+        not modified.
+
+        """
+        standard, self.split_layers = get_standard_layers(stack)[:2]
+        self.frequencies = numpy.asarray(frequencies, dtype=float)
+        self.layers = [stack.bulk_layer] + list(stack.oxide_layers)
+        bulk = stack.bulk_layer
+        epsilon_rel = numpy.array([layer.epsilon_rel for layer in self.layers],
+                                  dtype=float)
+        loss_tangent = numpy.array([layer.loss_tangent
+                                    for layer in self.layers], dtype=float)
+        if not bulk_loss_tangent:
+            loss_tangent[0] = 0.0
+        conductivity = numpy.zeros(len(self.layers))
+        conductivity[0] = 1.0 / bulk.resistivity
+
+        omega = 2 * numpy.pi * self.frequencies
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            conduction = conductivity[:, None] / (omega[None, :] * epsilon_0)
+        self.epsilon = (epsilon_rel * (1 - 1j * loss_tangent))[:, None] - \
+                       1j * conduction
+
+        # series connection of the (split) layers in each merge group
+        groups = numpy.array(get_merge_groups(standard), dtype=int)
+        self.groups = groups
+        oxide_epsilon = self.epsilon[1:][self.split_layers]
+        oxide_thickness = numpy.array([layer.thickness
+                                       for layer in standard.oxide_layers],
+                                      dtype=float)
+        merged = [self.epsilon[:1]]
+        if len(groups):
+            starts = numpy.flatnonzero(numpy.diff(numpy.concatenate(([-1],
+                                                                     groups))))
+            total_thickness = numpy.add.reduceat(oxide_thickness, starts)
+            elastance = numpy.add.reduceat(
+               oxide_thickness[:, None] / oxide_epsilon, starts, axis=0)
+            merged.append(total_thickness[:, None] / elastance)
+        self.merged_epsilon = numpy.concatenate(merged)
+
+
+def get_permittivity_sweep(stack, frequencies, bulk_loss_tangent=True):
+    """Return the PermittivitySweep of stack for the given frequencies"""
+    return PermittivitySweep(stack, frequencies, bulk_loss_tangent)
@@ -0,0 +1,433 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""The substratestack command line tool
+
+A stack definition file is a Python script that builds one or more stacks,
+like the scripts in the examples directory. Each stack bound to a
+module-level name is exported; the stack named 'stack' is written to files
+named after the definition file, others to <definition>_<name>.<ext>.
+
+Exports are skipped when the stack's canonical contents and the export
+options are unchanged since the target was last written. The content hashes
+are stored in a cache file in the output directory.
+"""
+
+import os
+import sys
+import time
+from glob import glob
+from optparse import OptionParser
+
+
+FORMATS = ('slm', 'son', 'pdf')
+CACHE_FILENAME = '.substratestack-cache'
+
+
+def load_definition(filename):
+    """Execute a stack definition file and return a list of (name, stack)
+    tuples for the stacks it defines and the list of files it depends on
+    (itself and the modules it imports from its directory)"""
+    import runpy
+    from substratestack import SubstrateStackBase
+    directory = os.path.dirname(os.path.abspath(filename))
+    modules = set(sys.modules)
+    # allow definitions to import each other, like the examples do
+    sys.path.insert(0, directory)
+    try:
+        namespace = runpy.run_path(filename, run_name='__substratestack__')
+    finally:
+        sys.path.remove(directory)
+        # forget the imported definitions, so that they are executed afresh
+        # the next time (definitions can modify stacks they import)
+        dependencies = [os.path.abspath(filename)]
+        for name in set(sys.modules) - modules:
+            module_file = getattr(sys.modules[name], '__file__', None)
+            if module_file and os.path.dirname(os.path.abspath(module_file)) \
+                    == directory:
+                del sys.modules[name]
+                source = os.path.splitext(os.path.abspath(module_file))[0]
+                dependencies.append(source + '.py')
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    stacks = []
+    for name, value in sorted(namespace.items()):
+        if isinstance(value, SubstrateStackBase):
+            if name != 'stack':
+                stem_name = '%s_%s' % (stem, name)
+            else:
+                stem_name = stem
+            stacks.append((stem_name, value))
+    return stacks, dependencies
+
+
+def get_output_directory(filename, options):
+    """Return the directory the targets for definition filename go to"""
+    return options.output_dir or os.path.dirname(os.path.abspath(filename))
+
+
+def get_export_options(format, options):
+    """Return a string representing the options that affect the output of
+    format"""
+    if options.deterministic:
+        deterministic = ',deterministic,precision=%d' % options.precision
+    else:
+        deterministic = ''
+    if format == 'slm':
+        return ('infinite_ground_plane=%s' % options.infinite_ground_plane
+                + deterministic)
+    elif format == 'pdf':
+        return ('pages=%d,scale=%s' % (options.pages, options.scale)
+                + (',deterministic' if options.deterministic else ''))
+    return deterministic.lstrip(',')
+
+
+def export(stack, format, basename, options):
+    """Write stack to basename + '.' + format"""
+    if format == 'slm':
+        stack.write_momentum_substrate(basename,
+                                       options.infinite_ground_plane,
+                                       options.deterministic,
+                                       options.precision)
+    elif format == 'son':
+        stack.write_sonnet_technology(basename, options.deterministic,
+                                      options.precision)
+    else:
+        stack.draw(basename, options.pages, True, options.scale,
+                   deterministic=options.deterministic)
+
+
+def get_target_key(digest, format, options):
+    """Return the content hash identifying a target's contents"""
+    import hashlib
+    from substratestack import __version__
+    key = '%s %s %s %s' % (digest, format, get_export_options(format, options),
+                           __version__)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def is_up_to_date(target, key, cache):
+    """Check whether target was written from content with the given key and
+    has not been modified since"""
+    entry = cache.get(target)
+    if entry is None or entry['key'] != key or not os.path.exists(target):
+        return False
+    status = os.stat(target)
+    return (entry['size'] == status.st_size and
+            entry['mtime'] == status.st_mtime)
+
+
+def convert(arguments, frozen_stacks=None):
+    """Export the stacks defined in a definition file to the requested
+    formats. Returns a (filename, messages, errors, cache entries, timings,
+    dependencies) tuple; timings is a list of (phase, seconds) tuples.
+
+    frozen_stacks: optional dictionary mapping digests to the frozen stacks
+                 of an earlier conversion of the definition. Stacks that did
+                 not change are exported from these, so that their
+                 standardized versions are reused. On success, the
+                 dictionary is updated to hold the stacks of this conversion.
+
+    """
+    filename, options, cache = arguments
+    messages = []
+    errors = []
+    entries = {}
+    timings = []
+    dependencies = [os.path.abspath(filename)]
+
+    def timed(phase, function, *args):
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            timings.append((phase, time.time() - start))
+
+    try:
+        stacks, dependencies = timed('load', load_definition, filename)
+        if not stacks:
+            errors.append('%s: no stacks defined' % filename)
+        directory = get_output_directory(filename, options)
+        current = {}
+        for name, stack in stacks:
+            # export a snapshot, so that exports (which standardize the stack)
+            # do not affect each other
+            frozen = timed('hash', stack.freeze)
+            digest = timed('hash', frozen.digest)
+            if frozen_stacks is not None:
+                frozen = current[digest] = frozen_stacks.get(digest, frozen)
+            basename = os.path.join(directory, name)
+            for format in options.formats:
+                target = basename + '.' + format
+                key = get_target_key(digest, format, options)
+                if not options.force and is_up_to_date(target, key, cache):
+                    messages.append('%s is up to date' % target)
+                    continue
+                timed(format, export, frozen, format, basename, options)
+                status = os.stat(target)
+                entries[target] = {'key': key, 'size': status.st_size,
+                                   'mtime': status.st_mtime}
+                messages.append('wrote %s' % target)
+        if frozen_stacks is not None:
+            frozen_stacks.clear()
+            frozen_stacks.update(current)
+    except Exception:
+        error = sys.exc_info()[1]
+        errors.append('%s: %s: %s' % (filename, error.__class__.__name__,
+                                      error))
+    return filename, messages, errors, entries, timings, dependencies
+
+
+def read_cache(directory):
+    """Read the target cache of the output directory"""
+    import json
+    try:
+        cache_file = open(os.path.join(directory, CACHE_FILENAME))
+    except IOError:
+        return {}
+    try:
+        try:
+            return json.load(cache_file)
+        except ValueError:
+            return {}
+    finally:
+        cache_file.close()
+
+
+class CacheLock(object):
+    """Exclusive lock on the target cache of an output directory, held while
+    the cache is updated, so that concurrent runs (e.g. make -j) writing to
+    the same directory do not lose each other's entries"""
+    def __init__(self, directory):
+        self.filename = os.path.join(directory, CACHE_FILENAME + '.lock')
+
+    def __enter__(self):
+        self.file = open(self.filename, 'a')
+        try:
+            import fcntl
+        except ImportError:     # Windows
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        # closing the file releases the lock
+        self.file.close()
+
+
+def update_cache(directory, entries):
+    """Merge entries into the target cache of the output directory and return
+    the updated cache. The cache file is re-read and replaced atomically
+    while holding the cache lock."""
+    import json
+    from tempfile import mkstemp
+    replace = getattr(os, 'replace', os.rename)     # Python < 3.3
+    filename = os.path.join(directory, CACHE_FILENAME)
+    with CacheLock(directory):
+        cache = read_cache(directory)
+        cache.update(entries)
+        handle, temporary = mkstemp(prefix=CACHE_FILENAME + '.',
+                                    dir=directory)
+        try:
+            cache_file = os.fdopen(handle, 'w')
+            try:
+                json.dump(cache, cache_file, indent=1, sort_keys=True)
+            finally:
+                cache_file.close()
+            # mkstemp creates the file readable by the owner only; give it
+            # the permissions of a regularly created file instead
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temporary, 0o666 & ~umask)
+            replace(temporary, filename)
+        except:
+            os.remove(temporary)
+            raise
+    return cache
+
+
+def expand_filenames(patterns):
+    """Expand the glob patterns in the list of filenames. Returns the list of
+    files and a list of patterns that did not match any file."""
+    filenames = []
+    unmatched = []
+    for pattern in patterns:
+        matches = sorted(glob(pattern))
+        if not matches:
+            unmatched.append(pattern)
+        for filename in matches:
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames, unmatched
+
+
+def handle_results(results, caches, options):
+    """Print the messages and errors of a number of conversions and store
+    their cache entries. Returns False if any of the conversions failed."""
+    success = True
+    updated = {}            # directory -> new cache entries
+    for filename, messages, errors, entries, timings, dependencies \
+            in results:
+        if options.verbose:
+            for message in messages:
+                print(message)
+        for error in errors:
+            sys.stderr.write(error + '\n')
+            success = False
+        if entries:
+            directory = get_output_directory(filename, options)
+            updated.setdefault(directory, {}).update(entries)
+    for directory, entries in updated.items():
+        caches[directory] = update_cache(directory, entries)
+    return success
+
+
+def get_parser():
+    parser = OptionParser(usage='%prog [options] DEFINITION...',
+                          description='Export the substrate stacks defined '
+                                      'in the given definition files (glob '
+                                      'patterns are accepted).')
+    parser.add_option('-f', '--format', action='append', dest='formats',
+                      metavar='FORMAT',
+                      help='output format: slm, son or pdf (can be given '
+                           'multiple times or as a comma-separated list; '
+                           'default: slm,son)')
+    parser.add_option('-o', '--output-dir', metavar='DIRECTORY',
+                      help='write the targets to DIRECTORY instead of next to '
+                           'the definition files')
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of definition files to process in '
+                           'parallel')
+    parser.add_option('--force', action='store_true', default=False,
+                      help='write the targets even if they are up to date')
+    parser.add_option('--infinite-ground-plane', action='store_true',
+                      default=False,
+                      help='terminate the Momentum substrate with an '
+                           'infinite ground plane')
+    parser.add_option('--pages', type='int', default=3,
+                      help='height of the PDF drawing in pages (default: 3)')
+    parser.add_option('--scale', default='linear',
+                      choices=['linear', 'log', 'clamped'],
+                      help='thickness scale of the PDF drawing: linear, log '
+                           'or clamped (default: linear)')
+    parser.add_option('-d', '--deterministic', action='store_true',
+                      default=False,
+                      help='write byte-identical files for identical stacks: '
+                           'format numbers canonically and use a fixed date '
+                           '(SOURCE_DATE_EPOCH, if set)')
+    parser.add_option('--precision', type='int', default=12,
+                      help='number of significant digits of the numbers in '
+                           'deterministic mode (default: 12)')
+    parser.add_option('-v', '--verbose', action='store_true', default=False,
+                      help='report the targets written and skipped')
+    parser.add_option('--profile', action='store_true', default=False,
+                      help='print the time spent in each phase')
+    parser.add_option('-w', '--watch', action='store_true', default=False,
+                      help='keep running, and re-export the stacks whenever '
+                           'their definition files change')
+    parser.add_option('--polling', action='store_true', default=False,
+                      help='watch by polling instead of using inotify')
+    return parser
+
+
+def get_formats(values):
+    """Parse the values passed to the --format option"""
+    formats = []
+    for value in values or ['slm,son']:
+        for format in value.split(','):
+            format = format.strip().lower().lstrip('.')
+            if format not in FORMATS:
+                raise ValueError("unknown format '%s'" % format)
+            if format not in formats:
+                formats.append(format)
+    return formats
+
+
+def print_profile(results, total):
+    """Print the per-phase timings of the conversions to stderr. total is the
+    total wall clock time."""
+    totals = {}
+    write = sys.stderr.write
+    for filename, messages, errors, entries, timings, dependencies \
+            in results:
+        phases = {}
+        for phase, seconds in timings:
+            phases[phase] = phases.get(phase, 0) + seconds
+            totals[phase] = totals.get(phase, 0) + seconds
+        write('%s: %s\n' % (filename, format_phases(phases)))
+    write('total: %s, wall %.1f ms\n' % (format_phases(totals), total * 1000))
+
+
+def format_phases(phases):
+    order = ('load', 'hash') + FORMATS
+    return ', '.join('%s %.1f ms' % (phase, phases[phase] * 1000)
+                     for phase in order if phase in phases)
+
+
+def main(arguments=None):
+    """Run the command line tool; returns the exit status"""
+    start = time.time()
+    parser = get_parser()
+    options, patterns = parser.parse_args(arguments)
+    if not patterns:
+        parser.error('no definition files given')
+    try:
+        options.formats = get_formats(options.formats)
+    except ValueError:
+        parser.error(str(sys.exc_info()[1]))
+    if options.output_dir and not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    filenames, unmatched = expand_filenames(patterns)
+    status = 0
+    for pattern in unmatched:
+        sys.stderr.write('%s: no such file\n' % pattern)
+        status = 1
+
+    caches = {}
+    for filename in filenames:
+        directory = get_output_directory(filename, options)
+        if directory not in caches:
+            caches[directory] = read_cache(directory)
+    jobs = [(filename, options,
+             caches[get_output_directory(filename, options)])
+            for filename in filenames]
+    # watch mode keeps the frozen stacks of each definition in memory
+    frozen_stacks = dict((filename, {} if options.watch else None)
+                         for filename in filenames)
+    if options.jobs > 1 and len(jobs) > 1:
+        from multiprocessing import Pool
+        pool = Pool(options.jobs)
+        try:
+            results = pool.map(convert, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [convert(job, frozen_stacks[job[0]]) for job in jobs]
+
+    if not handle_results(results, caches, options):
+        status = 1
+
+    if options.profile:
+        print_profile(results, time.time() - start)
+    if options.watch:
+        from substratestack.watch import watch
+        try:
+            watch(results, caches, options, frozen_stacks)
+        except KeyboardInterrupt:
+            pass
+    return status
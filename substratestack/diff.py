@@ -0,0 +1,414 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Structural differences between substrate stacks
+
+Two stacks (or a stack and a Momentum substrate file) are first reduced to
+a Structure: a list of layers with their parameters, the positions of the
+interfaces between them, and the metals and vias by name. Metals present in
+both structures anchor the alignment of the layers; the layers in between
+two anchors are compared one by one if their number did not change, or by the
+position of their interfaces otherwise. This keeps the comparison linear in
+the size of the stacks.
+"""
+
+from __future__ import division
+
+import hashlib
+from bisect import bisect_left
+from math import isinf
+
+from substratestack import um, SubstrateStackBase
+
+
+class Structure:
+    """Flattened description of a stack for comparison
+
+    layers:      list of (name, parameters) tuples, from bottom to top
+    boundaries:  positions of the interfaces bounding the layers
+    items:       dictionary mapping the names of the bulk layer, metals and
+                 vias to their parameters
+    anchors:     dictionary mapping metal names to the index of the interface
+                 (in boundaries) they are located at
+
+    """
+    def __init__(self, layers, boundaries, items, anchors):
+        self.layers = layers
+        self.boundaries = boundaries
+        self.items = items
+        self.anchors = anchors
+
+
+def get_stack_structure(stack):
+    """Return the Structure of the standard form of stack"""
+    stack = stack.get_standard_stack()
+    positions = stack.get_interface_positions()
+    numbers = dict((id(interface), i)
+                   for i, interface in enumerate(stack.interfaces))
+    layers = [('oxide %d' % (i + 1),
+               {'thickness': oxide_layer.thickness,
+                'epsilon_rel': oxide_layer.epsilon_rel,
+                'loss_tangent': oxide_layer.loss_tangent})
+              for i, oxide_layer in enumerate(stack.oxide_layers)]
+    bulk = stack.bulk_layer
+    items = {'bulk': {'thickness': bulk.thickness,
+                      'epsilon_rel': bulk.epsilon_rel,
+                      'resistivity': bulk.resistivity,
+                      'loss_tangent': bulk.loss_tangent}}
+    anchors = {}
+    for metal_layer in stack.metal_layers:
+        number = numbers[id(metal_layer.bottom_interface)]
+        anchors[metal_layer.name] = number
+        items[metal_layer.name] = {
+            'thickness': metal_layer.thickness,
+            'sheet_resistance': metal_layer.sheet_resistance}
+    for via in stack.vias:
+        bottom = (positions[numbers[id(via.bottom_metal.bottom_interface)]] +
+                  via.bottom_metal.thickness)
+        top = positions[numbers[id(via.top_metal.bottom_interface)]]
+        items[via.name] = {'resistance': via.resistance,
+                           'width': via.width,
+                           'spacing': via.spacing,
+                           'height': top - bottom,
+                           'bottom_metal': via.bottom_metal.name,
+                           'top_metal': via.top_metal.name}
+    return Structure(layers, positions, items, anchors)
+
+
+def parse_slm(text):
+    """Return the rows of a Momentum substrate file as lists of fields"""
+    return [line.split() for line in text.splitlines() if line.strip()]
+
+
+def get_slm_digest(text):
+    """Return a digest of the contents of a Momentum substrate file that
+    ignores the formatting of the numbers in it"""
+    rows = []
+    for fields in parse_slm(text):
+        row = []
+        for field in fields:
+            try:
+                field = '%.6g' % float(field)
+            except ValueError:
+                pass
+            row.append(field)
+        rows.append(row)
+    return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+
+
+def read_slm(text):
+    """Return the Structure of the contents of a Momentum substrate file"""
+    layers = []
+    boundaries = []
+    items = {}
+    metals = []
+    for fields in parse_slm(text):
+        keyword = fields[0]
+        if keyword == 'BOTTOM':
+            items['BOTTOM'] = {'plane': int(fields[2])}
+        elif keyword.startswith('SUB') and keyword[3:].isdigit():
+            name, thickness = fields[1], float(fields[8])
+            if thickness < 0:                       # TOP and AIR
+                continue
+            parameters = {'thickness': thickness * um,
+                          'epsilon_rel': float(fields[3])}
+            if fields[2] == '2':
+                parameters['conductivity'] = float(fields[4])
+                items[name] = parameters
+            else:
+                parameters['loss_tangent'] = float(fields[4])
+                parameters['metal_above'] = int(fields[11])
+                parameters['via_inside'] = int(fields[12])
+                layers.append((name, parameters))
+                boundaries.append(float(fields[10]))
+                bottom = float(fields[9])
+        elif keyword.startswith('MET') and keyword[3:].isdigit():
+            name = fields[1]
+            items[name] = {'conductivity': float(fields[6]),
+                           'thickness': float(fields[11]) * um,
+                           'type': int(fields[4]),
+                           'expansion': int(fields[10])}
+            if fields[4] == '2':
+                metals.append((name, float(fields[2])))
+    # the substrate file lists the layers from top to bottom
+    layers.reverse()
+    boundaries.reverse()
+    if layers:
+        boundaries.insert(0, bottom)
+    anchors = {}
+    for name, location in metals:
+        anchors[name] = get_boundary_index(boundaries, location)
+    return Structure(layers, boundaries, items, anchors)
+
+
+def get_boundary_index(boundaries, position):
+    """Return the index of the boundary closest to position"""
+    index = bisect_left(boundaries, position)
+    if index == len(boundaries) or (index > 0 and
+            position - boundaries[index - 1] < boundaries[index] - position):
+        index -= 1
+    return index
+
+
+def is_close(a, b, tolerance):
+    """Compare two parameter values, allowing a relative tolerance on finite
+    numbers"""
+    if a == b:
+        return True
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        if isinf(a) or isinf(b):
+            return False
+        return abs(a - b) <= tolerance * max(abs(a), abs(b))
+    return False
+
+
+def compare_parameters(a, b, tolerance):
+    """Return a dictionary mapping the names of the parameters that differ to
+    (old value, new value) tuples"""
+    changes = {}
+    for name in set(a) | set(b):
+        if not is_close(a.get(name), b.get(name), tolerance):
+            changes[name] = (a.get(name), b.get(name))
+    return changes
+
+
+class StackDiff:
+    """The differences between two stacks
+
+    identical:           True if no differences were found
+    interfaces_added:    (index, position) tuples of the interfaces only
+                         present in the new stack
+    interfaces_removed:  (index, position) tuples of the interfaces only
+                         present in the old stack
+    layers_changed:      (old name, new name, changes) tuples for aligned
+                         layers whose parameters differ; changes maps
+                         parameter names to (old value, new value) tuples
+    layers_removed:      names of the old layers that could not be aligned
+    layers_added:        names of the new layers that could not be aligned
+    items_changed:       (name, changes) tuples for metals, vias and the bulk
+    items_removed:       names of the metals and vias only in the old stack
+    items_added:         names of the metals and vias only in the new stack
+    items_moved:         names of the metals whose order changed
+    merged:              StackDiff of the simplified stacks (if compared)
+
+    """
+    def __init__(self, identical=False):
+        self.identical = identical
+        self.interfaces_added = []
+        self.interfaces_removed = []
+        self.layers_changed = []
+        self.layers_removed = []
+        self.layers_added = []
+        self.items_changed = []
+        self.items_removed = []
+        self.items_added = []
+        self.items_moved = []
+        self.merged = None
+
+    def __str__(self):
+        return '\n'.join(self.get_report())
+
+    def get_report(self, indent=''):
+        """Return the differences as a list of lines of text"""
+        if self.identical:
+            lines = [indent + 'identical']
+        else:
+            lines = []
+            for description, entries in (('removed', self.items_removed),
+                                         ('added', self.items_added),
+                                         ('moved', self.items_moved)):
+                for name in entries:
+                    lines.append('%s%s %s' % (indent, name, description))
+            for name, changes in self.items_changed:
+                lines.append(indent + format_changes(name, changes))
+            for description, entries in (('removed', self.interfaces_removed),
+                                         ('added', self.interfaces_added)):
+                for index, position in entries:
+                    lines.append('%sinterface %d (%g um) %s'
+                                 % (indent, index, position / um, description))
+            for old_name, new_name, changes in self.layers_changed:
+                name = old_name
+                if new_name != old_name:
+                    name = '%s -> %s' % (old_name, new_name)
+                lines.append(indent + format_changes(name, changes))
+            if self.layers_removed or self.layers_added:
+                lines.append('%slayers replaced: %s -> %s'
+                             % (indent, ', '.join(self.layers_removed) or '-',
+                                ', '.join(self.layers_added) or '-'))
+        if self.merged is not None:
+            lines.append(indent + 'merged layers:')
+            lines += self.merged.get_report(indent + '  ')
+        return lines
+
+
+def format_changes(name, changes):
+    return '%s: %s' % (name, ', '.join('%s %s -> %s'
+                                       % (parameter, format_value(old),
+                                          format_value(new))
+                                       for parameter, (old, new)
+                                       in sorted(changes.items())))
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return '%g' % value
+    return str(value)
+
+
+def diff_structures(old, new, tolerance):
+    """Return the StackDiff between two Structures"""
+    result = StackDiff()
+    for name in sorted(old.items):
+        if name not in new.items:
+            result.items_removed.append(name)
+        else:
+            changes = compare_parameters(old.items[name], new.items[name],
+                                         tolerance)
+            if changes:
+                result.items_changed.append((name, changes))
+    result.items_added = [name for name in sorted(new.items)
+                          if name not in old.items]
+
+    # align the layers on the metals present in both stacks
+    anchors = sorted((old.anchors[name], new.anchors[name], name)
+                     for name in old.anchors if name in new.anchors)
+    segments = [(0, 0)]
+    for old_index, new_index, name in anchors:
+        last_old, last_new = segments[-1]
+        if (old_index, new_index) == (last_old, last_new):
+            continue
+        if old_index >= last_old and new_index >= last_new:
+            segments.append((old_index, new_index))
+        else:
+            result.items_moved.append(name)
+    end = (len(old.layers), len(new.layers))
+    if segments[-1] != end:
+        segments.append(end)
+
+    for (old_start, new_start), (old_end, new_end) in zip(segments,
+                                                          segments[1:]):
+        if old_end - old_start == new_end - new_start:
+            for i in range(old_end - old_start):
+                old_name, old_parameters = old.layers[old_start + i]
+                new_name, new_parameters = new.layers[new_start + i]
+                changes = compare_parameters(old_parameters, new_parameters,
+                                             tolerance)
+                if changes:
+                    result.layers_changed.append((old_name, new_name,
+                                                  changes))
+        else:
+            result.layers_removed += [name for name, parameters
+                                      in old.layers[old_start:old_end]]
+            result.layers_added += [name for name, parameters
+                                    in new.layers[new_start:new_end]]
+            diff_interfaces(old, new, old_start, old_end, new_start, new_end,
+                            tolerance, result)
+
+    result.identical = not (result.interfaces_added or
+                            result.interfaces_removed or
+                            result.layers_changed or result.layers_removed or
+                            result.layers_added or result.items_changed or
+                            result.items_removed or result.items_added or
+                            result.items_moved)
+    return result
+
+
+def diff_interfaces(old, new, old_start, old_end, new_start, new_end,
+                    tolerance, result):
+    """Match the interfaces inside a segment of both stacks by their position
+    relative to the start of the segment"""
+    old_base = old.boundaries[old_start]
+    new_base = new.boundaries[new_start]
+    infinity = float('inf')
+    i, j = old_start + 1, new_start + 1
+    while i < old_end or j < new_end:
+        old_position = infinity
+        if i < old_end:
+            old_position = old.boundaries[i] - old_base
+        new_position = infinity
+        if j < new_end:
+            new_position = new.boundaries[j] - new_base
+        if is_close(old_position, new_position, tolerance):
+            i += 1
+            j += 1
+        elif old_position < new_position:
+            result.interfaces_removed.append((i, old.boundaries[i]))
+            i += 1
+        else:
+            result.interfaces_added.append((j, new.boundaries[j]))
+            j += 1
+
+
+def diff_stacks(old, new, tolerance=1e-9, merged=True):
+    """Return the StackDiff between two stacks. Stacks that are identical in
+    their standard form are recognized by their digest, without comparing
+    them in detail.
+
+    tolerance:   relative tolerance for comparing parameters
+    merged:      also compare the simplified stacks (in the merged attribute
+                 of the result)
+
+    """
+    old_standard = old.freeze().get_standard_stack()
+    new_standard = new.freeze().get_standard_stack()
+    if old_standard.digest() == new_standard.digest():
+        result = StackDiff(True)
+        if merged:
+            result.merged = StackDiff(True)
+        return result
+    result = diff_structures(get_stack_structure(old_standard),
+                             get_stack_structure(new_standard), tolerance)
+    if merged:
+        old_simplified = old_standard.thaw()
+        old_simplified.simplify()
+        new_simplified = new_standard.thaw()
+        new_simplified.simplify()
+        if (old_simplified.freeze().digest() ==
+                new_simplified.freeze().digest()):
+            result.merged = StackDiff(True)
+        else:
+            result.merged = diff_structures(
+                get_stack_structure(old_simplified),
+                get_stack_structure(new_simplified), tolerance)
+    return result
+
+
+def diff_stack_file(stack, filename, tolerance=1e-5):
+    """Return the StackDiff between the Momentum substrate file exported from
+    stack and the one stored in filename. The comparison is skipped if the
+    files have the same contents (ignoring number formatting).
+
+    tolerance:   relative tolerance for comparing parameters, which should
+                 allow for the limited precision of the numbers in the file
+
+    """
+    slm_file = open(filename)
+    try:
+        file_text = slm_file.read()
+    finally:
+        slm_file.close()
+    file_structure = read_slm(file_text)
+    infinite_ground_plane = file_structure.items['BOTTOM']['plane'] == 1
+    stack_text = stack.get_momentum_substrate(infinite_ground_plane)
+    if get_slm_digest(stack_text) == get_slm_digest(file_text):
+        return StackDiff(True)
+    return diff_structures(read_slm(stack_text), file_structure, tolerance)
+
+
+def diff(old, new, **kwargs):
+    """Return the StackDiff between a stack and another stack or the filename
+    of a Momentum substrate file"""
+    if isinstance(new, SubstrateStackBase):
+        return diff_stacks(old, new, **kwargs)
+    return diff_stack_file(old, new, **kwargs)
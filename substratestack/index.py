@@ -0,0 +1,168 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Spatial (z) indexes for substrate stacks"""
+
+from __future__ import division
+
+from substratestack import UP
+
+
+class IntervalIndex:
+    """Static interval tree holding (bottom, top, item) intervals
+
+    The intervals are sorted on their bottom, and each node of the implicit
+    balanced binary tree over this sorted list stores the highest top of its
+    subtree, which allows pruning subtrees that lie completely below a query.
+
+    """
+    def __init__(self, intervals):
+        """Build the index for an iterable of (bottom, top, item) tuples"""
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.bottoms = [interval[0] for interval in intervals]
+        self.tops = [interval[1] for interval in intervals]
+        self.items = [interval[2] for interval in intervals]
+        self._max_tops = list(self.tops)
+        if intervals:
+            self._build(0, len(intervals))
+
+    def __len__(self):
+        return len(self.items)
+
+    def _build(self, start, end):
+        """Compute the maximum top of the subtree covering [start, end) and
+        store it at the subtree's root"""
+        middle = (start + end) // 2
+        max_top = self.tops[middle]
+        if start < middle:
+            max_top = max(max_top, self._build(start, middle))
+        if middle + 1 < end:
+            max_top = max(max_top, self._build(middle + 1, end))
+        self._max_tops[middle] = max_top
+        return max_top
+
+    def _search(self, low, high, include_low):
+        """Yield the indexes of the intervals whose top lies above low and
+        whose bottom lies below high (or at high if include_low is true)"""
+        pending = [(0, len(self.items))]
+        while pending:
+            start, end = pending.pop()
+            if start >= end:
+                continue
+            middle = (start + end) // 2
+            if self._max_tops[middle] <= low:
+                continue
+            bottom = self.bottoms[middle]
+            if bottom < high or (include_low and bottom == high):
+                if self.tops[middle] > low:
+                    yield middle
+                pending.append((middle + 1, end))
+            pending.append((start, middle))
+
+    def at(self, position):
+        """Return the items whose interval contains position. Intervals
+        include their bottom, but not their top."""
+        indexes = sorted(self._search(position, position, True))
+        return [self.items[i] for i in indexes]
+
+    def overlapping(self, bottom, top):
+        """Return the items whose interval overlaps the interval [bottom, top]
+        by more than a single point"""
+        indexes = sorted(self._search(bottom, top, False))
+        return [self.items[i] for i in indexes]
+
+
+class StackIndex:
+    """Index of the z-extents of the oxide layers, metals and vias of a
+    substrate stack. The index reflects the stack at the time of its creation;
+    create a new index after modifying the stack.
+
+    """
+    float_threshold = 1e-15
+
+    def __init__(self, stack):
+        """Index the layers of stack"""
+        positions = stack.get_interface_positions()
+        interface_positions = dict((id(interface), position)
+                                   for interface, position
+                                   in zip(stack.interfaces, positions))
+        self.extents = {}
+
+        oxide_intervals = []
+        for i, oxide_layer in enumerate(stack.oxide_layers):
+            extent = (positions[i], positions[i + 1])
+            oxide_intervals.append(extent + (oxide_layer, ))
+            self.extents[id(oxide_layer)] = extent
+
+        metal_intervals = []
+        for metal_layer in stack.metal_layers:
+            if metal_layer.extend_direction == UP:
+                bottom = interface_positions[id(metal_layer.bottom_interface)]
+                top = bottom + metal_layer.thickness
+            else:
+                top = interface_positions[id(metal_layer.top_interface)]
+                bottom = top - metal_layer.thickness
+            metal_intervals.append((bottom, top, metal_layer))
+            self.extents[id(metal_layer)] = (bottom, top)
+
+        via_intervals = []
+        for via in stack.vias:
+            bottom = self.extents[id(via.bottom_metal)][1]
+            top = self.extents[id(via.top_metal)][0]
+            via_intervals.append((bottom, top, via))
+            self.extents[id(via)] = (bottom, top)
+
+        self.oxide_layers = IntervalIndex(oxide_intervals)
+        self.metal_layers = IntervalIndex(metal_intervals)
+        self.vias = IntervalIndex(via_intervals)
+
+    def get_extent(self, item):
+        """Return the (bottom, top) positions of an oxide layer, metal or
+        via"""
+        return self.extents[id(item)]
+
+    def get_layers_at(self, position):
+        """Return the oxide layers, metals and vias at the given absolute
+        position"""
+        return (self.oxide_layers.at(position) +
+                self.metal_layers.at(position) + self.vias.at(position))
+
+    def get_layers_between(self, bottom, top):
+        """Return the oxide layers, metals and vias that intersect the range
+        between the given absolute positions"""
+        bottom += self.float_threshold
+        top -= self.float_threshold
+        return (self.oxide_layers.overlapping(bottom, top) +
+                self.metal_layers.overlapping(bottom, top) +
+                self.vias.overlapping(bottom, top))
+
+    def get_oxide_layers_passed_by(self, via):
+        """Return the oxide layers via passes through, from bottom to top"""
+        bottom, top = self.get_extent(via)
+        return self.oxide_layers.overlapping(bottom + self.float_threshold,
+                                             top - self.float_threshold)
+
+    def get_metal_overlaps(self):
+        """Return a list of (metal, metal) tuples for all pairs of metal
+        layers that overlap each other"""
+        metals = self.metal_layers
+        overlaps = []
+        for i in range(len(metals)):
+            others = metals._search(metals.bottoms[i] + self.float_threshold,
+                                    metals.tops[i] - self.float_threshold,
+                                    False)
+            for j in sorted(others):
+                if j > i:
+                    overlaps.append((metals.items[i], metals.items[j]))
+        return overlaps
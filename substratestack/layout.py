@@ -0,0 +1,200 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Layout of substrate stack renderings
+
+The layout determines where the oxide layers, interfaces, metals and vias of
+a stack are drawn, independent of the output format.
+"""
+
+from __future__ import division
+
+from bisect import bisect_left, bisect_right
+from math import log
+
+from substratestack import UP, um, kA, mOhm_sq
+
+
+SCALES = ('linear', 'log', 'clamped')
+
+
+def get_layer_heights(thicknesses, height, scale='linear', min_height=4.0):
+    """Return the heights (in mm) to draw layers with the given thicknesses
+    at, such that they add up to height.
+
+    scale:       'linear' draws the layers proportional to their thickness,
+                 'log' proportional to the logarithm of their thickness
+                 (relative to the thinnest layer) and 'clamped' linearly,
+                 but no thinner than min_height
+    min_height:  the minimum height of a layer for the 'clamped' scale
+
+    """
+    assert scale in SCALES
+    if scale == 'linear':
+        factor = height / sum(thicknesses)
+        return [thickness * factor for thickness in thicknesses]
+    elif scale == 'log':
+        reference = min([thickness for thickness in thicknesses
+                         if thickness > 0] or [1.0])
+        weights = [log(1 + thickness / reference)
+                   for thickness in thicknesses]
+        factor = height / sum(weights)
+        return [weight * factor for weight in weights]
+    else:
+        min_height = min(min_height, height / len(thicknesses))
+        # clamp the thinnest layers; find how many need clamping
+        order = sorted(range(len(thicknesses)), key=thicknesses.__getitem__)
+        remaining = sum(thicknesses)
+        clamped = 0
+        for i in order:
+            factor = (height - clamped * min_height) / remaining
+            if thicknesses[i] * factor >= min_height:
+                break
+            remaining -= thicknesses[i]
+            clamped += 1
+        else:
+            return [min_height] * len(thicknesses)
+        return [max(thickness * factor, min_height)
+                for thickness in thicknesses]
+
+
+class StackLayout:
+    """The vertical layout (in mm) of a rendered substrate stack, and the
+    horizontal positions of its labels and boxes
+
+    oxides:      (oxide layer, y, height) tuples, from bottom to top
+    interfaces:  (interface, number, y, position) tuples, from bottom to top
+    metals:      (metal layer, y_bottom, y_top) tuples
+    vias:        (via, y_bottom, y_top, via height) tuples
+
+    """
+    # horizontal positions for labels and boxes
+    x1 = 0
+    x2 = 160
+    x_space = 2
+    x_thickness = 95
+    x_eps = 135
+    x_interface_number = 7
+    x_interface_number2 = 15
+    x_metal_offset = 15
+    x_metal_width = 60
+    x_via_width = 40
+
+    def __init__(self, stack, height, scale='linear', min_height=4.0):
+        """Lay out stack over the given height (in mm). See
+        get_layer_heights for scale and min_height."""
+        from substratestack.index import IntervalIndex
+        self.height = height
+        self.positions = stack.get_interface_positions()
+        self.total_interfaces = len(stack.interfaces) - 1
+        heights = get_layer_heights([layer.thickness
+                                     for layer in stack.oxide_layers],
+                                    height, scale, min_height)
+        self.heights = heights
+        self.ys = [0.0]
+        for layer_height in heights:
+            self.ys.append(self.ys[-1] + layer_height)
+
+        self.oxides = [(oxide_layer, self.ys[i], heights[i])
+                       for i, oxide_layer in enumerate(stack.oxide_layers)]
+        self.interfaces = [(interface, i, self.ys[i], self.positions[i])
+                           for i, interface in enumerate(stack.interfaces)]
+
+        interface_positions = dict((id(interface), position)
+                                   for interface, position
+                                   in zip(stack.interfaces, self.positions))
+        extents = {}
+        self.metals = []
+        for metal_layer in stack.metal_layers:
+            if metal_layer.extend_direction == UP:
+                bottom = interface_positions[id(metal_layer.bottom_interface)]
+                top = bottom + metal_layer.thickness
+            else:
+                top = interface_positions[id(metal_layer.top_interface)]
+                bottom = top - metal_layer.thickness
+            extents[id(metal_layer)] = (bottom, top)
+            self.metals.append((metal_layer, self.get_y(bottom),
+                                self.get_y(top)))
+
+        self.vias = []
+        for via in stack.vias:
+            bottom = extents[id(via.bottom_metal)][1]
+            top = extents[id(via.top_metal)][0]
+            self.vias.append((via, self.get_y(bottom), self.get_y(top),
+                              top - bottom))
+
+        self._metal_index = IntervalIndex((entry[1], entry[2], entry)
+                                          for entry in self.metals)
+        self._via_index = IntervalIndex((entry[1], entry[2], entry)
+                                        for entry in self.vias)
+
+    def get_y(self, position):
+        """Return the vertical drawing coordinate of the absolute position
+        (in meters) in the stack"""
+        positions = self.positions
+        index = bisect_right(positions, position) - 1
+        index = max(0, min(index, len(self.heights) - 1))
+        thickness = positions[index + 1] - positions[index]
+        if thickness == 0:
+            return self.ys[index]
+        return self.ys[index] + ((position - positions[index]) / thickness *
+                                 self.heights[index])
+
+    def get_oxides_between(self, y_bottom, y_top):
+        """Return the oxide entries that overlap the given vertical range"""
+        start = max(bisect_right(self.ys, y_bottom) - 1, 0)
+        end = bisect_left(self.ys, y_top)
+        return self.oxides[start:end]
+
+    def get_interfaces_between(self, y_bottom, y_top):
+        """Return the interface entries within the given vertical range"""
+        start = bisect_left(self.ys, y_bottom)
+        end = bisect_right(self.ys, y_top)
+        return self.interfaces[start:end]
+
+    def get_metals_between(self, y_bottom, y_top):
+        """Return the metal entries that overlap the given vertical range"""
+        return self._metal_index.overlapping(y_bottom, y_top)
+
+    def get_vias_between(self, y_bottom, y_top):
+        """Return the via entries that overlap the given vertical range"""
+        return self._via_index.overlapping(y_bottom, y_top)
+
+    def get_interface_label(self, position):
+        """Return the label for an interface at the given position"""
+        return u'%g \u03bcm' % (position / um, )
+
+    def get_oxide_labels(self, oxide_layer):
+        """Return the thickness and permittivity labels of an oxide layer"""
+        return (u'd = %g \u03bcm (%g kA)' % (oxide_layer.thickness / um,
+                                             oxide_layer.thickness / kA),
+                u'\u03b5r = %g' % (oxide_layer.epsilon_rel, ))
+
+    def get_metal_labels(self, metal_layer):
+        """Return the lines of text describing a metal layer"""
+        return (metal_layer.name,
+                u'd = %g \u03bcm (%g kA)' % (metal_layer.thickness / um,
+                                             metal_layer.thickness / kA),
+                u'\u03c3 = %.3g S/m' % metal_layer.get_conductivity(),
+                u'Rsheet = %g m\u2126/\u25a1' %
+                (metal_layer.sheet_resistance / mOhm_sq))
+
+    def get_via_labels(self, via, height):
+        """Return the lines of text describing a via of the given height"""
+        resistivity = via.resistance * via.width**2 / height / via.fill
+        return (via.name,
+                u'h = %g \u03bcm (%g kA)' % (height / um, height / kA),
+                u'\u03c3eq = %.3g S/m' % (1.0 / resistivity),
+                u'R = %g \u2126' % (via.resistance),
+                'via fill = %.4g %%' % (via.fill * 100))
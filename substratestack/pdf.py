@@ -0,0 +1,191 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""PDF renderer for substrate stacks (requires reportlab)"""
+
+from __future__ import division
+
+from math import ceil
+
+from reportlab.pdfgen import canvas
+from reportlab.lib import units
+from reportlab.lib.pagesizes import A4
+
+from substratestack.layout import StackLayout
+
+
+FONT_SIZE = 10
+REGULAR_FONT = 'Times-Roman'
+BOLD_FONT = 'Times-Bold'
+
+
+# reportlab falls back to these for the Greek letters and symbols in labels
+FALLBACK_FONTS = ('Symbol', 'ZapfDingbats')
+
+
+def set_up_fonts(c):
+    """Select the fonts used for rendering stacks on canvas c. Page contents
+    refer to fonts by the names the canvas assigns them in order of first
+    use, so pages drawn on canvases that were set up like this can be copied
+    from one to the other (see substratestack.report)."""
+    for font in (REGULAR_FONT, BOLD_FONT) + FALLBACK_FONTS:
+        c.setFont(font, FONT_SIZE)
+
+
+def write_pdf(stack, file, pages=3, single_page=True, scale='linear',
+              min_height=4.0, deterministic=False):
+    """Render a representation of stack to a PDF file. See
+    SubstrateStack.draw for a description of the arguments.
+
+    file:        filename or file-like object to write the PDF to
+
+    """
+    c = canvas.Canvas(file, invariant=int(deterministic))
+    # reportlab keeps the finished pages in memory until the document is saved
+    for page_size in draw_pages(c, stack, pages, single_page, scale,
+                                min_height):
+        c.showPage()
+    c.save()
+
+
+def draw_pages(c, stack, pages=3, single_page=True, scale='linear',
+               min_height=4.0):
+    """Draw stack on canvas c, page by page. Yields the size of each page
+    after drawing it; the caller finishes the page (Canvas.showPage). See
+    SubstrateStack.draw for a description of the arguments."""
+    paper = A4
+    fontsize = FONT_SIZE
+    regular_font = REGULAR_FONT
+    bold_font = BOLD_FONT
+    metal_color = (0.5, 0.8, 1.0)
+    via_color = (0.8, 0.8, 1.0)
+
+    height_padding = 30 * units.mm
+    if single_page:
+        page_size = (paper[0], pages * paper[1])
+        page_count = 1
+    else:
+        page_size = paper
+        page_count = pages
+    canvas_height = (page_size[1] - height_padding) / units.mm
+    if not single_page and scale == 'clamped':
+        # use as many pages as needed to draw each layer min_height high
+        required = len(stack.oxide_layers) * min_height / canvas_height
+        page_count = max(pages, int(ceil(required - 1e-9)))
+    layout = StackLayout(stack, page_count * canvas_height, scale,
+                         min_height)
+    x1, x2 = layout.x1, layout.x2
+    x_space = layout.x_space
+    x_interface_number = layout.x_interface_number
+    x_interface_number2 = layout.x_interface_number2
+    x_metal_offset = layout.x_metal_offset
+    x_metal_width = layout.x_metal_width
+    x_via_width = layout.x_via_width
+
+
+    def draw_oxide(oxide_layer, y, oxide_thickness):
+        fill_color = 1.0 - oxide_layer.epsilon_rel/20.0
+        c.setFillGray(fill_color)
+        c.rect(x1 * units.mm, y * units.mm,
+               (x2 - x1) * units.mm,  oxide_thickness * units.mm,
+               stroke=1, fill=1)
+        c.setFillGray(0.0)
+        thickness_label, eps_label = layout.get_oxide_labels(oxide_layer)
+        c.drawString(layout.x_thickness * units.mm,
+                     (y + oxide_thickness / 2) * units.mm - fontsize / 2,
+                     thickness_label)
+        c.drawString(layout.x_eps * units.mm,
+                     (y + oxide_thickness / 2) * units.mm - fontsize / 2,
+                     eps_label)
+
+    def draw_interface(number, y, position):
+        # interface numbers
+        c.drawRightString((x1 - x_interface_number - x_space) * units.mm,
+                          y * units.mm - fontsize / 2,
+                          '%d' % (number, ))
+        c.drawRightString((x1 - x_interface_number2 - x_space) * units.mm,
+                          y * units.mm - fontsize / 2,
+                          '%d' % (layout.total_interfaces - number, ))
+        c.line((x1 - x_interface_number) * units.mm, y * units.mm,
+               x1 * units.mm, y * units.mm)
+
+        # interface position
+        c.line(x2 * units.mm, y * units.mm,
+               (x2 + x_interface_number / 2) * units.mm, y * units.mm)
+        c.drawString((x2 + x_interface_number / 2 + x_space) * units.mm,
+                     y * units.mm - fontsize / 2,
+                     layout.get_interface_label(position))
+
+    def draw_text(center, text):
+        c.setFillGray(0.0)
+        current_y = center[1] * units.mm + (len(text) / 2 - 0.5) * fontsize
+        for i, line in enumerate(text):
+            if i == 0:
+                c.saveState()
+                c.setFont(bold_font, fontsize)
+            c.drawCentredString(center[0] * units.mm, current_y, line)
+            if i == 0:
+                c.restoreState()
+            current_y -= fontsize
+
+    def draw_metal(metal_layer, y_bottom, y_top):
+        c.setFillColorRGB(*metal_color)
+        c.rect((x1 + x_metal_offset) * units.mm, y_bottom * units.mm,
+               x_metal_width * units.mm, (y_top - y_bottom) * units.mm,
+               stroke=1, fill=1)
+        center = (x1 + x_metal_offset + x_metal_width / 2.0,
+                  (y_bottom + y_top) / 2.0)
+        draw_text(center, layout.get_metal_labels(metal_layer))
+
+    def draw_via(via, y_bottom, y_top, via_height):
+        x = x1 + x_metal_offset + (x_metal_width - x_via_width) / 2
+        c.setFillColorRGB(*via_color)
+        c.rect(x * units.mm, y_bottom * units.mm,
+               x_via_width * units.mm, (y_top - y_bottom) * units.mm,
+               stroke=1, fill=1)
+        center = (x1 + x_metal_offset + x_metal_width / 2.0,
+                  (y_bottom + y_top) / 2.0)
+        draw_text(center, layout.get_via_labels(via, via_height))
+
+    # render the pages one by one, top of the stack first; each page only
+    # draws the layers that intersect it
+    for page in reversed(range(page_count)):
+        bottom = page * canvas_height
+        top = bottom + canvas_height
+        # tolerate rounding errors at the page edges
+        query = (bottom - 1e-6, top + 1e-6)
+        c.setPageSize(page_size)
+        c.translate(25 * units.mm, height_padding / 2 - bottom * units.mm)
+        if not single_page:
+            clip = c.beginPath()
+            clip.rect(-25 * units.mm, bottom * units.mm,
+                      page_size[0], canvas_height * units.mm)
+            c.clipPath(clip, stroke=0, fill=0)
+        c.setFont(regular_font, fontsize)
+        c.setStrokeGray(0.0)
+        c.setLineWidth(0.3 * units.mm)
+
+        for oxide_layer, y, height in layout.get_oxides_between(*query):
+            draw_oxide(oxide_layer, y, height)
+        for interface, number, y, position in \
+                layout.get_interfaces_between(*query):
+            draw_interface(number, y, position)
+        for metal_layer, y_bottom, y_top in \
+                layout.get_metals_between(*query):
+            draw_metal(metal_layer, y_bottom, y_top)
+        for via, y_bottom, y_top, via_height in \
+                layout.get_vias_between(*query):
+            draw_via(via, y_bottom, y_top, via_height)
+
+        yield page_size
@@ -0,0 +1,168 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Lightweight SVG and text renderers for substrate stacks
+
+These renderers share their layout with SubstrateStack.draw, but do not
+depend on reportlab. They write their output to a file-like object opened in
+binary mode, element by element.
+"""
+
+from __future__ import division
+
+from xml.sax.saxutils import escape
+
+from substratestack import um, kA
+from substratestack.layout import StackLayout
+
+
+# all dimensions are in mm
+MARGIN_LEFT = 25
+MARGIN_RIGHT = 25
+MARGIN_VERTICAL = 15
+FONT_SIZE = 10 * 25.4 / 72        # 10 pt
+LINE_WIDTH = 0.3
+
+METAL_COLOR = '#80ccff'
+VIA_COLOR = '#ccccff'
+
+
+def get_gray(level):
+    """Return the SVG color for a gray level between 0 (black) and 1"""
+    value = int(round(max(0.0, min(level, 1.0)) * 255))
+    return '#%02x%02x%02x' % (value, value, value)
+
+
+def write_svg(stack, file, height=267, scale='linear', min_height=4.0):
+    """Render stack to an SVG image and write it to file.
+
+    file:        file-like object to write the UTF-8 encoded SVG to
+    height:      height of the stack in the image (in mm)
+    scale:       see StackLayout
+
+    """
+    layout = StackLayout(stack, height, scale, min_height)
+    x1, x2 = layout.x1, layout.x2
+    x_space = layout.x_space
+    x_interface_number = layout.x_interface_number
+    x_interface_number2 = layout.x_interface_number2
+    x_metal_offset = layout.x_metal_offset
+    x_metal_width = layout.x_metal_width
+    x_via_width = layout.x_via_width
+    top = MARGIN_VERTICAL + height
+    write = file.write
+
+    def element(text):
+        write(text.encode('utf-8'))
+
+    def rect(x, y_bottom, width, height, fill):
+        element(u'<rect x="%.3f" y="%.3f" width="%.3f" height="%.3f" '
+                u'fill="%s"/>\n' % (x, top - y_bottom - height, width,
+                                    height, fill))
+
+    def line(x_start, x_end, y):
+        element(u'<line x1="%.3f" y1="%.3f" x2="%.3f" y2="%.3f"/>\n'
+                % (x_start, top - y, x_end, top - y))
+
+    def text(x, y, string, anchor='start', bold=False):
+        element(u'<text x="%.3f" y="%.3f" text-anchor="%s"%s>%s</text>\n'
+                % (x, top - y, anchor, ' font-weight="bold"' if bold else '',
+                   escape(string)))
+
+    def text_block(x, y, lines):
+        y += (len(lines) - 1) / 2 * FONT_SIZE
+        for i, string in enumerate(lines):
+            text(x, y, string, 'middle', bold=(i == 0))
+            y -= FONT_SIZE
+
+    width = MARGIN_LEFT + x2 + MARGIN_RIGHT
+    element(u'<?xml version="1.0" encoding="UTF-8"?>\n'
+            u'<svg xmlns="http://www.w3.org/2000/svg" '
+            u'width="%.3fmm" height="%.3fmm" viewBox="%.3f 0 %.3f %.3f">\n'
+            % (width, height + 2 * MARGIN_VERTICAL, - MARGIN_LEFT, width,
+               height + 2 * MARGIN_VERTICAL))
+    element(u'<g stroke="black" stroke-width="%g" font-family="Times" '
+            u'font-size="%.3f" dominant-baseline="central">\n'
+            % (LINE_WIDTH, FONT_SIZE))
+
+    for oxide_layer, y, oxide_height in layout.oxides:
+        rect(x1, y, x2 - x1, oxide_height,
+             get_gray(1.0 - oxide_layer.epsilon_rel / 20.0))
+    for interface, number, y, position in layout.interfaces:
+        line(x1 - x_interface_number, x1, y)
+        line(x2, x2 + x_interface_number / 2, y)
+    for metal_layer, y_bottom, y_top in layout.metals:
+        rect(x1 + x_metal_offset, y_bottom, x_metal_width, y_top - y_bottom,
+             METAL_COLOR)
+    for via, y_bottom, y_top, via_height in layout.vias:
+        rect(x1 + x_metal_offset + (x_metal_width - x_via_width) / 2,
+             y_bottom, x_via_width, y_top - y_bottom, VIA_COLOR)
+    element(u'</g>\n<g font-family="Times" font-size="%.3f" '
+            u'dominant-baseline="central">\n' % FONT_SIZE)
+
+    for oxide_layer, y, oxide_height in layout.oxides:
+        thickness_label, eps_label = layout.get_oxide_labels(oxide_layer)
+        text(layout.x_thickness, y + oxide_height / 2, thickness_label)
+        text(layout.x_eps, y + oxide_height / 2, eps_label)
+    for interface, number, y, position in layout.interfaces:
+        text(x1 - x_interface_number - x_space, y, '%d' % (number, ), 'end')
+        text(x1 - x_interface_number2 - x_space, y,
+             '%d' % (layout.total_interfaces - number, ), 'end')
+        text(x2 + x_interface_number / 2 + x_space, y,
+             layout.get_interface_label(position))
+    x_center = x1 + x_metal_offset + x_metal_width / 2.0
+    for metal_layer, y_bottom, y_top in layout.metals:
+        text_block(x_center, (y_bottom + y_top) / 2.0,
+                   layout.get_metal_labels(metal_layer))
+    for via, y_bottom, y_top, via_height in layout.vias:
+        text_block(x_center, (y_bottom + y_top) / 2.0,
+                   layout.get_via_labels(via, via_height))
+    element(u'</g>\n</svg>\n')
+
+
+def write_text(stack, file, width=30):
+    """Write a plain ASCII representation of stack to file, top layer first.
+    Every interface and oxide layer is represented by a line; metals and vias
+    are listed next to the oxide layers they overlap.
+
+    width:       width of the column showing the metals and vias
+
+    """
+    layout = StackLayout(stack, 1.0)
+    total = layout.total_interfaces
+    border = '+' + '-' * width + '+'
+
+    def write(line):
+        file.write(line.encode('ascii', 'replace'))
+
+    def write_interface(number, position):
+        write('%4d %4d %s %g um\n' % (number, total - number, border,
+                                      position / um))
+
+    interfaces = layout.interfaces
+    # interfaces and oxide layers alternate; walk them from top to bottom
+    for i in range(len(layout.oxides) - 1, -1, -1):
+        interface, number, y, position = interfaces[i + 1]
+        write_interface(number, position)
+        oxide_layer, y, oxide_height = layout.oxides[i]
+        names = [entry[0].name for entry
+                 in layout.get_metals_between(y, y + oxide_height)]
+        names += [entry[0].name for entry
+                  in layout.get_vias_between(y, y + oxide_height)]
+        write('%9s |%s| d = %g um (%g kA), er = %g\n'
+              % ('', ' '.join(names)[:width].center(width),
+                 oxide_layer.thickness / um, oxide_layer.thickness / kA,
+                 oxide_layer.epsilon_rel))
+    interface, number, y, position = interfaces[0]
+    write_interface(number, position)
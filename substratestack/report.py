@@ -0,0 +1,146 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Multi-stack PDF reports (requires reportlab)
+
+The stacks are rendered in parallel by a pool of processes. Each process
+draws its stack's pages on a canvas of its own and returns the contents of
+these pages. The contents are then copied to the single canvas of the report,
+after an index listing the stacks and the time it took to render them.
+"""
+
+from __future__ import division
+
+import time
+from io import BytesIO
+
+from reportlab.pdfgen import canvas
+from reportlab.lib import units
+from reportlab.lib.pagesizes import A4
+
+from substratestack.pdf import draw_pages, set_up_fonts
+
+
+def render_page(job):
+    """Render a (name, frozen stack, pages, scale, min_height) job. Returns a
+    (name, pages, render time) tuple; pages is a list of (page size, page
+    contents) tuples."""
+    name, stack, pages, scale, min_height = job
+    start = time.time()
+    c = canvas.Canvas(BytesIO())
+    set_up_fonts(c)
+    contents = []
+    for page_size in draw_pages(c, stack, pages, True, scale, min_height):
+        contents.append((page_size, c.getCurrentPageContent()))
+        c.showPage()
+    return name, contents, time.time() - start
+
+
+def write_report(stacks, filename, processes=None, pages=1, scale='linear',
+                 min_height=4.0, title='Substrate stacks'):
+    """Render a number of stacks to a single PDF file, one stack per page.
+    Each stack gets an entry in the document outline (bookmarks).
+
+    stacks:      list of (name, stack) tuples
+    filename:    filename of the PDF file (including the extension)
+    processes:   number of worker processes; defaults to the number of CPUs
+    pages:       height of each stack's page in A4 pages
+    scale:       the thickness scale (see SubstrateStack.draw)
+    title:       title of the report, shown above the index
+
+    Returns a list of (name, render time) tuples in the order of stacks.
+
+    """
+    # frozen stacks pickle flat, so they can be sent to the workers whatever
+    # the multiprocessing start method
+    jobs = [(name, stack.freeze(), pages, scale, min_height)
+            for name, stack in stacks]
+    if processes == 1 or len(jobs) < 2:
+        results = list(map(render_page, jobs))
+    else:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try:
+            results = pool.map(render_page, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    timings = [(name, render_time) for name, contents, render_time in results]
+    c = canvas.Canvas(filename, A4)
+    # the fonts are set up like the workers', so that the page contents refer
+    # to the same fonts
+    set_up_fonts(c)
+    c.setTitle(title)
+    c.bookmarkPage('index')
+    c.addOutlineEntry('Index', 'index')
+    draw_index(c, timings, title)
+    for i, (name, contents, render_time) in enumerate(results):
+        c.bookmarkPage('stack%d' % i)
+        c.addOutlineEntry(name, 'stack%d' % i)
+        for page_size, page_contents in contents:
+            c.setPageSize(page_size)
+            c.addLiteral(page_contents)
+            c.showPage()
+    c.showOutline()
+    c.save()
+    return timings
+
+
+# index
+
+INDEX_ROWS = 55
+INDEX_SLOWEST = 3
+
+
+def get_index_page_count(entries):
+    """Return the number of pages an index of entries takes up"""
+    return max(1, (entries + INDEX_ROWS - 1) // INDEX_ROWS)
+
+
+def draw_index(c, timings, title):
+    """Draw an index for the stacks in timings on canvas c. The slowest
+    stacks to render are printed in bold."""
+    fontsize = 10
+    regular_font = 'Times-Roman'
+    bold_font = 'Times-Bold'
+    x_number, x_name, x_page, x_time = 25, 40, 150, 185
+    slowest = sorted(range(len(timings)), key=lambda i: timings[i][1],
+                     reverse=True)[:INDEX_SLOWEST]
+    first_page = get_index_page_count(len(timings)) + 1
+    total_time = sum(render_time for name, render_time in timings)
+
+    for start in range(0, max(len(timings), 1), INDEX_ROWS):
+        y = A4[1] - 25 * units.mm
+        c.setFont(bold_font, 1.6 * fontsize)
+        c.drawString(x_number * units.mm, y, title)
+        y -= 2 * fontsize
+        c.setFont(bold_font, fontsize)
+        c.drawString(x_name * units.mm, y, 'stack')
+        c.drawRightString(x_page * units.mm, y, 'page')
+        c.drawRightString(x_time * units.mm, y, 'render time [ms]')
+        y -= 1.5 * fontsize
+        for i in range(start, min(start + INDEX_ROWS, len(timings))):
+            name, render_time = timings[i]
+            c.setFont(bold_font if i in slowest else regular_font, fontsize)
+            c.drawRightString((x_name - 5) * units.mm, y, '%d' % (i + 1))
+            c.drawString(x_name * units.mm, y, name)
+            c.drawRightString(x_page * units.mm, y, '%d' % (first_page + i))
+            c.drawRightString(x_time * units.mm, y,
+                              '%.1f' % (render_time * 1000))
+            y -= 1.2 * fontsize
+        c.setFont(regular_font, fontsize)
+        c.drawString(x_name * units.mm, 15 * units.mm,
+                     'total render time: %.1f ms' % (total_time * 1000))
+        c.showPage()
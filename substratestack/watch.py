@@ -0,0 +1,226 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Watch mode for the substratestack command line tool
+
+Stack definition files (and the definitions they import) are monitored for
+changes. Only the definitions affected by a change are executed again, and
+only the targets of the stacks whose canonical contents changed are written.
+
+The frozen snapshots of each definition's stacks are kept in memory, along
+with their standardized versions once these have been exported. After a
+definition is executed again, stacks whose contents did not change are
+exported from the kept snapshots, so they are not standardized again. The
+target cache is kept in memory too. The definitions themselves are always
+executed afresh, as they can depend on anything.
+"""
+
+import os
+import select
+import struct
+import sys
+import time
+
+from substratestack.cli import (convert, handle_results, print_profile,
+                                get_output_directory)
+
+
+def get_state(filename):
+    """Return the modification time and size of a file, or None if it does
+    not exist"""
+    try:
+        status = os.stat(filename)
+    except OSError:
+        return None
+    return status.st_mtime, status.st_size
+
+
+class PollingMonitor:
+    """Detects changes to a set of files by periodically checking their
+    modification times and sizes"""
+    interval = 0.1
+
+    def __init__(self):
+        self.states = {}
+
+    def set_files(self, filenames):
+        """Set the files to watch"""
+        self.states = dict((filename, self.states.get(filename,
+                                                      get_state(filename)))
+                           for filename in filenames)
+
+    def wait(self, timeout=None):
+        """Wait for watched files to change. Returns the set of changed files
+        (empty when the timeout in seconds expired)."""
+        if timeout is not None:
+            end = time.time() + timeout
+        while True:
+            changed = set()
+            for filename, state in self.states.items():
+                new_state = get_state(filename)
+                if new_state != state:
+                    self.states[filename] = new_state
+                    changed.add(filename)
+            if changed or (timeout is not None and time.time() >= end):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor:
+    """Detects changes to a set of files using Linux' inotify interface. The
+    directories containing the files are watched, so that files replaced by
+    editors (instead of overwritten) are noticed too."""
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        """Raises OSError or AttributeError if inotify is not available"""
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.encoding = sys.getfilesystemencoding()
+        self.directories = {}       # watch descriptor -> directory
+        self.filenames = set()
+
+    def set_files(self, filenames):
+        """Set the files to watch"""
+        self.filenames = set(filenames)
+        watched = set(self.directories.values())
+        for directory in set(map(os.path.dirname, filenames)) - watched:
+            path = directory
+            if not isinstance(path, bytes):
+                path = path.encode(self.encoding)
+            descriptor = self._add_watch(self.fd, path, self.mask)
+            if descriptor >= 0:
+                self.directories[descriptor] = directory
+
+    def wait(self, timeout=None):
+        """Wait for watched files to change. Returns the set of changed files
+        (empty when the timeout in seconds expired)."""
+        if timeout is not None:
+            end = time.time() + timeout
+        while True:
+            remaining = None
+            if timeout is not None:
+                remaining = max(0, end - time.time())
+            if not select.select([self.fd], [], [], remaining)[0]:
+                return set()
+            data = os.read(self.fd, 65536)
+            changed = set()
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, cookie, length = \
+                    struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if descriptor not in self.directories:
+                    continue
+                if not isinstance(name, str):
+                    name = name.decode(self.encoding)
+                filename = os.path.join(self.directories[descriptor], name)
+                if filename in self.filenames:
+                    changed.add(filename)
+            if changed:
+                return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_monitor(polling=False):
+    """Return an inotify-based monitor if possible, a polling one otherwise"""
+    if not polling:
+        try:
+            return InotifyMonitor()
+        except (OSError, AttributeError):
+            pass
+    return PollingMonitor()
+
+
+def watch(results, caches, options, frozen_stacks=None, delay=0.2):
+    """Re-export the stacks of the definition files whenever these (or the
+    definitions they import) change. results are the results of the initial
+    conversions (see substratestack.cli.convert) and caches the target
+    caches of the output directories, which are kept in memory.
+
+    frozen_stacks: dictionary mapping the definition files to the frozen
+                 stacks of their initial conversions, if these were kept
+                 (see substratestack.cli.convert)
+    delay:       time (in seconds) without further changes to wait for
+                 after a change, so that a burst of edits is handled at once
+
+    """
+    dependencies = {}
+    for result in results:
+        dependencies[result[0]] = result[5]
+    if frozen_stacks is None:
+        frozen_stacks = {}
+    for filename in dependencies:
+        if frozen_stacks.get(filename) is None:
+            frozen_stacks[filename] = {}
+    monitor = get_monitor(options.polling)
+
+    def update_monitor():
+        files = set()
+        for filenames in dependencies.values():
+            files.update(filenames)
+        monitor.set_files(files)
+
+    update_monitor()
+    if options.verbose:
+        print('watching %d definition file(s) (%s)'
+              % (len(dependencies), monitor.__class__.__name__))
+    try:
+        while True:
+            changed = monitor.wait()
+            while True:
+                more = monitor.wait(delay)
+                if not more:
+                    break
+                changed.update(more)
+
+            start = time.time()
+            results = []
+            for filename in sorted(dependencies):
+                if changed.intersection(dependencies[filename]):
+                    directory = get_output_directory(filename, options)
+                    results.append(convert((filename, options,
+                                            caches[directory]),
+                                           frozen_stacks[filename]))
+            handle_results(results, caches, options)
+            for result in results:
+                filename, errors, new_dependencies = (result[0], result[2],
+                                                      result[5])
+                if errors:
+                    # keep watching the imported definitions of a broken
+                    # definition, as fixing these might fix it
+                    new_dependencies = set(new_dependencies)
+                    new_dependencies.update(dependencies[filename])
+                dependencies[filename] = list(new_dependencies)
+            update_monitor()
+            if options.profile:
+                print_profile(results, time.time() - start)
+    finally:
+        monitor.close()
@@ -0,0 +1,92 @@
+"""Tests of substratestack.aio, which require Python 3.7 (see test_aio)"""
+
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import build_example_stack
+from substratestack import StackValidationError
+from substratestack.aio import ExportService, render
+
+
+class ExportServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = build_example_stack()
+        self.executor = ThreadPoolExecutor(2)
+        self.service = ExportService(2, self.executor, chunk_size=100)
+
+    def tearDown(self):
+        self.service.close()
+        self.executor.shutdown()
+
+    def test_export(self):
+        targets = asyncio.run(self.service.export(self.stack, ['slm', 'son'],
+                                                  deterministic=True))
+        frozen = self.stack.freeze()
+        self.assertEqual(targets['slm'],
+                         render(frozen, 'slm', {'deterministic': True}))
+        self.assertEqual(targets['son'],
+                         render(frozen, 'son', {'deterministic': True}))
+
+    def test_process_pool(self):
+        service = ExportService(2)
+        try:
+            targets = asyncio.run(service.export(self.stack, ['slm']))
+        finally:
+            service.close()
+        self.assertEqual(targets['slm'],
+                         render(self.stack.freeze(), 'slm', {}))
+
+    def test_coalescing(self):
+        async def export():
+            # frozen stacks with the same contents share their targets
+            requests = [self.service.export(self.stack.freeze(),
+                                            ['slm', 'son'])
+                        for i in range(10)]
+            return await asyncio.gather(*requests)
+
+        results = asyncio.run(export())
+        self.assertEqual(self.service.requests, 20)
+        self.assertEqual(self.service.renders, 2)
+        for targets in results:
+            self.assertEqual(targets, results[0])
+        # nothing is cached once the rendering has finished
+        asyncio.run(self.service.export(self.stack, ['slm']))
+        self.assertEqual(self.service.renders, 3)
+
+    def test_cancellation(self):
+        async def export():
+            first = asyncio.ensure_future(self.service.export(self.stack,
+                                                              ['slm']))
+            second = asyncio.ensure_future(self.service.export(self.stack,
+                                                               ['slm']))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await asyncio.gather(first, second,
+                                        return_exceptions=True)
+
+        first, second = asyncio.run(export())
+        self.assertIsInstance(first, asyncio.CancelledError)
+        self.assertEqual(second['slm'],
+                         render(self.stack.freeze(), 'slm', {}))
+
+    def test_stream(self):
+        async def stream():
+            return [chunk async for chunk
+                    in self.service.stream(self.stack, 'son')]
+
+        chunks = asyncio.run(stream())
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(chunk) == 100 for chunk in chunks[:-1]))
+        self.assertEqual(b''.join(chunks),
+                         render(self.stack.freeze(), 'son', {}))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(self.service.export(self.stack, ['doc']))
+        with self.assertRaises(TypeError):
+            asyncio.run(self.service.export(self.stack, ['slm'], color=1))
+        self.stack.oxide_layers[2].thickness = 0
+        with self.assertRaises(StackValidationError):
+            asyncio.run(self.service.export(self.stack, ['slm']))
+        self.assertEqual(self.service._pending, {})
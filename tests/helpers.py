@@ -0,0 +1,100 @@
+# Copyright (c) 2011 Brecht Machiels <brecht.machiels@esat.kuleuven.be>
+#                    ESAT-MICAS, K.U.Leuven
+#
+# This file is part of python-substratestack
+# (http://github.com/bmachiel/python-substratestack).
+#
+# python-substratestack is free software: you can redistribute it and/or modify
+# it under the terms of the BSD (2-clause) license.
+#
+# python-substratestack is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the included LICENSE
+# file for details.
+
+"""Stacks shared by the tests
+
+Run the tests from the top-level directory with
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+
+from substratestack import um, A, kA, Ohm_cm, Ohm, mOhm_sq, Ohm_sq
+from substratestack import SubstrateStack
+from substratestack import BulkLayer, OxideLayer, MetalLayer, Via, UP, DOWN
+
+
+class quiet(object):
+    """Context manager that hides the warning SubstrateStack prints and the
+    output of the command line tool"""
+    def __enter__(self):
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        sys.stdout = open(os.devnull, 'w')
+        sys.stderr = open(os.devnull, 'w')
+
+    def __exit__(self, *exc_info):
+        sys.stdout.close()
+        sys.stderr.close()
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+
+
+def build_example_stack(metals=True, passivation=(4 * kA, )):
+    """The six metal stack of examples/example.py. passivation holds the
+    thicknesses of the top layers."""
+    with quiet():
+        stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm, 0))
+    stack.add_oxide_layer_on_top(OxideLayer(300 * A, 7))
+    stack.add_oxide_layer_on_top(OxideLayer(5.0 * kA, 4))
+    stack.add_oxide_layer_on_top(OxideLayer(300 * A, 4.1))
+    for i in range(4):
+        stack.add_oxide_layer_on_top(OxideLayer(5.0 * kA, 3.7))
+        stack.add_oxide_layer_on_top(OxideLayer(300 * A, 4.1))
+    stack.add_oxide_layer_on_top(OxideLayer(10 * kA, 3.7))
+    stack.add_oxide_layer_on_top(OxideLayer(500 * A, 4.1))
+    for thickness in passivation:
+        stack.add_oxide_layer_on_top(OxideLayer(thickness, 7))
+    if not metals:
+        return stack
+    stack.add_metal_layer(MetalLayer('PO1', 1.5 * kA, 10 * Ohm_sq, UP), 0)
+    for number, name in enumerate(['ME1', 'ME2', 'ME3', 'ME4', 'ME5']):
+        stack.add_metal_layer(MetalLayer(name, (2.0 if number == 0 else 3.0)
+                                         * kA, 100 * mOhm_sq, DOWN),
+                              2 * number + 2)
+    stack.add_metal_layer(MetalLayer('ME6', 7.0 * kA, 30 * mOhm_sq, DOWN), 12)
+    stack.add_via(Via('CONT', 10 * Ohm, 0.15 * um, 0.20 * um), 'PO1', 'ME1')
+    for number in range(1, 6):
+        stack.add_via(Via('VI%d' % number, 2 * Ohm, 0.20 * um, 0.20 * um),
+                      'ME%d' % number, 'ME%d' % (number + 1))
+    return stack
+
+
+def build_adjacent_stack():
+    """A stack of 1 um oxide layers in which the top of metal M1 is the
+    bottom of metal M2 once the stack is standardized"""
+    with quiet():
+        stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+    for i in range(6):
+        stack.add_oxide_layer_on_top(OxideLayer(1 * um, 4))
+    stack.add_metal_layer(MetalLayer('M1', 1 * um, 0.02, UP), 1)
+    stack.add_metal_layer(MetalLayer('M2', 1 * um, 0.02, DOWN), 3)
+    stack.add_metal_layer(MetalLayer('M3', 1 * um, 0.02, UP), 4)
+    stack.add_via(Via('V1', 1.0, 0.2 * um, 0.2 * um), 'M1', 'M3')
+    return stack
+
+
+def get_state(stack):
+    """The properties of the oxide layers and the interface numbers the
+    metals are attached to"""
+    metal_layers = []
+    for metal_layer in stack.metal_layers:
+        if metal_layer.extend_direction == UP:
+            interface = metal_layer.bottom_interface
+        else:
+            interface = metal_layer.top_interface
+        metal_layers.append((metal_layer.name, metal_layer.extend_direction,
+                             stack.interfaces.index(interface)))
+    return ([(oxide_layer.thickness, oxide_layer.epsilon_rel,
+              oxide_layer.loss_tangent) for oxide_layer in stack.oxide_layers],
+            metal_layers)
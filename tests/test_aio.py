@@ -0,0 +1,15 @@
+import sys
+import unittest
+
+# the tests are kept in a separate module, as their syntax requires Python 3
+if sys.version_info >= (3, 7):
+    from aio_cases import ExportServiceTest
+else:
+    class ExportServiceTest(unittest.TestCase):
+        @unittest.skip('requires Python 3.7')
+        def test_export(self):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
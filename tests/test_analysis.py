@@ -0,0 +1,217 @@
+import unittest
+
+from helpers import build_example_stack, get_state, quiet
+from substratestack import um, Ohm_cm, SubstrateStack
+from substratestack import BulkLayer, OxideLayer, MetalLayer, Via, UP, DOWN
+
+try:
+    import numpy
+    from substratestack.analysis import (get_sensitivities,
+                                         get_permittivity_sweep,
+                                         get_extraction_table, ViaFarmModel,
+                                         epsilon_0)
+except ImportError:     # NumPy is not installed
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'requires NumPy')
+class SensitivitiesTest(unittest.TestCase):
+    def get_simplified_parameters(self, stack):
+        simplified = stack.freeze().thaw()
+        simplified.simplify()
+        return [numpy.array([getattr(layer, name)
+                             for layer in simplified.oxide_layers])
+                for name in ('thickness', 'epsilon_rel', 'loss_tangent')]
+
+    def test_stack_is_not_modified(self):
+        stack = build_example_stack()
+        state = get_state(stack)
+        sensitivities = get_sensitivities(stack)
+        self.assertEqual(get_state(stack), state)
+        self.assertFalse(stack.is_standard())
+        self.assertEqual(sensitivities.d_thickness_d_thickness.shape[1],
+                         len(stack.oxide_layers))
+        self.assertEqual(len(sensitivities.oxide_layers), 14)
+
+    def test_parameters(self):
+        stack = build_example_stack()
+        sensitivities = get_sensitivities(stack)
+        thickness, epsilon_rel, loss_tangent = \
+           self.get_simplified_parameters(stack)
+        self.assertTrue(numpy.allclose(sensitivities.thickness, thickness,
+                                       rtol=1e-12, atol=0))
+        self.assertTrue(numpy.allclose(sensitivities.epsilon_rel, epsilon_rel,
+                                       rtol=1e-12, atol=0))
+        conductivity = [via.get_conductivity() for via in stack.vias]
+        self.assertTrue(numpy.allclose(sensitivities.via_conductivity,
+                                       conductivity, rtol=1e-12, atol=0))
+
+    def check_finite_differences(self, stack):
+        """Compare the derivatives with respect to the parameters of the
+        original oxide layers and metals to finite differences"""
+        for k, layer in enumerate(stack.oxide_layers):
+            layer.loss_tangent = 0.001 * (k + 1)
+        sensitivities = get_sensitivities(stack)
+        conductivity = sensitivities.via_conductivity
+
+        def check(layer, name, step, values, derivative, scale=1.0):
+            value = getattr(layer, name)
+            setattr(layer, name, value + step)
+            try:
+                perturbed = get_sensitivities(stack)
+            finally:
+                setattr(layer, name, value)
+            difference = (getattr(perturbed, values)
+                          - getattr(sensitivities, values)) / step
+            self.assertTrue(numpy.allclose(difference, derivative,
+                                           rtol=1e-4, atol=1e-6 * scale),
+                            '%s %s' % (values, name))
+
+        for k, layer in enumerate(stack.oxide_layers):
+            step = layer.thickness * 1e-6
+            check(layer, 'thickness', step, 'thickness',
+                  sensitivities.d_thickness_d_thickness[:, k])
+            check(layer, 'thickness', step, 'epsilon_rel',
+                  sensitivities.d_epsilon_rel_d_thickness[:, k],
+                  1 / layer.thickness)
+            check(layer, 'thickness', step, 'loss_tangent',
+                  sensitivities.d_loss_tangent_d_thickness[:, k],
+                  0.01 / layer.thickness)
+            check(layer, 'thickness', step, 'via_conductivity',
+                  sensitivities.d_conductivity_d_thickness[:, k],
+                  conductivity.max() / layer.thickness)
+            check(layer, 'epsilon_rel', 1e-6, 'epsilon_rel',
+                  sensitivities.d_epsilon_rel_d_epsilon_rel[:, k])
+            check(layer, 'loss_tangent', 1e-6, 'loss_tangent',
+                  sensitivities.d_loss_tangent_d_loss_tangent[:, k])
+        for k, metal_layer in enumerate(stack.metal_layers):
+            step = metal_layer.thickness * 1e-6
+            check(metal_layer, 'thickness', step, 'via_conductivity',
+                  sensitivities.d_conductivity_d_metal_thickness[:, k],
+                  conductivity.max() / metal_layer.thickness)
+
+    def test_finite_differences(self):
+        self.check_finite_differences(build_example_stack())
+
+    def test_finite_differences_thick_metals(self):
+        # metals spanning several oxide layers
+        with quiet():
+            stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+        for i in range(6):
+            stack.add_oxide_layer_on_top(OxideLayer((1 + 0.1 * i) * um,
+                                                    3.5 + 0.2 * i))
+        stack.add_metal_layer(MetalLayer('M1', 1.5 * um, 0.02, UP), 1)
+        stack.add_metal_layer(MetalLayer('M2', 2.5 * um, 0.02, DOWN), 6)
+        stack.add_via(Via('V1', 1.0, 0.2 * um, 0.1 * um), 'M1', 'M2')
+        self.check_finite_differences(stack)
+
+
+@unittest.skipIf(numpy is None, 'requires NumPy')
+class ViaFarmModelTest(unittest.TestCase):
+    def test_conductivity(self):
+        stack = build_example_stack()
+        model = ViaFarmModel(stack)
+        widths = numpy.array([0.15, 0.2, 0.5]) * um
+        spacings = numpy.array([0.2, 0.6]) * um
+        resistances = numpy.array([0.5, 2, 10])
+        grid = model.get_conductivity(widths, spacings, resistances)
+        self.assertEqual(grid.shape, (len(stack.vias), 3, 2, 3))
+        for i, via in enumerate(stack.vias):
+            j = numpy.flatnonzero(numpy.isclose(widths, via.width))[0]
+            k = numpy.flatnonzero(numpy.isclose(spacings, via.spacing))[0]
+            l = numpy.flatnonzero(numpy.isclose(resistances,
+                                                via.resistance))[0]
+            self.assertAlmostEqual(grid[i, j, k, l] / via.get_conductivity(),
+                                   1.0)
+
+    def test_find_closest(self):
+        stack = build_example_stack()
+        model = ViaFarmModel(stack)
+        target = [via.get_conductivity() for via in stack.vias]
+        widths = numpy.linspace(0.05, 0.5, 10) * um
+        spacings = numpy.linspace(0.1, 0.6, 6) * um
+        resistances = [0.5, 2, 10]
+        grid, configurations = model.find_closest(target, widths, spacings,
+                                                  resistances, count=3)
+        for via, closest in zip(stack.vias, configurations):
+            self.assertEqual(len(closest), 3)
+            # the via's own configuration is part of the grid
+            width, spacing, resistance, conductivity = closest[0]
+            self.assertAlmostEqual(conductivity / via.get_conductivity(), 1)
+            distances = [abs(numpy.log(entry[3] / via.get_conductivity()))
+                         for entry in closest]
+            self.assertEqual(distances, sorted(distances))
+
+
+@unittest.skipIf(numpy is None, 'requires NumPy')
+class ExtractionTableTest(unittest.TestCase):
+    def test_table(self):
+        stack = build_example_stack()
+        table = get_extraction_table(stack)
+        self.assertEqual(table['metal'], ['PO1', 'ME1', 'ME2', 'ME3', 'ME4',
+                                          'ME5', 'ME6'])
+        self.assertTrue(numpy.all(numpy.diff(table['bottom']) > 0))
+        self.assertEqual(table['via_below'], [None, 'CONT', 'VI1', 'VI2',
+                                              'VI3', 'VI4', 'VI5'])
+        # PO1 lies on the bulk
+        self.assertTrue(numpy.isnan(table['capacitance_to_bulk'][0]))
+        self.assertTrue(numpy.isnan(table['capacitance_to_metal_below'][0]))
+
+        def get_elastance(position):
+            """Elastance of the oxide between the bulk and position"""
+            elastance = 0
+            for layer in stack.oxide_layers:
+                thickness = min(layer.thickness, position)
+                if thickness <= 0:
+                    break
+                elastance += thickness / layer.epsilon_rel
+                position -= layer.thickness
+            return elastance
+
+        bottom, top = table['bottom'], table['top']
+        for i in range(1, len(bottom)):
+            self.assertAlmostEqual(table['capacitance_to_bulk'][i] /
+                                   (epsilon_0 / get_elastance(bottom[i])), 1)
+            gap = get_elastance(bottom[i]) - get_elastance(top[i - 1])
+            self.assertAlmostEqual(table['capacitance_to_metal_below'][i] /
+                                   (epsilon_0 / gap), 1)
+        self.assertAlmostEqual(table['via_area_resistance'][1],
+                               10 * (0.15 * um + 0.2 * um)**2)
+
+
+@unittest.skipIf(numpy is None, 'requires NumPy')
+class PermittivitySweepTest(unittest.TestCase):
+    def test_sweep(self):
+        stack = build_example_stack()
+        state = get_state(stack)
+        sweep = get_permittivity_sweep(stack, numpy.logspace(6, 11, 101),
+                                       False)
+        self.assertEqual(get_state(stack), state)
+        self.assertEqual(sweep.epsilon.shape, (15, 101))
+        simplified = stack.freeze().thaw()
+        simplified.simplify()
+        epsilon_rel = [layer.epsilon_rel for layer in simplified.oxide_layers]
+        self.assertEqual(sweep.merged_epsilon.shape,
+                         (len(epsilon_rel) + 1, 101))
+        # the oxide layers are lossless
+        self.assertTrue(numpy.allclose(sweep.merged_epsilon[1:, 0],
+                                       epsilon_rel, rtol=1e-12, atol=0))
+
+    def test_bulk(self):
+        stack = build_example_stack()
+        stack.bulk_layer.loss_tangent = 0.01
+        frequencies = numpy.logspace(6, 11, 10000)
+        omega = 2 * numpy.pi * frequencies
+        conduction = 1 / (stack.bulk_layer.resistivity * omega * epsilon_0)
+        for bulk_loss_tangent, loss_tangent in ((True, 0.01), (False, 0)):
+            sweep = get_permittivity_sweep(stack, frequencies,
+                                           bulk_loss_tangent)
+            expected = 11.9 * (1 - 1j * loss_tangent) - 1j * conduction
+            self.assertTrue(numpy.allclose(sweep.epsilon[0], expected,
+                                           rtol=1e-12, atol=0))
+            self.assertTrue(numpy.allclose(sweep.merged_epsilon[0], expected,
+                                           rtol=1e-12, atol=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from copy import deepcopy
+
+from helpers import build_example_stack, get_state
+from substratestack import um, kA, OxideLayer, MetalLayer, Via, DOWN
+
+
+def edit(stack):
+    """Make a number of changes of every kind to stack"""
+    stack.add_oxide_layer_on_top(OxideLayer(1 * um, 5))
+    stack.add_metal_layer(MetalLayer('TOP', 2 * kA, 0.01, DOWN),
+                          len(stack.interfaces) - 1)
+    stack.add_via(Via('VT', 1, 1 * um, 1 * um), 'ME6', 'TOP')
+    stack.remove_metal_layer_by_name('ME3')
+    stack.set_layer_parameters(stack.oxide_layers[2], thickness=1 * um,
+                               epsilon_rel=4.5)
+    stack.set_layer_parameters(stack.get_metal_layer_by_name('ME2'),
+                               sheet_resistance=0.05)
+
+
+class ChangeSetTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_snapshot(self, stack):
+        # exporting the stack itself would standardize it
+        basename = os.path.join(self.directory, 'snapshot')
+        deepcopy(stack).write_momentum_substrate(basename)
+        substrate = open(basename + '.slm')
+        try:
+            return get_state(stack), substrate.read()
+        finally:
+            substrate.close()
+
+    def assertRestored(self, stack, snapshot):
+        self.assertEqual(self.get_snapshot(stack), snapshot)
+
+    def check_rollback(self, stack):
+        snapshot = self.get_snapshot(stack)
+        changes = stack.begin_changes()
+        edit(stack)
+        self.assertTrue(len(changes) > 0)
+        changes.rollback()
+        self.assertRestored(stack, snapshot)
+
+    def test_rollback(self):
+        self.check_rollback(build_example_stack())
+
+    def test_rollback_standardize(self):
+        stack = build_example_stack()
+        snapshot = self.get_snapshot(stack)
+        changes = stack.begin_changes()
+        stack.simplify()
+        changes.rollback()
+        self.assertRestored(stack, snapshot)
+
+    def test_rollback_simplified(self):
+        stack = build_example_stack()
+        stack.simplify()
+        self.check_rollback(stack)
+
+    def test_commit(self):
+        stack = build_example_stack()
+        expected = build_example_stack()
+        edit(expected)
+        changes = stack.begin_changes()
+        edit(stack)
+        changes.commit()
+        self.assertEqual(get_state(stack), get_state(expected))
+        self.assertEqual(len(changes), 0)
+        self.assertTrue(stack._change_set is None)
+
+    def test_nested(self):
+        stack = build_example_stack()
+        snapshot = self.get_snapshot(stack)
+        outer = stack.begin_changes()
+        stack.add_oxide_layer_on_top(OxideLayer(1 * um, 5))
+        inner = stack.begin_changes()
+        stack.remove_metal_layer_by_name('ME4')
+        self.assertRaises(AssertionError, outer.rollback)
+        inner.commit()
+        self.assertTrue(stack.get_metal_layer_by_name('ME4') is None)
+        outer.rollback()
+        self.assertRestored(stack, snapshot)
+
+    def test_context_manager(self):
+        stack = build_example_stack()
+        snapshot = self.get_snapshot(stack)
+        try:
+            with stack.begin_changes():
+                edit(stack)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertRestored(stack, snapshot)
+        with stack.begin_changes() as changes:
+            edit(stack)
+            changes.commit()
+        self.assertNotEqual(self.get_snapshot(stack), snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+
+from helpers import quiet
+from substratestack import cli
+
+
+DEFINITION = """
+from substratestack import *
+stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+for i in range(10):
+    stack.add_oxide_layer_on_top(OxideLayer(1 * um, %s))
+stack.add_metal_layer(MetalLayer('M1', 1 * um, 0.02, UP), 3)
+"""
+
+
+def update_cache(arguments):
+    directory, number = arguments
+    cli.update_cache(directory, {'target%d' % number: {'key': str(number)}})
+
+
+class CommandLineToolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_definition(self, name, epsilon_rel=4):
+        filename = os.path.join(self.directory, name + '.py')
+        definition = open(filename, 'w')
+        definition.write(DEFINITION % epsilon_rel)
+        definition.close()
+        return filename
+
+    def run_tool(self, *arguments):
+        with quiet():
+            return cli.main(['-v'] + list(arguments))
+
+    def test_skip_up_to_date_targets(self):
+        filename = self.write_definition('stack')
+        target = os.path.join(self.directory, 'stack.slm')
+        self.assertEqual(self.run_tool(filename), 0)
+        mtime = os.stat(target).st_mtime
+        cache = cli.read_cache(self.directory)
+        self.assertEqual(sorted(cache), [target, target[:-3] + 'son'])
+        self.assertEqual(self.run_tool(filename), 0)
+        self.assertEqual(os.stat(target).st_mtime, mtime)
+        # changed export options invalidate the target
+        key = cache[target]['key']
+        self.assertEqual(self.run_tool('--infinite-ground-plane', filename), 0)
+        self.assertNotEqual(cli.read_cache(self.directory)[target]['key'], key)
+
+    def test_cache_keeps_entries_of_other_runs(self):
+        first = self.write_definition('first')
+        second = self.write_definition('second', 5)
+        self.assertEqual(self.run_tool(first), 0)
+        self.assertEqual(self.run_tool(second), 0)
+        self.assertEqual(len(cli.read_cache(self.directory)), 4)
+
+    def test_concurrent_cache_updates(self):
+        pool = Pool(8)
+        try:
+            pool.map(update_cache, [(self.directory, number)
+                                    for number in range(32)])
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(len(cli.read_cache(self.directory)), 32)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory)
+                                if not name.endswith('.lock')),
+                         [cli.CACHE_FILENAME])
+
+    def test_cache_permissions(self):
+        umask = os.umask(0o022)
+        try:
+            cli.update_cache(self.directory, {'target': {'key': '0'}})
+        finally:
+            os.umask(umask)
+        filename = os.path.join(self.directory, cli.CACHE_FILENAME)
+        self.assertEqual(os.stat(filename).st_mode & 0o777, 0o644)
+
+
+if __name__ == '__main__':
+    unittest.main()
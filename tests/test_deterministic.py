@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+from helpers import build_example_stack
+from substratestack import um, format_float, get_timestamp, OxideLayer
+
+try:
+    from substratestack.pdf import write_pdf
+except ImportError:     # reportlab is not installed
+    write_pdf = None
+
+
+class DeterministicExportTest(unittest.TestCase):
+    def setUp(self):
+        self.source_date_epoch = os.environ.get('SOURCE_DATE_EPOCH')
+        os.environ['SOURCE_DATE_EPOCH'] = '1300000000'
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if self.source_date_epoch is None:
+            os.environ.pop('SOURCE_DATE_EPOCH', None)
+        else:
+            os.environ['SOURCE_DATE_EPOCH'] = self.source_date_epoch
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        output = open(os.path.join(self.directory, filename), 'rb')
+        try:
+            return output.read()
+        finally:
+            output.close()
+
+    def test_format_float(self):
+        self.assertEqual(format_float(0.1 + 0.2), '0.3')
+        self.assertEqual(format_float(-0.0), '0')
+        self.assertEqual(format_float(1.23456789, 3), '1.23')
+        self.assertEqual(format_float(3.3e-07), '3.3e-07')
+
+    def test_timestamp(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            timestamp = get_timestamp(True)
+        self.assertEqual(timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                         '2011-03-13 07:06:40')
+        del os.environ['SOURCE_DATE_EPOCH']
+        self.assertEqual(get_timestamp(True).year, 1970)
+
+    def test_sonnet_header(self):
+        text = build_example_stack().get_sonnet_technology(True)
+        self.assertTrue('DAT 03/13/2011 07:06:40' in text.splitlines())
+
+    def test_identical_files(self):
+        stack = build_example_stack()
+        # the same stack, with a layer split in two halves
+        split = build_example_stack(passivation=(2e-7, 2e-7))
+        for number, other in enumerate((stack, build_example_stack(),
+                                        split)):
+            basename = os.path.join(self.directory, 'stack%d' % number)
+            other.write_momentum_substrate(basename, deterministic=True)
+            other.write_sonnet_technology(basename, deterministic=True)
+            other.simplify()
+            other.write_momentum_substrate(basename + '_simplified',
+                                           deterministic=True)
+        for extension in ('.slm', '.son', '_simplified.slm'):
+            self.assertEqual(self.read('stack0' + extension),
+                             self.read('stack1' + extension))
+        # the split layer is merged in the simplified stack
+        self.assertEqual(self.read('stack0_simplified.slm'),
+                         self.read('stack2_simplified.slm'))
+
+    def test_precision(self):
+        stack = build_example_stack()
+        stack.add_oxide_layer_on_top(OxideLayer(1.23456789 * um, 3))
+        text = stack.get_momentum_substrate(deterministic=True, precision=4)
+        self.assertTrue('1.235e-06' in text or '1.235' in text)
+        self.assertFalse('1.23456789' in text)
+        text = stack.get_momentum_substrate(deterministic=True)
+        self.assertTrue('1.23456789' in text)
+
+    @unittest.skipIf(write_pdf is None, 'requires reportlab')
+    def test_pdf(self):
+        for number in range(2):
+            pdf = open(os.path.join(self.directory, '%d.pdf' % number), 'wb')
+            try:
+                write_pdf(build_example_stack(), pdf, deterministic=True)
+            finally:
+                pdf.close()
+        self.assertEqual(self.read('0.pdf'), self.read('1.pdf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import build_example_stack
+from substratestack import um, kA, OxideLayer, MetalLayer, UP
+
+
+class DiffTest(unittest.TestCase):
+    def test_identical(self):
+        result = build_example_stack().diff(build_example_stack())
+        self.assertTrue(result.identical)
+        self.assertTrue(result.merged.identical)
+        self.assertEqual(str(result).splitlines()[0], 'identical')
+
+    def test_changed_parameter(self):
+        new = build_example_stack()
+        new.oxide_layers[3].epsilon_rel = 3.9
+        result = build_example_stack().diff(new)
+        self.assertFalse(result.identical)
+        # the layer is split in the standard form of the stacks
+        self.assertTrue(result.layers_changed)
+        for old_name, new_name, changes in result.layers_changed:
+            self.assertEqual(list(changes), ['epsilon_rel'])
+        self.assertEqual(result.interfaces_added, [])
+        self.assertEqual(result.interfaces_removed, [])
+
+    def test_layer_added_on_top(self):
+        old = build_example_stack()
+        new = build_example_stack()
+        new.add_oxide_layer_on_top(OxideLayer(1 * um, 3))
+        result = old.diff(new)
+        self.assertEqual(len(result.interfaces_added), 1)
+        # the old top interface
+        index, position = result.interfaces_added[0]
+        self.assertAlmostEqual(position / um, (old.get_interface_positions()
+                                               [-1] / um))
+        self.assertEqual(result.interfaces_removed, [])
+        result = new.diff(old)
+        self.assertEqual(len(result.interfaces_removed), 1)
+        self.assertEqual(result.interfaces_added, [])
+
+    def test_top_layer_split(self):
+        old = build_example_stack()
+        new = build_example_stack(passivation=(2 * kA, 2 * kA))
+        result = old.diff(new, merged=False)
+        self.assertEqual(len(result.interfaces_added), 1)
+        index, position = result.interfaces_added[0]
+        positions = old.get_interface_positions()
+        self.assertAlmostEqual(position / um,
+                               (positions[-1] - 2 * kA) / um)
+        self.assertEqual(result.interfaces_removed, [])
+        self.assertEqual(result.items_added + result.items_removed, [])
+
+    def test_metals(self):
+        old = build_example_stack()
+        new = build_example_stack()
+        new.remove_metal_layer_by_name('ME3')
+        new.add_metal_layer(MetalLayer('TOP', 2 * kA, 0.01, UP),
+                            len(new.interfaces) - 2)
+        result = old.diff(new)
+        self.assertEqual(sorted(result.items_removed), ['ME3', 'VI2', 'VI3'])
+        self.assertEqual(result.items_added, ['TOP'])
+
+    def test_stack_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            stack = build_example_stack()
+            basename = os.path.join(directory, 'stack')
+            stack.write_momentum_substrate(basename)
+            self.assertTrue(stack.diff(basename + '.slm').identical)
+            stack.oxide_layers[5].epsilon_rel = 3.9
+            result = stack.diff(basename + '.slm')
+            self.assertFalse(result.identical)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
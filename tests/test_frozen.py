@@ -0,0 +1,86 @@
+import pickle
+import unittest
+
+from helpers import build_example_stack, get_state
+from substratestack import um, OxideLayer
+
+
+class FrozenStackTest(unittest.TestCase):
+    def test_snapshot(self):
+        stack = build_example_stack()
+        frozen = stack.freeze()
+        state = get_state(frozen)
+        stack.add_oxide_layer_on_top(OxideLayer(1 * um, 3))
+        stack.remove_metal_layer_by_name('ME3')
+        stack.simplify()
+        self.assertEqual(get_state(frozen), state)
+        self.assertTrue(frozen.freeze() is frozen)
+
+    def test_immutable(self):
+        frozen = build_example_stack().freeze()
+        self.assertRaises(AttributeError, setattr, frozen.oxide_layers[0],
+                          'thickness', 1 * um)
+        self.assertRaises(AttributeError, setattr,
+                          frozen.get_metal_layer_by_name('ME1'), 'name', 'M')
+        self.assertRaises(AttributeError, setattr, frozen, 'vias', ())
+        self.assertFalse(hasattr(frozen, 'simplify'))
+
+    def test_equality(self):
+        frozen = build_example_stack().freeze()
+        other = build_example_stack().freeze()
+        self.assertEqual(frozen, other)
+        self.assertEqual(hash(frozen), hash(other))
+        self.assertEqual(frozen.digest(), other.digest())
+        stack = build_example_stack()
+        stack.oxide_layers[4].epsilon_rel = 3.8
+        self.assertNotEqual(stack.freeze(), frozen)
+        self.assertNotEqual(stack.freeze().digest(), frozen.digest())
+
+    def test_digest_is_cached(self):
+        frozen = build_example_stack().freeze()
+        digest = frozen.digest()
+        self.assertEqual(frozen._digest, digest)
+        self.assertTrue(frozen.digest() is digest)
+
+    def test_pickle(self):
+        frozen = build_example_stack().freeze()
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(frozen, protocol))
+            self.assertEqual(copy, frozen)
+            self.assertEqual(copy.digest(), frozen.digest())
+            self.assertEqual(copy.get_momentum_substrate(),
+                             frozen.get_momentum_substrate())
+
+    def test_large_stack_pickle(self):
+        stack = build_example_stack()
+        for i in range(3000):
+            stack.add_oxide_layer_on_top(OxideLayer(0.1 * um, 4))
+        frozen = stack.freeze()
+        copy = pickle.loads(pickle.dumps(frozen, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copy, frozen)
+
+    def test_exports(self):
+        stack = build_example_stack()
+        frozen = stack.freeze()
+        state = get_state(frozen)
+        self.assertEqual(frozen.get_momentum_substrate(),
+                         stack.get_momentum_substrate())
+        self.assertEqual(frozen.get_sonnet_technology(True),
+                         stack.get_sonnet_technology(True))
+        # the standardized snapshot is cached; the snapshot is unchanged
+        self.assertTrue(frozen.get_standard_stack() is
+                        frozen.get_standard_stack())
+        self.assertEqual(get_state(frozen), state)
+
+    def test_thaw(self):
+        frozen = build_example_stack().freeze()
+        stack = frozen.thaw()
+        self.assertEqual(stack.freeze(), frozen)
+        stack.remove_metal_layer_by_name('ME2')
+        stack.simplify()
+        stack.validate()
+        self.assertNotEqual(stack.freeze(), frozen)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import random
+import unittest
+
+from helpers import build_example_stack
+from substratestack import um
+from substratestack.index import IntervalIndex
+
+
+class IntervalIndexTest(unittest.TestCase):
+    def test_random_intervals(self):
+        generator = random.Random(0)
+        intervals = []
+        for item in range(200):
+            bottom = generator.uniform(0, 100)
+            intervals.append((bottom, bottom + generator.uniform(0.1, 10),
+                              item))
+        index = IntervalIndex(intervals)
+        self.assertEqual(len(index), 200)
+        for i in range(100):
+            position = generator.uniform(-5, 115)
+            expected = [item for bottom, top, item in intervals
+                        if bottom <= position < top]
+            self.assertEqual(sorted(index.at(position)), expected)
+            low = generator.uniform(-5, 115)
+            high = low + generator.uniform(0, 20)
+            expected = [item for bottom, top, item in intervals
+                        if top > low and bottom < high]
+            self.assertEqual(sorted(index.overlapping(low, high)), expected)
+
+    def test_empty(self):
+        index = IntervalIndex([])
+        self.assertEqual(index.at(1.0), [])
+        self.assertEqual(index.overlapping(0, 1.0), [])
+
+
+class StackIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = build_example_stack()
+        self.index = self.stack.get_index()
+
+    def test_extents(self):
+        positions = self.stack.get_interface_positions()
+        layer = self.stack.oxide_layers[3]
+        self.assertEqual(self.index.get_extent(layer),
+                         (positions[3], positions[4]))
+        me1 = self.stack.get_metal_layer_by_name('ME1')
+        bottom, top = self.index.get_extent(me1)
+        self.assertEqual(top, positions[2])
+        self.assertAlmostEqual((top - bottom) / um, me1.thickness / um)
+
+    def test_layers_at(self):
+        me1 = self.stack.get_metal_layer_by_name('ME1')
+        bottom, top = self.index.get_extent(me1)
+        layers = self.index.get_layers_at((bottom + top) / 2)
+        self.assertEqual(len(layers), 2)
+        self.assertTrue(me1 in layers)
+        self.assertTrue(self.stack.oxide_layers[1] in layers)
+
+    def test_oxide_layers_passed_by(self):
+        via = self.stack.get_via_by_top_metal(
+            self.stack.get_metal_layer_by_name('ME3'))
+        bottom, top = self.index.get_extent(via)
+        expected = [layer for layer in self.stack.oxide_layers
+                    if self.index.get_extent(layer)[1] > bottom + 1e-15 and
+                    self.index.get_extent(layer)[0] < top - 1e-15]
+        self.assertEqual(self.index.get_oxide_layers_passed_by(via),
+                         expected)
+        self.assertTrue(len(expected) > 0)
+
+    def test_metal_overlaps(self):
+        self.assertEqual(self.index.get_metal_overlaps(), [])
+        stack = build_example_stack()
+        # ME2 extends down past ME1 and PO1
+        stack.get_metal_layer_by_name('ME2').thickness = 1 * um
+        names = sorted(tuple(sorted((first.name, second.name))) for
+                       first, second in stack.get_index().get_metal_overlaps())
+        self.assertEqual(names, [('ME1', 'ME2'), ('ME2', 'PO1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
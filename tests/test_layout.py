@@ -0,0 +1,122 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from helpers import build_example_stack
+from substratestack import um, OxideLayer
+from substratestack.layout import get_layer_heights, StackLayout
+
+try:
+    from reportlab.lib.pagesizes import A4
+except ImportError:     # reportlab is not installed
+    A4 = None
+
+
+THICKNESSES = [300 * um, 0.03 * um, 0.5 * um, 0.03 * um, 1 * um]
+
+
+class LayerHeightsTest(unittest.TestCase):
+    def check_heights(self, heights, height=100.0):
+        self.assertEqual(len(heights), len(THICKNESSES))
+        self.assertAlmostEqual(sum(heights), height)
+        # thicker layers are never drawn thinner
+        order = sorted(range(len(THICKNESSES)), key=THICKNESSES.__getitem__)
+        for thinner, thicker in zip(order, order[1:]):
+            self.assertTrue(heights[thinner] <= heights[thicker] + 1e-12)
+
+    def test_linear(self):
+        heights = get_layer_heights(THICKNESSES, 100.0)
+        self.check_heights(heights)
+        self.assertAlmostEqual(heights[2] / heights[4], 0.5)
+
+    def test_log(self):
+        heights = get_layer_heights(THICKNESSES, 100.0, 'log')
+        self.check_heights(heights)
+        self.assertAlmostEqual(heights[1], heights[3])
+        self.assertTrue(heights[1] > 1.0)
+
+    def test_clamped(self):
+        heights = get_layer_heights(THICKNESSES, 100.0, 'clamped', 4.0)
+        self.check_heights(heights)
+        self.assertEqual(heights[1:], [4.0] * 4)
+        self.assertAlmostEqual(heights[0], 84.0)
+        # too little room to draw every layer min_height high
+        self.assertEqual(get_layer_heights(THICKNESSES, 10.0, 'clamped', 4.0),
+                         [2.0] * 5)
+
+
+class StackLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = build_example_stack()
+
+    def test_layout(self):
+        layout = StackLayout(self.stack, 200.0, 'clamped')
+        self.assertEqual(len(layout.oxides), len(self.stack.oxide_layers))
+        self.assertEqual(len(layout.interfaces), len(self.stack.interfaces))
+        self.assertEqual(len(layout.metals), len(self.stack.metal_layers))
+        self.assertEqual(len(layout.vias), len(self.stack.vias))
+        self.assertAlmostEqual(layout.interfaces[-1][2], 200.0)
+        for metal_layer, y_bottom, y_top in layout.metals:
+            self.assertTrue(y_bottom < y_top)
+
+    def test_scales(self):
+        linear = StackLayout(self.stack, 200.0)
+        clamped = StackLayout(self.stack, 200.0, 'clamped', 5.0)
+        # the thin layers of the example are hardly visible on a linear scale
+        self.assertTrue(min(height for oxide_layer, y, height
+                            in linear.oxides) < 2.0)
+        self.assertAlmostEqual(min(height for oxide_layer, y, height
+                                   in clamped.oxides), 5.0)
+
+
+@unittest.skipIf(A4 is None, 'requires reportlab')
+class PDFTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stack = build_example_stack()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_page_sizes(self, **options):
+        """Render the stack and return the (width, height) of each page"""
+        basename = os.path.join(self.directory, 'stack')
+        self.stack.draw(basename, **options)
+        document = open(basename + '.pdf', 'rb')
+        try:
+            data = document.read()
+        finally:
+            document.close()
+        boxes = re.findall(br'/MediaBox \[ 0 0 ([\d.]+) ([\d.]+) \]', data)
+        return [(float(width), float(height)) for width, height in boxes]
+
+    def test_single_page(self):
+        sizes = self.get_page_sizes(pages=3)
+        self.assertEqual(len(sizes), 1)
+        self.assertAlmostEqual(sizes[0][1], 3 * A4[1], 3)
+
+    def test_multiple_pages(self):
+        for scale in ('linear', 'log', 'clamped'):
+            sizes = self.get_page_sizes(pages=3, single_page=False,
+                                        scale=scale)
+            self.assertEqual(len(sizes), 3)
+            for width, height in sizes:
+                self.assertAlmostEqual(width, A4[0], 3)
+                self.assertAlmostEqual(height, A4[1], 3)
+
+    def test_deep_stack(self):
+        for i in range(200):
+            self.stack.add_oxide_layer_on_top(OxideLayer(0.1 * um, 4))
+        # 213 layers of 4 mm do not fit on three pages
+        self.assertEqual(len(self.get_page_sizes(single_page=False,
+                                                 scale='clamped')), 4)
+        self.assertEqual(len(self.get_page_sizes(single_page=False,
+                                                 scale='clamped',
+                                                 min_height=2.0)), 3)
+        self.assertEqual(len(self.get_page_sizes(single_page=False)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from io import BytesIO
+from xml.dom.minidom import parseString
+
+from helpers import build_example_stack, get_state
+
+
+class RenderTest(unittest.TestCase):
+    def setUp(self):
+        self.stack = build_example_stack()
+
+    def test_svg(self):
+        state = get_state(self.stack)
+        for scale in ('linear', 'log', 'clamped'):
+            file = BytesIO()
+            self.stack.draw_svg(file, 150, scale)
+            document = parseString(file.getvalue())
+            svg = document.documentElement
+            self.assertEqual(svg.tagName, 'svg')
+            rects = svg.getElementsByTagName('rect')
+            self.assertEqual(len(rects), len(self.stack.oxide_layers)
+                             + len(self.stack.metal_layers)
+                             + len(self.stack.vias))
+            labels = [text.firstChild.data
+                      for text in svg.getElementsByTagName('text')]
+            for metal_layer in self.stack.metal_layers:
+                self.assertTrue(metal_layer.name in labels)
+        # rendering does not standardize the stack
+        self.assertEqual(get_state(self.stack), state)
+
+    def test_text(self):
+        file = BytesIO()
+        self.stack.draw_text(file, 40)
+        lines = file.getvalue().decode('ascii').splitlines()
+        self.assertEqual(len(lines), len(self.stack.oxide_layers)
+                         + len(self.stack.interfaces))
+        # top layer first
+        self.assertTrue(lines[0].startswith('%4d %4d +' % (
+            len(self.stack.interfaces) - 1, 0)))
+        self.assertTrue('er = 7' in lines[1])
+        self.assertTrue(all(len(line.split('|')[1]) == 40
+                            for line in lines[1::2]))
+        self.assertTrue(any('ME6' in line for line in lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from helpers import build_example_stack, get_state
+from substratestack import um, OxideLayer
+
+try:
+    from substratestack.report import write_report, render_page
+except ImportError:     # reportlab is not installed
+    write_report = None
+
+
+@unittest.skipIf(write_report is None, 'requires reportlab')
+class ReportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'report.pdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read_report(self):
+        report = open(self.filename, 'rb')
+        try:
+            return report.read()
+        finally:
+            report.close()
+
+    def get_page_count(self):
+        return len(re.findall(br'/MediaBox', self.read_report()))
+
+    def test_report(self):
+        stacks = [('stack %d' % i, build_example_stack()) for i in range(4)]
+        stacks[1][1].simplify()
+        states = [get_state(stack) for name, stack in stacks]
+        timings = write_report(stacks, self.filename, processes=2)
+        self.assertEqual([name for name, render_time in timings],
+                         [name for name, stack in stacks])
+        self.assertEqual(self.get_page_count(), 1 + len(stacks))
+        # the stacks are not standardized by rendering them
+        self.assertEqual([get_state(stack) for name, stack in stacks],
+                         states)
+        report = self.read_report()
+        for name in ['Index'] + [name for name, stack in stacks]:
+            self.assertTrue(('/Title (%s)' % name).encode('ascii') in report)
+
+    def test_fonts(self):
+        # the copied page contents refer to the fonts of the report by name
+        stack = build_example_stack()
+        name, pages, render_time = render_page(('stack', stack.freeze(), 1,
+                                                'linear', 4.0))
+        page_size, contents = pages[0]
+        fonts = set(re.findall(r'/(F\d+) [\d.]+ Tf', contents))
+        self.assertEqual(fonts, set(['F2', 'F3', 'F4', 'F5']))
+        write_report([('stack', stack)], self.filename)
+        report = self.read_report()
+        for font, name in (('F2', 'Times-Roman'), ('F3', 'Times-Bold'),
+                           ('F4', 'Symbol'), ('F5', 'ZapfDingbats')):
+            self.assertTrue(re.search(br'/BaseFont /%s [^\n]*/Name /%s\b'
+                                      % (name.encode('ascii'),
+                                         font.encode('ascii')), report))
+
+    def test_large_stacks(self):
+        # the stacks are pickled to be sent to the workers
+        stacks = []
+        for i in range(2):
+            stack = build_example_stack()
+            for j in range(2000):
+                stack.add_oxide_layer_on_top(OxideLayer(0.1 * um, 4))
+            stacks.append(('stack %d' % i, stack))
+        write_report(stacks, self.filename, processes=2)
+        self.assertEqual(self.get_page_count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
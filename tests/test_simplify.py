@@ -0,0 +1,91 @@
+import unittest
+
+from helpers import build_example_stack, build_adjacent_stack, get_state
+from substratestack import um, OxideLayer, MetalLayer, Via, DOWN
+
+
+class IncrementalSimplifyTest(unittest.TestCase):
+    def assertSameStack(self, stack, other):
+        """The stacks only differ by rounding errors (layers are merged in a
+        different order)"""
+        oxide_layers, metal_layers = get_state(stack)
+        other_oxide_layers, other_metal_layers = get_state(other)
+        self.assertEqual(metal_layers, other_metal_layers)
+        self.assertEqual(len(oxide_layers), len(other_oxide_layers))
+        for properties, other_properties in zip(oxide_layers,
+                                                other_oxide_layers):
+            for value, other_value in zip(properties, other_properties):
+                self.assertTrue(abs(value - other_value)
+                                <= 1e-12 * abs(other_value))
+
+    def test_remove_metals(self):
+        names = ['ME1', 'ME3', 'PO1', 'ME6']
+        stack = build_example_stack()
+        stack.simplify()
+        for name in names:
+            stack.remove_metal_layer_by_name(name)
+        expected = build_example_stack()
+        for name in names:
+            expected.remove_metal_layer_by_name(name)
+        expected.simplify()
+        self.assertSameStack(stack, expected)
+
+    def test_add_oxide_layers_and_metal(self):
+        def edit(stack):
+            stack.add_oxide_layer_on_top(OxideLayer(1 * um, 5))
+            stack.add_oxide_layer_on_top(OxideLayer(2 * um, 3))
+            stack.add_metal_layer(MetalLayer('TOP', 0.2 * um, 0.01, DOWN),
+                                  len(stack.interfaces) - 1)
+            stack.add_via(Via('VT', 1, 1 * um, 1 * um), 'ME6', 'TOP')
+
+        stack = build_example_stack()
+        stack.simplify()
+        edit(stack)
+        expected = build_example_stack()
+        edit(expected)
+        expected.simplify()
+        self.assertSameStack(stack, expected)
+
+    def test_change_merged_layer(self):
+        for name, value in (('thickness', 5 * um), ('epsilon_rel', 6.0),
+                            ('loss_tangent', 0.01)):
+            stack = build_example_stack()
+            stack.simplify()
+            stack.set_layer_parameters(stack.oxide_layers[-1],
+                                       **{name: value})
+            # the edited layer is no longer made up of the original layers
+            expected = stack.freeze().thaw()
+            stack.add_oxide_layer_on_top(OxideLayer(1 * um, 4))
+            expected.add_oxide_layer_on_top(OxideLayer(1 * um, 4))
+            expected.simplify()
+            self.assertSameStack(stack, expected)
+            if name == 'thickness':
+                self.assertAlmostEqual(stack.oxide_layers[-1].thickness / um,
+                                       6)
+
+    def test_remove_adjacent_metal(self):
+        for name in ('M1', 'M2'):
+            stack = build_adjacent_stack()
+            stack.standardize()
+            stack.simplify()
+            stack.remove_metal_layer_by_name(name)
+            stack.validate()
+            expected = build_adjacent_stack()
+            expected.remove_metal_layer_by_name(name)
+            expected.simplify()
+            self.assertSameStack(stack, expected)
+
+    def test_remove_adjacent_metal_standardized(self):
+        stack = build_adjacent_stack()
+        stack.standardize()
+        stack.remove_metal_layer_by_name('M1')
+        stack.validate()
+        self.assertEqual([metal_layer.name
+                          for metal_layer in stack.metal_layers],
+                         ['M2', 'M3'])
+        self.assertTrue(stack.get_metal_layer_by_name('M2')
+                        .bottom_interface.metal is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()
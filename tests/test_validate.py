@@ -0,0 +1,77 @@
+import sys
+import unittest
+
+from helpers import build_example_stack, quiet
+from substratestack import um, A, kA, Ohm_cm, SubstrateStack, StackValidationError
+from substratestack import BulkLayer, OxideLayer, MetalLayer, Via, UP, DOWN
+
+
+class ValidateTest(unittest.TestCase):
+    def assertInvalid(self, stack, problem):
+        try:
+            stack.validate()
+        except StackValidationError:
+            error = str(sys.exc_info()[1])
+            self.assertTrue(problem in error, error)
+        else:
+            self.fail('no problems found')
+
+    def test_valid(self):
+        stack = build_example_stack()
+        stack.validate()
+        stack.simplify()
+        stack.validate()
+        stack.freeze().validate()
+        stack.remove_metal_layer_by_name('ME3')
+        stack.validate()
+
+    def test_links(self):
+        stack = build_example_stack()
+        stack.oxide_layers[3].top_interface = stack.interfaces[2]
+        self.assertInvalid(stack, 'oxide layer 3 is not linked')
+        stack = build_example_stack()
+        stack.interfaces[4].metal = None
+        self.assertInvalid(stack, 'does not link back to metal ME2')
+        stack = build_example_stack()
+        stack.get_metal_layer_by_name('ME4').top_via = None
+        self.assertInvalid(stack, 'do not link back to via VI4')
+        stack = build_example_stack()
+        stack.vias.remove(stack.get_via_by_top_metal(
+            stack.get_metal_layer_by_name('ME2')))
+        self.assertInvalid(stack, 'which is not part of the stack')
+
+    def test_parameters(self):
+        stack = build_example_stack()
+        stack.oxide_layers[5].thickness = 0
+        self.assertInvalid(stack, 'oxide layer 5 has a non-positive')
+        stack = build_example_stack()
+        stack.get_metal_layer_by_name('ME1').name = 'ME2'
+        self.assertInvalid(stack, "metal name 'ME2' is used more than once")
+        stack = build_example_stack()
+        stack.get_metal_layer_by_name('ME6').thickness = 10 * um
+        self.assertInvalid(stack, 'metal ME6 extends beyond the oxide layers')
+
+    def test_via_height(self):
+        with quiet():
+            stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+        for thickness in (2 * um, 300 * A, 300 * A, 1 * um):
+            stack.add_oxide_layer_on_top(OxideLayer(thickness, 4))
+        stack.add_metal_layer(MetalLayer('M1', 600 * A, 0.02, UP), 1)
+        stack.add_metal_layer(MetalLayer('M2', 3 * kA, 0.02, UP), 3)
+        stack.add_metal_layer(MetalLayer('M3', 3 * kA, 0.02, DOWN), 4)
+        stack.add_via(Via('V2', 1.0, 0.2 * um), 'M2', 'M3')
+        stack.validate()
+        # the top of M1 and the bottom of M2 coincide (up to rounding)
+        stack.add_via(Via('V1', 1.0, 0.2 * um), 'M1', 'M2')
+        self.assertInvalid(stack, 'via V1 has a non-positive height')
+
+    def test_frozen(self):
+        stack = build_example_stack()
+        stack.oxide_layers[5].thickness = 0
+        frozen = stack.freeze()
+        self.assertRaises(StackValidationError, frozen.validate)
+        self.assertRaises(StackValidationError, frozen.get_momentum_substrate)
+
+
+if __name__ == '__main__':
+    unittest.main()
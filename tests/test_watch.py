@@ -0,0 +1,200 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from helpers import quiet
+from substratestack import cli, watch
+
+
+DEFINITION = """
+from substratestack import *
+from layers import EPSILON
+stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+for i in range(10):
+    stack.add_oxide_layer_on_top(OxideLayer(1 * um, EPSILON))
+"""
+
+METAL_DEFINITION = """
+from substratestack import *
+from layers import EPSILON
+stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+for i in range(10):
+    stack.add_oxide_layer_on_top(OxideLayer(1 * um, EPSILON))
+stack.add_metal_layer(MetalLayer('M1', 0.5 * um, 0.02, UP), 3)
+other = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+for i in range(10):
+    other.add_oxide_layer_on_top(OxideLayer(1 * um, 3))
+other.add_metal_layer(MetalLayer('M1', 0.5 * um, 0.02, UP), 3)
+"""
+
+OTHER_DEFINITION = """
+from substratestack import *
+stack = SubstrateStack(BulkLayer(300 * um, 11.9, 20 * Ohm_cm))
+stack.add_oxide_layer_on_top(OxideLayer(1 * um, 4))
+"""
+
+
+class ScriptedMonitor(object):
+    """Monitor reporting a list of changes; each change is a function that
+    modifies files and returns the set of changed files"""
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.files = None
+
+    def set_files(self, filenames):
+        self.files = set(filenames)
+
+    def wait(self, timeout=None):
+        if timeout is not None:
+            return set()
+        if not self.changes:
+            raise KeyboardInterrupt
+        return self.changes.pop(0)()
+
+    def close(self):
+        pass
+
+
+class MonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'stack.py')
+        self.write(self.filename, 'first')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, contents):
+        file = open(filename, 'w')
+        file.write(contents)
+        file.close()
+
+    def check_monitor(self, monitor):
+        try:
+            monitor.set_files([self.filename])
+            self.assertEqual(monitor.wait(0.05), set())
+            self.write(self.filename, 'second version')
+            self.assertEqual(monitor.wait(1), set([self.filename]))
+            # editors often replace the file instead of overwriting it
+            replacement = os.path.join(self.directory, 'stack.py.new')
+            self.write(replacement, 'third, replaced version')
+            os.rename(replacement, self.filename)
+            self.assertEqual(monitor.wait(1), set([self.filename]))
+        finally:
+            monitor.close()
+
+    def test_polling_monitor(self):
+        self.check_monitor(watch.PollingMonitor())
+
+    @unittest.skipIf(not sys.platform.startswith('linux'), 'requires Linux')
+    def test_inotify_monitor(self):
+        self.check_monitor(watch.InotifyMonitor())
+
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.first = os.path.join(self.directory, 'first.py')
+        self.second = os.path.join(self.directory, 'second.py')
+        self.layers = os.path.join(self.directory, 'layers.py')
+        self.write(self.first, DEFINITION)
+        self.write(self.second, OTHER_DEFINITION)
+        self.write(self.layers, 'EPSILON = 4\n')
+        # the imported definition is rewritten within the same second
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+        self.get_monitor = watch.get_monitor
+
+    def tearDown(self):
+        watch.get_monitor = self.get_monitor
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, contents):
+        file = open(filename, 'w')
+        file.write(contents)
+        file.close()
+
+    def get_keys(self):
+        cache = cli.read_cache(self.directory)
+        return dict((os.path.basename(target), entry['key'])
+                    for target, entry in cache.items())
+
+    def run_watch(self, monitor):
+        watch.get_monitor = lambda polling: monitor
+        with quiet():
+            return cli.main(['--watch', self.first, self.second])
+
+    def test_reexport_affected_definitions(self):
+        keys = []
+
+        def change_imported_definition():
+            keys.append(self.get_keys())
+            self.write(self.layers, 'EPSILON = 5\n')
+            return set([self.layers])
+
+        monitor = ScriptedMonitor([change_imported_definition])
+        self.assertEqual(self.run_watch(monitor), 0)
+        self.assertEqual(monitor.files,
+                         set([self.first, self.second, self.layers]))
+        before, after = keys[0], self.get_keys()
+        self.assertEqual(sorted(before), ['first.slm', 'first.son',
+                                          'second.slm', 'second.son'])
+        for target in ('first.slm', 'first.son'):
+            self.assertNotEqual(after[target], before[target])
+        for target in ('second.slm', 'second.son'):
+            self.assertEqual(after[target], before[target])
+
+    def test_reuse_frozen_stacks(self):
+        self.write(self.first, METAL_DEFINITION)
+        options, patterns = cli.get_parser().parse_args(['--force'])
+        options.formats = cli.get_formats(options.formats)
+        frozen_stacks = {}
+
+        def convert():
+            with quiet():
+                result = cli.convert((self.first, options, {}), frozen_stacks)
+            self.assertEqual(result[2], [])
+            return dict((digest, (frozen, frozen.get_standard_stack()))
+                        for digest, frozen in frozen_stacks.items())
+
+        first = convert()
+        self.assertEqual(len(first), 2)
+        # the snapshots and their standardized versions are reused
+        self.assertEqual(convert(), first)
+        self.write(self.layers, 'EPSILON = 5\n')
+        second = convert()
+        self.assertEqual(len(second), 2)
+        unchanged = set(first).intersection(second)
+        self.assertEqual(len(unchanged), 1)
+        digest = unchanged.pop()
+        self.assertTrue(second[digest][0] is first[digest][0])
+        self.assertTrue(second[digest][1] is first[digest][1])
+
+    def test_keep_watching_broken_definition(self):
+        keys = []
+
+        def break_definition():
+            keys.append(self.get_keys())
+            self.write(self.first, 'raise ValueError\n')
+            return set([self.first])
+
+        def fix_imported_definition():
+            # layers.py is still watched, though first.py no longer imports it
+            self.assertTrue(self.layers in monitor.files)
+            self.write(self.first, DEFINITION)
+            self.write(self.layers, 'EPSILON = 6\n')
+            return set([self.first, self.layers])
+
+        monitor = ScriptedMonitor([break_definition, fix_imported_definition])
+        self.run_watch(monitor)
+        self.assertEqual(monitor.changes, [])
+        before, after = keys[0], self.get_keys()
+        self.assertNotEqual(after['first.slm'], before['first.slm'])
+        self.assertEqual(after['second.slm'], before['second.slm'])
+
+
+if __name__ == '__main__':
+    unittest.main()